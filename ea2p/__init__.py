@@ -1 +1,11 @@
-from ea2p.src import *
+from ea2p import src
+
+__all__ = src.__all__
+
+
+def __getattr__(name):
+    return getattr(src, name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
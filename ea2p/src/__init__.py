@@ -1,8 +1,28 @@
-from .power_meter import PowerMeter
-from .power_meter_mpi import PowerMeterMPI
+import importlib
 
-__all__ = [
-    "PowerMeter", "PowerMeterMPI"
-]
+# Public names and their modules. They are imported on first use, so that importing the package (e.g. for the
+# `ea2p` command line) does not load pandas, mpi4py and the device backends until they are needed.
+_EXPORTS = {
+    "PowerMeter": ".power_meter",
+    "PowerMeterMPI": ".power_meter_mpi",
+    "SQLiteResultStore": ".sqlite_store",
+    "read_timeline": ".export",
+    "write_timeline": ".export",
+    "recover_trace": ".trace",
+    "EnergyTracker": ".callbacks",
+    "keras_callback": ".callbacks",
+}
 
+__all__ = list(_EXPORTS)
 
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
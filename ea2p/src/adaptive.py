@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Adaptive sampling interval: the sampler reads the devices faster while their power changes, and backs off
+during steady plateaus.
+"""
+__all__ = ["AdaptiveInterval"]
+
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from .timeline import COUNTER
+
+LOGGER = logging.getLogger(__name__)
+
+MIN_REFERENCE_POWER = 1.0       # Watt, so that relative changes of nearly idle sensors are not amplified
+
+
+class AdaptiveInterval:
+    """
+    AdaptiveInterval
+    ---------
+
+    Listener of the samples of a PowerWrapper choosing the interval of the next tick of its sampling loop.
+
+    The activity of every sensor read as instantaneous power (GPU, RAM) is measured at each sample: the change of its
+    power since the previous sample and the standard deviation of its last `window` samples, both relative to its mean
+    power. When the activity of a sensor is above `threshold`, the interval is halved, down to `min_interval`. After
+    `window` calm ticks in a row, it grows by `backoff` at every calm tick, up to `max_interval`.
+
+    Energy counters (RAPL) do not drive the rate: they are exact whatever the rate, and the power derived from them
+    over short intervals is dominated by the granularity of their updates. Changing the interval does not bias the
+    reports either, power readings being integrated over the actual time between two samples.
+
+    Attributes:
+        interval (float): Interval of the next tick in seconds.
+        base_interval (float): Interval at the start of the sampler in seconds (the "sampling_freq" configuration entry).
+        min_interval (float): Shortest interval in seconds.
+        max_interval (float): Longest interval in seconds.
+        threshold (float): Relative activity above which the rate is raised.
+        window (int): Number of samples of the variance, and of calm ticks before backing off.
+        backoff (float): Growth factor of the interval during plateaus.
+    """
+
+    def __init__(self, interval, min_interval=None, max_interval=None, threshold=0.1, window=8, backoff=1.25):
+        """
+        Initialize the AdaptiveInterval instance.
+
+        Parameters:
+            interval (float): Interval at the start of the sampler in seconds.
+            min_interval (float): Shortest interval in seconds, a tenth of `interval` by default.
+            max_interval (float): Longest interval in seconds, four times `interval` by default.
+            threshold (float): Relative change or coefficient of variation of the power of a sensor raising the rate.
+            window (int): Number of samples of the variance, and of calm ticks before backing off.
+            backoff (float): Growth factor of the interval during plateaus.
+        """
+        self.base_interval = interval
+        self.min_interval = min_interval if min_interval is not None else interval / 10
+        self.max_interval = max_interval if max_interval is not None else interval * 4
+        if not 0 < self.min_interval <= self.max_interval:
+            raise ValueError("Invalid adaptive sampling bounds: %s to %s s" % (self.min_interval, self.max_interval))
+        self.threshold = threshold
+        self.window = window
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the samples and restart from the base interval.
+        """
+        with self.lock:
+            self.interval = min(max(self.base_interval, self.min_interval), self.max_interval)
+            self.last = {}
+            self.history = {}
+            self.activity = 0.0
+            self.calm = 0
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Update the activity of the sensors with the readings of one device.
+        """
+        if kind == COUNTER:
+            return
+        with self.lock:
+            for sensor, value in values.items():
+                power = value
+                history = self.history.get(sensor)
+                if history is None:
+                    history = self.history[sensor] = deque(maxlen=self.window)
+                if history:
+                    reference = max(abs(np.mean(history)), MIN_REFERENCE_POWER)
+                    activity = abs(power - history[-1]) / reference
+                    if len(history) > 2:
+                        activity = max(activity, np.std(history) / reference)
+                    self.activity = max(self.activity, activity)
+                history.append(power)
+
+    def next_interval(self):
+        """
+        Choose the interval of the next tick from the activity seen since the previous call, and reset the activity.
+
+        Returns:
+            Interval in seconds.
+        """
+        with self.lock:
+            activity, self.activity = self.activity, 0.0
+            if activity > self.threshold:
+                self.calm = 0
+                self.interval = max(self.interval / 2, self.min_interval)
+            else:
+                self.calm += 1
+                if self.calm >= self.window:
+                    self.interval = min(self.interval * self.backoff, self.max_interval)
+            return self.interval
+
+    def __repr__(self):
+        return "AdaptiveInterval(%.4f s in [%.4f, %.4f] s)" % (self.interval, self.min_interval, self.max_interval)
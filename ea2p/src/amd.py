@@ -13,18 +13,27 @@ import re
 import pandas as pd
 import os 
 import numpy as np
+import time
 
 from .utils import SAMPLING_FREQUENCY
 
 LOGGER = logging.getLogger(__name__)
 
 AMDPOWERLOG_FILENAME = "amdPowerLog.txt"
+PERF_SEPARATOR = ";"
+PERF_MIN_INTERVAL_MS = 10     # shortest interval of perf stat
 
 
 class PowerAmdCpu():
-    
-    def __init__(self):
+    """
+    Read the AMD CPU package energy with `perf stat`, which prints the energy of every NUMA node at every interval,
+    so that the log can be queried over any time window of the measurement (e.g. the window of a region).
+    """
+
+    def __init__(self, interval=1.0):
         self.logging_process = None
+        self.interval = interval
+        self.start_time = None
 
     def start(self):
         """
@@ -33,6 +42,7 @@ class PowerAmdCpu():
         if self.logging_process is not None:
             self.stop()
 
+        self.start_time = time.time()
         self.logging_process = subprocess.Popen(
             [
                 "perf",
@@ -41,6 +51,10 @@ class PowerAmdCpu():
                 "power/energy-pkg/",
                 "-a",
                 "--per-node",
+                "-I",
+                str(max(int(self.interval * 1000), PERF_MIN_INTERVAL_MS)),
+                "-x",
+                PERF_SEPARATOR,
                 "-o",
                 str(AMDPOWERLOG_FILENAME),
             ]
@@ -48,33 +62,65 @@ class PowerAmdCpu():
 
     def stop(self):
         """
-        Stop the measure process if started. A signal is send to the logging process to stop measurements
+        Stop the measure process if started. A signal is send to the logging process to stop measurements,
+        and the process is waited for so that its log is complete.
         """
+        if self.logging_process is None:
+            return
         self.logging_process.send_signal(signal.SIGINT)
+        try:
+            self.logging_process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            LOGGER.warning("perf stat did not stop within 5 s, the AMD CPU energy may be incomplete")
         self.logging_process = None
 
-    def parse_log(self):
+    def read_intervals(self):
         """
-        Parse the AMD CPU power log file to energy values per package and per nodes.
+        Read the energy of every node at every interval from the perf log.
+
         Returns:
-        	DataFrame containing energy data.
+        	List of (start, end, node, energy) tuples, times in seconds since the epoch and energy in Joules.
         """
         with open(r"%s" % AMDPOWERLOG_FILENAME, 'r') as fp:
-            data = fp.read()
-        data = data.replace(",", ".")
-        p = re.compile(r'([\d]+.+[\d.]+)\s+Joules power/energy-pkg/')
-        data = p.findall(data)
-        data = [d.replace(" ", "") for d in data]
-        for i in range(len(data)):
-            # Count the total number of periods
-            total_periods = data[i].count('.')
-            # If there are more than one periods, replace all but the last one
-            if total_periods > 1:
-                # Remove all periods except the last one
-                data[i] = data[i].replace('.', '', total_periods - 1)
-        cols = ["package " + str(i) for i in range(len(data))]
-        energy = pd.DataFrame(np.array([data]), columns=cols)
-        energy = energy.astype("float32")
+            lines = fp.readlines()
+        intervals = []
+        previous = {}
+        for line in lines:
+            fields = line.strip().split(PERF_SEPARATOR)
+            if len(fields) < 6 or "energy-pkg" not in fields[5]:
+                continue
+            try:
+                # perf prints decimal commas in some locales
+                elapsed = float(fields[0].replace(",", "."))
+                energy = float(fields[3].replace(",", "."))
+            except ValueError:
+                continue        # <not counted> or <not supported>
+            node = fields[1].lstrip("N")
+            end = self.start_time + elapsed
+            intervals.append((previous.get(node, self.start_time), end, node, energy))
+            previous[node] = end
+        return intervals
+
+    def parse_log(self, start=None, end=None):
+        """
+        Parse the AMD CPU power log file to energy values per package and per nodes. The energy of the intervals
+        partly in the time window is prorated to their overlap with it.
+
+        Parameters:
+        	start (float): Start of the window in seconds since the epoch, the start of the log by default.
+        	end (float): End of the window in seconds since the epoch, the end of the log by default.
+        Returns:
+        	DataFrame containing energy data in Watt-hour.
+        """
+        energies = {}
+        for interval_start, interval_end, node, energy in self.read_intervals():
+            column = "package " + node
+            energies.setdefault(column, 0.0)
+            window_start = interval_start if start is None else max(start, interval_start)
+            window_end = interval_end if end is None else min(end, interval_end)
+            if window_end > window_start and interval_end > interval_start:
+                energies[column] += energy * (window_end - window_start) / (interval_end - interval_start)
+        energy = pd.DataFrame(energies, index=[0]).astype("float32")
         energy = energy / 3600
         return energy
 
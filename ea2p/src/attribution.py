@@ -0,0 +1,527 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Attribution of the node-wide RAPL and GPU energy to processes and cgroups on shared nodes.
+"""
+__all__ = [
+    "EnergyAttribution", "ProcessCpuAttribution", "CgroupAttribution", "GpuProcessAttribution",
+    "read_busy_time", "read_used_memory",
+]
+
+import bisect
+import logging
+import os
+from collections import deque
+from pathlib import Path
+
+import psutil  # type: ignore
+
+from .timeline import COUNTER, POWER
+
+LOGGER = logging.getLogger(__name__)
+
+PROC_ROOT = Path("/proc")
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+# /proc/stat cpu columns counted as busy: user, nice, system, irq, softirq, steal (guest time is already in user)
+BUSY_COLUMNS = (0, 1, 2, 5, 6, 7)
+# RAPL domains driven by memory traffic rather than CPU time
+MEMORY_DOMAINS = ("dram", "memory")
+DEFAULT_HISTORY = 100000        # usage snapshots kept to compute the shares of recent time windows
+
+
+def read_busy_time(proc_root=PROC_ROOT):
+    """
+    Read the total busy CPU time of the node from /proc/stat.
+
+    Parameters:
+        proc_root (str): Root of the proc filesystem (configurable to test against a fake tree).
+    Returns:
+        Busy CPU time summed over every CPU, in seconds.
+    """
+    with open(Path(proc_root) / "stat", "r") as fp:
+        fields = fp.readline().split()
+    ticks = [int(value) for value in fields[1:]]
+    return sum(ticks[column] for column in BUSY_COLUMNS if column < len(ticks)) / os.sysconf("SC_CLK_TCK")
+
+
+def read_used_memory(proc_root=PROC_ROOT):
+    """
+    Read the memory in use on the node from /proc/meminfo (MemTotal - MemAvailable).
+
+    Parameters:
+        proc_root (str): Root of the proc filesystem.
+    Returns:
+        Used memory in bytes.
+    """
+    meminfo = {}
+    with open(Path(proc_root) / "meminfo", "r") as fp:
+        for line in fp:
+            name, value = line.split(":", 1)
+            meminfo[name] = int(value.split()[0]) * 1024
+    return meminfo["MemTotal"] - meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+
+
+def process_tree(pid, include_children=True):
+    """
+    Get the identifiers of a process and of its living descendants.
+    """
+    try:
+        process = psutil.Process(pid)
+        children = process.children(recursive=True) if include_children else []
+    except psutil.NoSuchProcess:
+        return {pid}
+    return {pid} | {child.pid for child in children}
+
+
+def is_cpu_domain(sensor):
+    """
+    Returns:
+        True if a RAPL sensor measures CPU (package, core, uncore) energy rather than DRAM energy.
+    """
+    return not any(domain in sensor.lower() for domain in MEMORY_DOMAINS)
+
+
+class UsageHistory:
+    """
+    UsageHistory
+    ---------
+
+    Cumulative usage totals of an attribution at every sample, so that its shares can be computed over any recent
+    time window (e.g. the one of a region) rather than only since the start of the measurement.
+
+    Attributes:
+        times (deque): Time of every snapshot in seconds since the epoch.
+        totals (deque): Dictionary of cumulative totals of every snapshot.
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY):
+        self.times = deque(maxlen=capacity)
+        self.totals = deque(maxlen=capacity)
+
+    def clear(self):
+        self.times.clear()
+        self.totals.clear()
+
+    def append(self, timestamp, totals):
+        self.times.append(timestamp)
+        self.totals.append(dict(totals))
+
+    def delta(self, start=None, end=None):
+        """
+        Get the growth of every total over a time window, from the last snapshot before its start to the last
+        snapshot before its end.
+
+        Returns:
+            Dictionary mapping the totals to their growth, None when no snapshot covers the window.
+        """
+        if not self.times:
+            return None
+        first = 0 if start is None else max(bisect.bisect_right(self.times, start) - 1, 0)
+        last = len(self.times) - 1 if end is None else bisect.bisect_right(self.times, end) - 1
+        if last < first:
+            return None
+        before, after = ({} if start is None else self.totals[first]), self.totals[last]
+        return {name: value - before.get(name, 0.0) for name, value in after.items()}
+
+
+class EnergyAttribution:
+    """
+    EnergyAttribution
+    ---------
+
+    Base class of the listeners apportioning the RAPL energy counters to consumers (processes, cgroups).
+
+    At every RAPL sample, subclasses read the usage of each consumer (`read_usage`) and turn two consecutive
+    readings into the CPU and memory shares of each consumer over the interval (`interval_shares`). The energy of
+    the interval is charged by CPU share for CPU domains (package, core, uncore) and by memory share for DRAM
+    domains. The attributed energy is recorded in the sample store as extra counters named "<sensor> (<consumer>)",
+    so it appears in reports, windows and timelines next to the node totals.
+
+    Attributes:
+        samples (SampleStore): Store receiving the attributed energy counters.
+        proc_root (Path): Root of the proc filesystem.
+        history (UsageHistory): Cumulative usage of the consumers at every sample, for the shares of time windows.
+    """
+
+    def __init__(self, samples, proc_root=PROC_ROOT):
+        """
+        Initialize the EnergyAttribution instance.
+
+        Parameters:
+            samples (SampleStore): Store receiving the attributed energy counters.
+            proc_root (str): Root of the proc filesystem.
+        """
+        self.samples = samples
+        self.proc_root = Path(proc_root)
+        self.history = UsageHistory()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the previous readings, at the start of a measurement.
+        """
+        self.previous = None
+        self.attributed = {}
+        self.history.clear()
+
+    def read_usage(self):
+        """
+        Read the usage of every consumer at the current time.
+        """
+        raise NotImplementedError
+
+    def interval_shares(self, previous, current):
+        """
+        Compute the shares of every consumer between two usage readings.
+
+        Returns:
+            Dictionary mapping consumer names to (cpu share, memory share) tuples, a None share not being charged.
+        """
+        raise NotImplementedError
+
+    def usage_totals(self):
+        """
+        Returns:
+            Dictionary of the cumulative usage totals reported as shares, recorded in `history` at every sample.
+        """
+        return {}
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Charge the energy of the last interval to the consumers, for every RAPL sample.
+        """
+        if kind != COUNTER:
+            return
+        usage = self.read_usage()
+
+        # the first sample starts every attributed counter at 0, so that the first interval is counted
+        previous_usage, previous_values = self.previous if self.previous is not None else (usage, values)
+        for consumer, (cpu_share, memory_share) in self.interval_shares(previous_usage, usage).items():
+            for sensor, value in values.items():
+                share = cpu_share if is_cpu_domain(sensor) else memory_share
+                if share is None:
+                    continue
+                key = sensor + " (" + consumer + ")"
+                self.attributed.setdefault(key, 0.0)
+                delta = value - previous_values.get(sensor, value)
+                if delta > 0:
+                    self.attributed[key] += delta * share
+
+        self.previous = (usage, dict(values))
+        self.history.append(timestamp, self.usage_totals())
+        if self.attributed:
+            self.samples.append(timestamp, dict(self.attributed), kind=COUNTER, device="cpu")
+
+    def report(self, start=None, end=None):
+        """
+        Parameters:
+            start (float): Start of the reported window in seconds since the epoch, the last reset by default.
+            end (float): End of the reported window in seconds since the epoch, the last sample by default.
+        Returns:
+            Dictionary of the extra report columns.
+        """
+        return {}
+
+
+class ProcessCpuAttribution(EnergyAttribution):
+    """
+    ProcessCpuAttribution
+    ---------
+
+    Apportion the CPU energy counters (RAPL package, core, uncore) to a process tree by CPU-time share.
+
+    At every RAPL sample, the CPU time of the process and of its children is read next to the busy time of the
+    whole node (/proc/stat). The energy of each interval is charged to the process in proportion to its share
+    of the busy time, and recorded as "<sensor> (process)" counters.
+
+    Attributes:
+        pid (int): Identifier of the measured process.
+        include_children (bool): Whether the CPU time of the descendants is charged to the process.
+        process_time (float): CPU time of the process tree since the last reset, in seconds.
+        busy_time (float): Busy time of the node since the last reset, in seconds.
+    """
+
+    CONSUMER = "process"
+
+    def __init__(self, samples, pid=None, include_children=True, proc_root=PROC_ROOT):
+        """
+        Initialize the ProcessCpuAttribution instance.
+
+        Parameters:
+            samples (SampleStore): Store receiving the attributed energy counters.
+            pid (int): Identifier of the measured process, the current process by default.
+            include_children (bool): Charge the CPU time of the descendants to the process.
+            proc_root (str): Root of the proc filesystem.
+        """
+        self.pid = pid or os.getpid()
+        self.include_children = include_children
+        self.process = psutil.Process(self.pid)
+        super().__init__(samples, proc_root)
+
+    def reset(self):
+        super().reset()
+        self.process_time = 0.0
+        self.busy_time = 0.0
+
+    def cpu_time(self):
+        """
+        Read the CPU time of the process tree.
+
+        Returns:
+            User and system CPU time of the process (and of its children, reaped or alive), in seconds.
+        """
+        try:
+            times = self.process.cpu_times()
+        except psutil.NoSuchProcess:
+            return self.previous[0][0] if self.previous else 0.0
+        total = times.user + times.system
+        if self.include_children:
+            total += times.children_user + times.children_system
+            for child in self.process.children(recursive=True):
+                try:
+                    child_times = child.cpu_times()
+                    total += child_times.user + child_times.system
+                except psutil.NoSuchProcess:
+                    pass
+        return total
+
+    def read_usage(self):
+        return self.cpu_time(), read_busy_time(self.proc_root)
+
+    def interval_shares(self, previous, current):
+        process_delta = max(current[0] - previous[0], 0.0)
+        busy_delta = max(current[1] - previous[1], 0.0)
+        self.process_time += process_delta
+        self.busy_time += busy_delta
+        share = min(process_delta / busy_delta, 1.0) if busy_delta > 0 else 0.0
+        return {self.CONSUMER: (share, None)}
+
+    def usage_totals(self):
+        return {"process": self.process_time, "busy": self.busy_time}
+
+    def share(self, start=None, end=None):
+        """
+        Returns:
+            Share of the node busy time used by the process tree over a time window, since the last reset by default.
+        """
+        totals = self.history.delta(start, end) or {}
+        process_time, busy_time = totals.get("process", 0.0), totals.get("busy", 0.0)
+        return min(process_time / busy_time, 1.0) if busy_time > 0 else 0.0
+
+    def report(self, start=None, end=None):
+        return {"Process CPU share [%]": round(100 * self.share(start, end), 2)}
+
+
+class CgroupAttribution(EnergyAttribution):
+    """
+    CgroupAttribution
+    ---------
+
+    Apportion the RAPL energy counters to cgroup v2 groups (Slurm steps, containers) with a single sampler.
+
+    At every RAPL sample, `usage_usec` is read from the `cpu.stat` file of each cgroup and `memory.current`
+    from its memory controller. Package and core energy are charged by share of the node busy time (/proc/stat),
+    DRAM energy by share of the memory in use on the node (/proc/meminfo). Shares are scaled down when they add
+    up to more than the whole node. The energy of each cgroup is recorded as "<sensor> (<cgroup>)" counters.
+
+    Attributes:
+        cgroup_root (Path): Mount point of the cgroup v2 hierarchy.
+        cgroups (dict): Dictionary mapping cgroup names (paths relative to the root) to their directories.
+    """
+
+    def __init__(self, samples, cgroups, cgroup_root=CGROUP_ROOT, proc_root=PROC_ROOT):
+        """
+        Initialize the CgroupAttribution instance.
+
+        Parameters:
+            samples (SampleStore): Store receiving the attributed energy counters.
+            cgroups (list): Paths of the cgroups to charge, absolute or relative to the cgroup root.
+            cgroup_root (str): Mount point of the cgroup v2 hierarchy (configurable to test against a fake tree).
+            proc_root (str): Root of the proc filesystem.
+        """
+        self.cgroup_root = Path(cgroup_root)
+        self.cgroups = {}
+        for cgroup in cgroups:
+            path = Path(cgroup)
+            if self.cgroup_root not in path.parents:
+                # paths read from /proc/<pid>/cgroup are relative to the mount point
+                path = self.cgroup_root / str(cgroup).lstrip("/")
+            if not (path / "cpu.stat").exists():
+                raise ValueError("%s is not a cgroup v2 directory (no cpu.stat file)" % path)
+            self.cgroups[str(path.relative_to(self.cgroup_root))] = path
+        super().__init__(samples, proc_root)
+
+    def reset(self):
+        super().reset()
+        self.cgroup_times = {name: 0.0 for name in self.cgroups}
+        self.busy_time = 0.0
+
+    @staticmethod
+    def read_cpu_usage(path):
+        """
+        Read the CPU usage of a cgroup from its cpu.stat file.
+
+        Returns:
+            CPU time in seconds.
+        """
+        with open(path / "cpu.stat", "r") as fp:
+            for line in fp:
+                name, value = line.split()
+                if name == "usage_usec":
+                    return int(value) / 1e6
+        return 0.0
+
+    @staticmethod
+    def read_memory_usage(path):
+        """
+        Read the memory usage of a cgroup from its memory.current file.
+
+        Returns:
+            Memory in bytes, 0 when the memory controller is not enabled.
+        """
+        try:
+            return int((path / "memory.current").read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read_usage(self):
+        cgroups = {
+            name: (self.read_cpu_usage(path), self.read_memory_usage(path))
+            for name, path in self.cgroups.items()
+        }
+        return cgroups, read_busy_time(self.proc_root), read_used_memory(self.proc_root)
+
+    def interval_shares(self, previous, current):
+        previous_cgroups, previous_busy, previous_memory = previous
+        cgroups, busy, used_memory = current
+        busy_delta = max(busy - previous_busy, 0.0)
+        memory = (used_memory + previous_memory) / 2
+        self.busy_time += busy_delta
+
+        cpu_shares, memory_shares = {}, {}
+        for name, (cpu_time, memory_current) in cgroups.items():
+            cpu_delta = max(cpu_time - previous_cgroups[name][0], 0.0)
+            self.cgroup_times[name] += cpu_delta
+            cpu_shares[name] = cpu_delta / busy_delta if busy_delta > 0 else 0.0
+            memory_shares[name] = (memory_current + previous_cgroups[name][1]) / 2 / memory if memory > 0 else 0.0
+
+        for shares in (cpu_shares, memory_shares):
+            total = sum(shares.values())
+            if total > 1:
+                for name in shares:
+                    shares[name] /= total
+        return {name: (cpu_shares[name], memory_shares[name]) for name in cgroups}
+
+    def usage_totals(self):
+        return {"busy": self.busy_time, **self.cgroup_times}
+
+    def report(self, start=None, end=None):
+        totals = self.history.delta(start, end) or {}
+        busy_time = totals.get("busy", 0.0)
+        return {
+            "CPU share [%] (" + name + ")": round(100 * min(totals.get(name, 0.0) / busy_time, 1.0), 2) if busy_time > 0 else 0.0
+            for name in self.cgroups
+        }
+
+
+class GpuProcessAttribution:
+    """
+    GpuProcessAttribution
+    ---------
+
+    Split the energy of shared Nvidia GPUs (MPS or time-slicing) between the processes running on them.
+
+    At every GPU power sample, the SM utilization of each process since the previous sample is read with NVML.
+    The energy of the interval (the previous power reading held until this sample) is split between the processes
+    in proportion to their SM utilization; intervals without any process activity are left unattributed.
+    The share of the measured process tree is recorded as "<GPU> (process)" energy counters, and the energy of
+    every process is available from `process_energies`.
+
+    Attributes:
+        samples (SampleStore): Store receiving the attributed energy counters.
+        gpu (PowerNvidia): GPU backend reading the power and the per-process utilization.
+        pid (int): Identifier of the measured process.
+        include_children (bool): Whether the descendants of the process are charged to it.
+        history (UsageHistory): Attributed and total GPU energy at every sample, for the shares of time windows.
+    """
+
+    SUFFIX = " (process)"
+
+    def __init__(self, samples, gpu, pid=None, include_children=True):
+        """
+        Initialize the GpuProcessAttribution instance.
+
+        Parameters:
+            samples (SampleStore): Store receiving the attributed energy counters.
+            gpu (PowerNvidia): GPU backend providing `process_utilization`.
+            pid (int): Identifier of the measured process, the current process by default.
+            include_children (bool): Charge the descendants of the process to it.
+        """
+        self.samples = samples
+        self.gpu = gpu
+        self.pid = pid or os.getpid()
+        self.include_children = include_children
+        self.history = UsageHistory()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the previous readings, at the start of a measurement.
+        """
+        self.previous = {}
+        self.attributed = {}
+        self.gpu_energy = {}
+        self.by_pid = {}
+        self.history.clear()
+        self.gpu.process_utilization()
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Split the GPU energy of the last interval between the processes, for every GPU power sample.
+        """
+        if kind != POWER or device != "gpu":
+            return
+        utilization = self.gpu.process_utilization()
+        pids = process_tree(self.pid, self.include_children)
+
+        for sensor, power in values.items():
+            if sensor not in utilization:
+                continue
+            key = sensor + self.SUFFIX
+            self.attributed.setdefault(key, 0.0)
+            if sensor in self.previous:
+                previous_time, previous_power = self.previous[sensor]
+                energy = previous_power * (timestamp - previous_time) / 3600
+                self.gpu_energy[sensor] = self.gpu_energy.get(sensor, 0.0) + energy
+                total = sum(utilization[sensor].values())
+                for pid, sm_utilization in utilization[sensor].items():
+                    if total > 0:
+                        share = energy * sm_utilization / total
+                        self.by_pid[pid] = self.by_pid.get(pid, 0.0) + share
+                        if pid in pids:
+                            self.attributed[key] += share
+            self.previous[sensor] = (timestamp, power)
+
+        self.history.append(timestamp, {"process": sum(self.attributed.values()), "gpu": sum(self.gpu_energy.values())})
+        if self.attributed:
+            self.samples.append(timestamp, dict(self.attributed), kind=COUNTER, device="gpu")
+
+    def process_energies(self):
+        """
+        Returns:
+            Dictionary mapping process identifiers to their GPU energy since the last reset, in Watt-hour.
+        """
+        return dict(self.by_pid)
+
+    def report(self, start=None, end=None):
+        """
+        Parameters:
+            start (float): Start of the reported window in seconds since the epoch, the last reset by default.
+            end (float): End of the reported window in seconds since the epoch, the last sample by default.
+        Returns:
+            Dictionary of the extra report columns.
+        """
+        totals = self.history.delta(start, end) or {}
+        total = totals.get("gpu", 0.0)
+        share = totals.get("process", 0.0) / total if total > 0 else 0.0
+        return {"Process GPU share [%]": round(100 * share, 2)}
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Energy-aware autotuning of run parameters (thread counts, batch sizes, environment variables such as
+OMP_NUM_THREADS) with successive halving, on the shared sampler of a PowerMeter.
+"""
+__all__ = ["Autotuner", "TuneResult", "OBJECTIVES"]
+
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import statistics
+import subprocess
+from pathlib import Path
+
+import pandas as pd  # type: ignore
+
+from .metrics import ENERGY_UNITS, device_energies
+
+LOGGER = logging.getLogger(__name__)
+
+# Score of a candidate from the medians of its runs (energy in Joule, duration in seconds), lower is better
+OBJECTIVES = {
+    "energy": lambda energy, duration: energy,
+    "time": lambda energy, duration: duration,
+    "edp": lambda energy, duration: energy * duration,
+}
+# Exit status recorded for a callable job raising an exception
+JOB_FAILED = 1
+# "{name}" placeholders of the command arguments, other braces (JSON, shell ${VAR}) being left as they are
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def _key(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class TuneResult:
+    """
+    TuneResult
+    ---------
+
+    Runs and scores of the candidates of an autotuning.
+
+    Attributes:
+        runs (DataFrame): One row per run: parameters, round, duration, energy in Joule and exit status.
+        results (DataFrame): One row per candidate with the number of runs, the last round it reached, the median
+            duration, energy and EDP of its runs and its score, sorted from the best candidate.
+        best (dict): Parameters of the best candidate.
+    """
+
+    def __init__(self, runs, candidates):
+        """
+        Initialize the TuneResult instance.
+
+        Parameters:
+            runs (list): Runs as dictionaries with their "params".
+            candidates (list): Evaluated candidates as (parameters, score, last round) tuples.
+        """
+        self.runs = pd.DataFrame([dict(run["params"], **{k: v for k, v in run.items() if k != "params"}) for run in runs])
+        candidates = sorted(candidates, key=lambda candidate: (candidate[1], -candidate[2]))
+        self.best = candidates[0][0] if candidates else None
+        rows = []
+        for params, score, round_index in candidates:
+            candidate_runs = [run for run in runs if _key(run["params"]) == _key(params)]
+            duration = statistics.median(run["duration"] for run in candidate_runs)
+            energy = statistics.median(run["energy"] for run in candidate_runs)
+            row = dict(params)
+            row.update({
+                "Runs": len(candidate_runs),
+                "Round": round_index,
+                "Duration [s]": duration,
+                "Energy [J]": energy,
+                "EDP [J.s]": energy * duration,
+                "Score": score,
+            })
+            rows.append(row)
+        self.results = pd.DataFrame(rows).round(5)
+
+    def __repr__(self):
+        return repr(self.results)
+
+
+class Autotuner:
+    """
+    Autotuner
+    ---------
+
+    Search the parameters of a job with the best energy, time or EDP. The candidates of a grid (or a random sample
+    of it) are evaluated with successive halving: every candidate runs a few times, the best fraction `1 / eta` is
+    kept and runs `eta` times more, and so on until one candidate is left. Each run is a region of the PowerMeter,
+    all of them on one shared sampler.
+
+    The job is a callable receiving the parameters as keyword arguments, or a command given as a list of arguments,
+    run without a shell. Placeholders such as "{batch_size}" in the arguments are replaced by the parameters (braces
+    not naming a parameter are kept), and the parameters whose name is upper case (e.g. OMP_NUM_THREADS) are also set
+    in the environment of the command.
+
+    Runs are appended to `state_file` as they complete, so that an interrupted tuning resumes where it stopped.
+    A failed run (nonzero exit status, or an exception of a callable job) is recorded too, and its candidate is
+    scored infinite.
+
+    Attributes:
+        meter (PowerMeter): PowerMeter measuring the runs.
+        space (dict): Dictionary mapping the parameter names to the list of their values.
+        objective (str): Objective to minimize among "energy", "time" and "edp".
+        time_limit (float): Candidates whose median duration is above this limit in seconds are discarded.
+        eta (int): Reduction factor of the successive halving.
+        min_repeats (int): Number of runs of every candidate in the first round.
+        state_file (Path): JSON file of the completed runs.
+        runs (list): Completed runs.
+    """
+
+    def __init__(self, meter, space, objective="energy", time_limit=None, eta=2, min_repeats=1, max_candidates=None,
+                 seed=None, state_file=None, package="autotune", algorithm="job"):
+        """
+        Initialize the Autotuner instance.
+
+        Parameters:
+            meter (PowerMeter): PowerMeter measuring the runs.
+            space (dict): Dictionary mapping the parameter names to the list of their values.
+            objective (str): Objective to minimize among "energy", "time" and "edp" (energy-delay product).
+            time_limit (float): Maximum median duration of a candidate in seconds, e.g. to minimize energy under a deadline.
+            eta (int): Reduction factor of the successive halving.
+            min_repeats (int): Number of runs of every candidate in the first round.
+            max_candidates (int): Evaluate a random sample of this many candidates of the grid, all of them by default.
+            seed (int): Seed of the random sample of candidates.
+            state_file (str): JSON file of the completed runs, to resume an interrupted tuning.
+            package (str): Package name of the recorded regions.
+            algorithm (str): Name of the recorded regions.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError("Unknown objective %r, expected one of %s" % (objective, ", ".join(OBJECTIVES)))
+        self.meter = meter
+        self.space = space
+        self.objective = objective
+        self.time_limit = time_limit
+        self.eta = eta
+        self.min_repeats = min_repeats
+        self.package = package
+        self.algorithm = algorithm
+        names = list(space)
+        self.candidates = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+        if max_candidates is not None and max_candidates < len(self.candidates):
+            self.candidates = random.Random(seed).sample(self.candidates, max_candidates)
+        self.state_file = Path(state_file) if state_file is not None else None
+        self.runs = self.__load()
+
+    def __load(self):
+        """
+        Load the runs of an interrupted tuning of the same space and objective.
+        """
+        if self.state_file is None or not self.state_file.exists():
+            return []
+        state = json.loads(self.state_file.read_text())
+        if state.get("space") != json.loads(_key(self.space)):
+            LOGGER.warning("The tuning state %s was recorded for another parameter space, it is ignored", self.state_file)
+            return []
+        LOGGER.info("Resuming the tuning from %d runs recorded in %s", len(state["runs"]), self.state_file)
+        return state["runs"]
+
+    def __save(self):
+        """
+        Write the completed runs to the state file.
+        """
+        if self.state_file is None:
+            return
+        state = {"space": json.loads(_key(self.space)), "objective": self.objective, "runs": self.runs}
+        temporary = self.state_file.with_name(self.state_file.name + ".tmp")
+        temporary.write_text(json.dumps(state, indent=1, default=str))
+        os.replace(temporary, self.state_file)
+
+    def __call_job(self, job, params):
+        """
+        Run the job once with a set of parameters.
+
+        Returns:
+            Exit status of the command, 0 for a callable that returned and JOB_FAILED for one that raised.
+        """
+        if callable(job):
+            try:
+                job(**params)
+            except Exception:
+                LOGGER.exception("Run of %s failed", _key(params))
+                return JOB_FAILED
+            return 0
+        substitute = lambda match: str(params[match.group(1)]) if match.group(1) in params else match.group(0)
+        args = [PLACEHOLDER.sub(substitute, str(arg)) for arg in job]
+        env = dict(os.environ)
+        env.update({name: str(value) for name, value in params.items() if name.isupper()})
+        return subprocess.run(args, env=env, check=False).returncode
+
+    def __measure(self, job, params, round_index):
+        """
+        Run and measure the job once, and record the run.
+        """
+        joules = ENERGY_UNITS.get(str(self.meter.power.energy_unit).lower(), ENERGY_UNITS["wh"])[1]
+        with self.meter.region(self.package, self.algorithm, _key(params)) as region:
+            status = self.__call_job(job, params)
+        energy = sum(device_energies(region.record, self.meter.power.sensor_devices).values()) * joules
+        run = {"params": params, "round": round_index, "duration": region.end_time - region.start_time,
+               "energy": energy, "status": status}
+        self.runs.append(run)
+        self.__save()
+        LOGGER.info("Run of %s: %.3f s, %.3f J, status %s", _key(params), run["duration"], energy, status)
+        return run
+
+    def score(self, params):
+        """
+        Score a candidate from the medians of its completed runs.
+
+        Returns:
+            The objective, infinite for a candidate that failed, exceeded the time limit or has no run.
+        """
+        runs = [run for run in self.runs if _key(run["params"]) == _key(params)]
+        if not runs or any(run["status"] != 0 for run in runs):
+            return math.inf
+        duration = statistics.median(run["duration"] for run in runs)
+        if self.time_limit is not None and duration > self.time_limit:
+            return math.inf
+        return OBJECTIVES[self.objective](statistics.median(run["energy"] for run in runs), duration)
+
+    def tune(self, job):
+        """
+        Search the best parameters of a job.
+
+        Parameters:
+            job (callable or list): Callable receiving the parameters as keyword arguments, or command line arguments.
+        Returns:
+            TuneResult.
+        """
+        candidates = list(self.candidates)
+        rounds = {}
+        repeats = self.min_repeats
+        round_index = 0
+        with self.meter.region(self.package, self.algorithm, "autotuning of %s" % ", ".join(self.space)):
+            while candidates:
+                for params in candidates:
+                    rounds[_key(params)] = round_index
+                    done = sum(1 for run in self.runs if _key(run["params"]) == _key(params))
+                    for _ in range(done, repeats):
+                        self.__measure(job, params, round_index)
+                if len(candidates) == 1:
+                    break
+                candidates.sort(key=self.score)
+                keep = max(1, len(candidates) // self.eta)
+                candidates = [params for params in candidates[:keep] if self.score(params) != math.inf] or candidates[:1]
+                repeats *= self.eta
+                round_index += 1
+
+        evaluated = [(params, self.score(params), rounds[_key(params)]) for params in self.candidates if _key(params) in rounds]
+        return TuneResult([run for run in self.runs if _key(run["params"]) in rounds], evaluated)
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Statistical benchmarks of the energy and time of functions: warmup runs, repetitions on one shared sampler,
+robust statistics (median, IQR, bootstrap confidence intervals) and outlier detection.
+"""
+__all__ = ["BenchmarkResult", "run_benchmark", "summarize"]
+
+import logging
+import random
+import time
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from .metrics import ENERGY_UNITS, device_energies
+
+LOGGER = logging.getLogger(__name__)
+
+DURATION_COLUMN = "Duration [s]"
+# Tukey fences: runs further than OUTLIER_FENCE interquartile ranges from the quartiles are outliers
+OUTLIER_FENCE = 1.5
+
+
+def summarize(values, confidence=0.95, resamples=1000, seed=None):
+    """
+    Compute robust statistics of the values of repeated runs.
+
+    Parameters:
+        values (array-like): One value per run.
+        confidence (float): Level of the bootstrap confidence interval of the median.
+        resamples (int): Number of bootstrap resamples.
+        seed (int): Seed of the bootstrap, for reproducible intervals.
+    Returns:
+        Dictionary with the number of runs, the median, quartiles, IQR, the bounds of the confidence interval
+        of the median, the mean, the standard deviation and the number of outliers.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"Runs": 0}
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    outliers = (values < q1 - OUTLIER_FENCE * iqr) | (values > q3 + OUTLIER_FENCE * iqr)
+
+    rng = np.random.default_rng(seed)
+    medians = np.median(rng.choice(values, size=(resamples, len(values)), replace=True), axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.percentile(medians, [100 * alpha, 100 * (1 - alpha)])
+    return {
+        "Runs": len(values),
+        "Median": median,
+        "Q1": q1,
+        "Q3": q3,
+        "IQR": iqr,
+        "CI low": low,
+        "CI high": high,
+        "Mean": values.mean(),
+        "Std": values.std(ddof=1) if len(values) > 1 else 0.0,
+        "Outliers": int(outliers.sum()),
+    }
+
+
+class BenchmarkResult:
+    """
+    BenchmarkResult
+    ---------
+
+    Runs of a benchmark of one or several candidate functions and their statistics.
+
+    Attributes:
+        runs (DataFrame): One row per measured run: candidate, repetition, order of execution, duration,
+            energy of every device, total energy (and energy per unit of work), and whether it is an outlier.
+        confidence (float): Level of the bootstrap confidence intervals.
+        resamples (int): Number of bootstrap resamples.
+        seed (int): Seed of the bootstrap.
+    """
+
+    def __init__(self, runs, confidence=0.95, resamples=1000, seed=None):
+        """
+        Initialize the BenchmarkResult instance.
+
+        Parameters:
+            runs (DataFrame): One row per measured run.
+            confidence (float): Level of the bootstrap confidence intervals.
+            resamples (int): Number of bootstrap resamples.
+            seed (int): Seed of the bootstrap.
+        """
+        self.runs = runs
+        self.confidence = confidence
+        self.resamples = resamples
+        self.seed = seed
+        self.runs["Outlier"] = False
+        for column in self.metrics():
+            for _, group in self.runs.groupby("Candidate", sort=False):
+                values = group[column].dropna()
+                if values.empty:
+                    continue
+                q1, q3 = np.percentile(values, [25, 75])
+                fence = OUTLIER_FENCE * (q3 - q1)
+                outliers = (group[column] < q1 - fence) | (group[column] > q3 + fence)
+                self.runs.loc[outliers[outliers].index, "Outlier"] = True
+
+    def metrics(self):
+        """
+        Returns:
+            Names of the columns summarized: the duration, the total energy and the energy per unit of work.
+        """
+        return [column for column in self.runs.columns if column == DURATION_COLUMN or column.startswith("Energy")]
+
+    def summary(self):
+        """
+        Summarize the runs of every candidate.
+
+        Returns:
+            DataFrame with one row per candidate and metric, and the statistics of `summarize` as columns.
+        """
+        rows = []
+        for candidate, group in self.runs.groupby("Candidate", sort=False):
+            for column in self.metrics():
+                row = {"Candidate": candidate, "Metric": column}
+                row.update(summarize(group[column], self.confidence, self.resamples, self.seed))
+                rows.append(row)
+        return pd.DataFrame(rows).round(5)
+
+    def __repr__(self):
+        return repr(self.summary())
+
+
+def run_benchmark(wrapper, candidates, repeats=10, warmup=1, interleave=False, seed=None, work=None,
+                  work_unit="item", confidence=0.95, resamples=1000, on_run=None):
+    """
+    Measure repeated runs of one or several candidate functions on the running sampler of a PowerWrapper.
+    The runs are time windows on the shared samples, so the sampler is never restarted between them.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler, already acquired by the caller.
+        candidates (dict): Dictionary mapping candidate names to functions called without arguments.
+        repeats (int): Number of measured runs of every candidate.
+        warmup (int): Number of unmeasured runs of every candidate before the measured ones.
+        interleave (bool): Run the repetitions of all the candidates in a random interleaved order, so that drifts of
+            the machine state (turbo, temperature, background load) spread over all the candidates.
+        seed (int): Seed of the order of the runs and of the bootstrap.
+        work (float): Units of work done by each run, for the energy per unit of work.
+        work_unit (str): Name of the unit of work.
+        confidence (float): Level of the bootstrap confidence intervals.
+        resamples (int): Number of bootstrap resamples.
+        on_run (callable): Called with the candidate name, the start and the end time of every measured run.
+    Returns:
+        BenchmarkResult.
+    """
+    label = ENERGY_UNITS.get(str(wrapper.energy_unit).lower(), ENERGY_UNITS["wh"])[0]
+    schedule = [(name, repeat) for name in candidates for repeat in range(repeats)]
+    if interleave:
+        random.Random(seed).shuffle(schedule)
+
+    for name, func in candidates.items():
+        for _ in range(warmup):
+            func()
+
+    rows = []
+    for order, (name, repeat) in enumerate(schedule):
+        start = time.time()
+        candidates[name]()
+        end = time.time()
+        report = wrapper.energy_report(start, end)
+        energies = device_energies(report, wrapper.sensor_devices)
+        total = sum(energies.values())
+        row = {"Candidate": name, "Repeat": repeat, "Order": order, DURATION_COLUMN: end - start}
+        row.update({"Energy [%s] (%s)" % (label, device): energy for device, energy in energies.items()})
+        row["Energy [%s]" % label] = total
+        if work:
+            row["Energy per %s [%s]" % (work_unit, label)] = total / work
+        rows.append(row)
+        if on_run is not None:
+            on_run(name, start, end)
+        LOGGER.debug("Benchmark run %d of %s: %.5f s, %.5f %s", repeat, name, end - start, total, label)
+
+    runs = pd.DataFrame(rows) if rows else pd.DataFrame(columns=["Candidate", "Repeat", "Order", DURATION_COLUMN])
+    return BenchmarkResult(runs, confidence, resamples, seed)
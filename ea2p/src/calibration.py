@@ -0,0 +1,292 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Idle-baseline calibration: the static power of every sensor, measured over a quiet window and cached per host,
+so that reports can split the energy of a measurement into its baseline (idle) and dynamic parts.
+"""
+__all__ = ["Baseline", "BaselineCache", "calibrate", "hardware_inventory", "firmware_versions"]
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import platform
+import socket
+import time
+from pathlib import Path
+
+import pandas as pd  # type: ignore
+import psutil  # type: ignore
+
+from .metrics import ENERGY_UNITS
+from .utils import HOME_DIR, TOTAL_CPU_TIME, read_cpu_brand, rooted
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = HOME_DIR / ".ea2p" / "baselines.json"
+DMI_ROOT = Path("/sys/class/dmi/id")
+MICROCODE_FILE = Path("/sys/devices/system/cpu/cpu0/microcode/version")
+BASELINE = "baseline"
+DYNAMIC = "dynamic"
+
+
+def _read(path):
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return None
+
+
+def hardware_inventory(wrapper=None):
+    """
+    Describe the hardware of the host, as the key of its cached baselines.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler whose devices are added to the inventory, and whose hardware root gives the CPU model.
+    Returns:
+        Dictionary with the host name, the CPU model, the number of logical CPUs, the memory size and the measured devices.
+    """
+    inventory = {
+        "host": socket.gethostname(),
+        "cpu": read_cpu_brand(wrapper.hardware_root if wrapper is not None else None),
+        "cpus": os.cpu_count(),
+        "memory": psutil.virtual_memory().total,
+    }
+    if wrapper is not None:
+        inventory["devices"] = wrapper.power_devices
+        inventory["sensors"] = sorted(type(obj).__name__ for obj in wrapper.power_objects)
+        if wrapper.intel:
+            inventory["sensors"].append(type(wrapper.intel_power).__name__)
+    return inventory
+
+
+def firmware_versions(dmi_root=None, root=None):
+    """
+    Read the versions of the software below the measured code that change the idle power of the host.
+
+    Parameters:
+        dmi_root (str): Directory of the DMI attributes of the firmware, under the hardware root by default.
+        root (str): Hardware root of the sysfs tree (see utils.hardware_root).
+    Returns:
+        Dictionary with the kernel release, the BIOS version and date, and the CPU microcode revision (None when unknown).
+    """
+    dmi_root = Path(dmi_root or rooted(DMI_ROOT, root))
+    return {
+        "kernel": platform.release(),
+        "bios_version": _read(dmi_root / "bios_version"),
+        "bios_date": _read(dmi_root / "bios_date"),
+        "microcode": _read(rooted(MICROCODE_FILE, root)),
+    }
+
+
+class Baseline:
+    """
+    Baseline
+    ---------
+
+    Idle power of every sensor of a host.
+
+    Attributes:
+        power (dict): Mean idle power of every sensor in Watt.
+        firmware (dict): Firmware versions of the host when it was measured (see firmware_versions).
+        measured_at (float): Time of the calibration in seconds since the epoch.
+        duration (float): Length of the quiet window in seconds.
+    """
+
+    def __init__(self, power, firmware, measured_at, duration):
+        """
+        Initialize the Baseline instance.
+
+        Parameters:
+            power (dict): Mean idle power of every sensor in Watt.
+            firmware (dict): Firmware versions of the host when it was measured.
+            measured_at (float): Time of the calibration in seconds since the epoch.
+            duration (float): Length of the quiet window in seconds.
+        """
+        self.power = power
+        self.firmware = firmware
+        self.measured_at = measured_at
+        self.duration = duration
+
+    def stale_reasons(self, firmware=None, max_age_days=None):
+        """
+        Check whether the baseline still describes the host.
+
+        Parameters:
+            firmware (dict): Current firmware versions, read from the host by default.
+            max_age_days (float): Age in days after which the baseline is stale, None for no limit.
+        Returns:
+            List of the reasons why the baseline is stale, empty when it is up to date.
+        """
+        firmware = firmware_versions() if firmware is None else firmware
+        reasons = [
+            "%s changed from %s to %s" % (name, self.firmware.get(name), value)
+            for name, value in firmware.items() if value is not None and self.firmware.get(name) != value
+        ]
+        age = (time.time() - self.measured_at) / 86400
+        if max_age_days is not None and age > max_age_days:
+            reasons.append("measured %.1f days ago" % age)
+        return reasons
+
+    def split(self, usages, energy_unit):
+        """
+        Add the baseline and dynamic energy of every calibrated sensor to a report.
+
+        Parameters:
+            usages (DataFrame): One-row report with the duration column.
+            energy_unit (str): Energy unit of the report (J, Wh or kWh).
+        Returns:
+            The report with the "<sensor> (baseline)" and "<sensor> (dynamic)" columns.
+        """
+        joules = ENERGY_UNITS.get(str(energy_unit).lower(), ENERGY_UNITS["wh"])[1]
+        duration = float(usages[TOTAL_CPU_TIME].iloc[0]) if TOTAL_CPU_TIME in usages else 0.0
+        columns = {}
+        for sensor, power in self.power.items():
+            if sensor in usages:
+                baseline = power * duration / joules
+                columns["%s (%s)" % (sensor, BASELINE)] = baseline
+                columns["%s (%s)" % (sensor, DYNAMIC)] = float(usages[sensor].iloc[0]) - baseline
+        if not columns:
+            return usages
+        return pd.concat([usages, pd.DataFrame(columns, index=usages.index)], axis=1).round(5)
+
+    def to_dict(self):
+        return {"power": self.power, "firmware": self.firmware, "measured_at": self.measured_at, "duration": self.duration}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["power"], data.get("firmware", {}), data["measured_at"], data.get("duration", 0.0))
+
+    def __repr__(self):
+        measured = datetime.datetime.fromtimestamp(self.measured_at).isoformat(timespec="seconds")
+        return "Baseline(%s, measured %s)" % (", ".join("%s=%.2f W" % item for item in self.power.items()), measured)
+
+
+class BaselineCache:
+    """
+    BaselineCache
+    ---------
+
+    JSON file of the baselines of the hosts, keyed by a hash of their hardware inventory, so that one file
+    can be shared by the nodes of a cluster (e.g. in the home directory).
+
+    Attributes:
+        filepath (Path): Path to the cache file.
+    """
+
+    def __init__(self, filepath=DEFAULT_CACHE_FILE):
+        """
+        Initialize the BaselineCache instance.
+
+        Parameters:
+            filepath (str): Path to the cache file, created on the first save.
+        """
+        self.filepath = Path(filepath).expanduser()
+
+    @staticmethod
+    def key(inventory):
+        """
+        Returns:
+            Key of a hardware inventory in the cache.
+        """
+        return hashlib.sha1(json.dumps(inventory, sort_keys=True).encode()).hexdigest()
+
+    def __load(self):
+        try:
+            return json.loads(self.filepath.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            LOGGER.warning("Unable to read the baseline cache %s: %s", self.filepath, e)
+            return {}
+
+    def get(self, inventory):
+        """
+        Get the cached baseline of a host.
+
+        Parameters:
+            inventory (dict): Hardware inventory of the host (see hardware_inventory).
+        Returns:
+            Baseline, None if the host was never calibrated.
+        """
+        entry = self.__load().get(self.key(inventory))
+        return Baseline.from_dict(entry) if entry is not None else None
+
+    def put(self, inventory, baseline):
+        """
+        Store the baseline of a host, replacing the previous one.
+
+        Parameters:
+            inventory (dict): Hardware inventory of the host.
+            baseline (Baseline): Baseline of the host.
+        """
+        entries = self.__load()
+        entries[self.key(inventory)] = dict(baseline.to_dict(), inventory=inventory)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.filepath.with_name("%s.%d.tmp" % (self.filepath.name, os.getpid()))
+        temporary.write_text(json.dumps(entries, indent=2, sort_keys=True))
+        os.replace(temporary, self.filepath)
+
+
+def calibrate(wrapper, duration=10.0, settle=1.0, dmi_root=None):
+    """
+    Measure the idle power of every sensor of a sampler. The host should be quiet during the calibration:
+    the caller only sleeps, and any other load on the node is counted in the baseline.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler of the host.
+        duration (float): Length of the quiet window in seconds.
+        settle (float): Time in seconds left to the devices to reach their idle state before the window.
+        dmi_root (str): Directory of the DMI attributes of the firmware, under the hardware root of the sampler by default.
+    Returns:
+        Baseline.
+    """
+    wrapper.acquire()
+    try:
+        time.sleep(settle)
+        start = time.time()
+        time.sleep(duration)
+        end = time.time()
+        usages = wrapper.energy_report(start, end)
+    finally:
+        wrapper.release()
+    joules = ENERGY_UNITS.get(str(wrapper.energy_unit).lower(), ENERGY_UNITS["wh"])[1]
+    power = {
+        sensor: float(usages[sensor].iloc[0]) * joules / (end - start)
+        for sensor in wrapper.sensor_devices if sensor in usages
+    }
+    LOGGER.info("Idle baseline measured over %.1f s: %s", end - start, power)
+    return Baseline(power, firmware_versions(dmi_root, wrapper.hardware_root), end, end - start)
+
+
+def main(argv=None):
+    """
+    Command line entry point: `python -m ea2p.src.calibration [--config config_energy.json] [--duration 30]`.
+    """
+    from .wrapper import PowerWrapper
+
+    parser = argparse.ArgumentParser(description="Measure and cache the idle power of the sensors of this host.")
+    parser.add_argument("--config", default="config_energy.json", help="Configuration file of the sampler.")
+    parser.add_argument("--duration", type=float, help="Length of the quiet window in seconds.")
+    parser.add_argument("--show", action="store_true", help="Only show the cached baseline and whether it is stale.")
+    args = parser.parse_args(argv)
+
+    wrapper = PowerWrapper(args.config)
+    if args.show:
+        baseline = wrapper.baseline_cache.get(hardware_inventory(wrapper))
+        print(baseline if baseline is not None else "No baseline cached for this host")
+        if baseline is not None:
+            reasons = baseline.stale_reasons(firmware_versions(wrapper.dmi_root, wrapper.hardware_root), wrapper.baseline_max_age_days)
+            print("Stale: %s" % ("; ".join(reasons) if reasons else "no"))
+        return
+    baseline = wrapper.calibrate(args.duration)
+    print("%-30s %15s" % ("Sensor", "Idle power [W]"))
+    for sensor, power in baseline.power.items():
+        print("%-30s %15.3f" % (sensor, power))
+    print("\nBaseline stored in %s" % wrapper.baseline_cache.filepath)
+
+
+if __name__ == "__main__":
+    main()
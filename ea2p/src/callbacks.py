@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Energy per epoch and per batch for training loops: a Keras callback and helpers for PyTorch loops.
+"""
+__all__ = ["EnergyTracker", "keras_callback"]
+
+import contextlib
+import logging
+import time
+
+import pandas as pd  # type: ignore
+
+from .metrics import _unit, device_energies
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _batch_size(batch):
+    """
+    Guess the number of items of a batch yielded by a data loader: the length of its first tensor.
+    """
+    if isinstance(batch, dict):
+        batch = next(iter(batch.values()), None)
+    elif isinstance(batch, (list, tuple)) and batch:
+        batch = batch[0]
+    shape = getattr(batch, "shape", None)
+    if shape is not None and len(shape) > 0:
+        return int(shape[0])
+    try:
+        return len(batch)
+    except TypeError:
+        return None
+
+
+class EnergyTracker:
+    """
+    EnergyTracker
+    ---------
+
+    Energy per epoch and per group of batches of a training loop, measured on a single continuous region of a
+    PowerMeter. Epoch and batch boundaries are only markers on the running sampler: each window is a query on the
+    shared samples, so the sampler is never restarted and the whole training is also recorded as one region.
+
+    Every closed window adds a row to `rows` with its scope ("epoch" or "batches"), epoch, batches, number of steps
+    and items, duration, the energy of every device sensor, the total energy, the energy per step and the energy
+    per item (in the energy unit of the configuration file). The total leaves out the RAPL core and uncore planes,
+    which the package energy already counts.
+
+    Batches marked before the first epoch (or without epochs) are counted from the opening of the region.
+
+    For PyTorch loops:
+
+        with EnergyTracker(power_meter, "pytorch", "resnet50", every_n_batches=100) as tracker:
+            for epoch in range(epochs):
+                with tracker.epoch(epoch):
+                    for inputs, labels in tracker.track(loader):
+                        ...
+        tracker.report()
+
+    Attributes:
+        meter (PowerMeter): The PowerMeter measuring the training.
+        every_n_batches (int): Also close a window every N batches, None for epochs only.
+        batch_size (int): Number of items per batch, when it cannot be read from the batches.
+        region (Region): The region of the whole training, while it runs.
+        rows (list): Rows of the closed windows.
+    """
+
+    def __init__(self, meter, package, algorithm, algorithm_description="", every_n_batches=None, batch_size=None):
+        """
+        Initialize the EnergyTracker instance.
+
+        Parameters:
+            meter (PowerMeter): The PowerMeter measuring the training.
+            package (str): Package name of the trained model.
+            algorithm (str): Name of the trained model.
+            algorithm_description (str): Description of the training setup.
+            every_n_batches (int): Also close a window every N batches, None for epochs only.
+            batch_size (int): Number of items per batch, when it cannot be read from the batches.
+        """
+        self.meter = meter
+        self.package = package
+        self.algorithm = algorithm
+        self.algorithm_description = algorithm_description
+        self.every_n_batches = every_n_batches
+        self.batch_size = batch_size
+        self.unit = _unit(meter.power.energy_unit)[0]
+        self.region = None
+        self.rows = []
+        self.current_epoch = None
+        self.__reset_windows(None)
+
+    def __reset_windows(self, start):
+        """
+        Restart the epoch and batch windows at a time in seconds since the epoch, None to start them at the first mark.
+        """
+        self.epoch_start = self.chunk_start = start
+        self.steps = self.items = 0
+        self.chunk_steps = self.chunk_items = 0
+
+    def __window_start(self):
+        """
+        Start of a window marked before any epoch: the opening of the region, or now without a region.
+        """
+        return self.region.start_time if self.region is not None else time.time()
+
+    def begin(self):
+        """
+        Open the region of the whole training.
+        """
+        self.rows = []
+        self.region = self.meter.region(self.package, self.algorithm, self.algorithm_description)
+        self.__reset_windows(self.region.start_time)
+
+    def end(self):
+        """
+        Close the region of the whole training.
+
+        Returns:
+            Report of the whole training.
+        """
+        region, self.region = self.region, None
+        return region.stop() if region is not None else None
+
+    def epoch_begin(self, epoch):
+        """
+        Mark the beginning of an epoch.
+        """
+        self.current_epoch = epoch
+        self.__reset_windows(time.time())
+
+    def batch_end(self, batch_size=None):
+        """
+        Mark the end of a batch.
+
+        Parameters:
+            batch_size (int): Number of items of the batch, `batch_size` of the tracker by default.
+        """
+        size = batch_size if batch_size is not None else self.batch_size
+        if self.chunk_start is None:
+            self.epoch_start = self.chunk_start = self.__window_start()
+        self.steps += 1
+        self.chunk_steps += 1
+        self.items += size or 0
+        self.chunk_items += size or 0
+        if self.every_n_batches and self.chunk_steps >= self.every_n_batches:
+            now = time.time()
+            self.__add_row("batches", self.chunk_start, now, self.chunk_steps, self.chunk_items)
+            self.chunk_start = now
+            self.chunk_steps = self.chunk_items = 0
+
+    def epoch_end(self, epoch=None):
+        """
+        Mark the end of an epoch.
+
+        Returns:
+            Row of the epoch.
+        """
+        start = self.epoch_start if self.epoch_start is not None else self.__window_start()
+        return self.__add_row("epoch", start, time.time(), self.steps, self.items)
+
+    def __add_row(self, scope, start, end, steps, items):
+        """
+        Measure a window of the running region and add its row.
+        """
+        report = self.meter.power.energy_report(start, end)
+        devices = self.meter.power.sensor_devices
+        energies = {sensor: report[sensor].iloc[0] for sensor in devices if sensor in report}
+        total = sum(device_energies(report, devices).values())
+        row = {
+            "Scope": scope,
+            "Epoch": self.current_epoch,
+            "Last batch": self.steps,
+            "Steps": steps,
+            "Items": items,
+            "Duration [s]": round(end - start, 5),
+        }
+        row.update(energies)
+        row["Energy [%s]" % self.unit] = round(total, 5)
+        row["Energy per step [%s]" % self.unit] = round(total / steps, 8) if steps else None
+        row["Energy per item [%s]" % self.unit] = round(total / items, 8) if items else None
+        self.rows.append(row)
+        return row
+
+    @contextlib.contextmanager
+    def epoch(self, epoch):
+        """
+        Context manager marking an epoch of a training loop.
+        """
+        self.epoch_begin(epoch)
+        try:
+            yield self
+        finally:
+            self.epoch_end(epoch)
+
+    def track(self, batches):
+        """
+        Iterate over a data loader, marking the end of every batch. The number of items of each batch is read
+        from the length of its first tensor when the tracker has no `batch_size`.
+
+        Parameters:
+            batches (iterable): Data loader of the epoch.
+        """
+        for batch in batches:
+            yield batch
+            self.batch_end(self.batch_size or _batch_size(batch))
+
+    def report(self, scope=None):
+        """
+        Get the rows of the closed windows.
+
+        Parameters:
+            scope (str): Only keep the "epoch" or the "batches" rows.
+        Returns:
+            DataFrame with one row per window.
+        """
+        rows = [row for row in self.rows if scope is None or row["Scope"] == scope]
+        return pd.DataFrame(rows)
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exit_type, value, traceback):
+        self.end()
+
+
+def keras_callback(meter, package="keras", algorithm="fit", algorithm_description="", every_n_batches=None, batch_size=None):
+    """
+    Create a Keras callback recording the energy per epoch (and every N batches) of `model.fit` with an EnergyTracker.
+    The energy of each epoch is also added to the epoch logs (and to the History of `fit`) as "energy" and "energy_per_item".
+
+    Parameters:
+        meter (PowerMeter): The PowerMeter measuring the training.
+        package (str): Package name of the trained model.
+        algorithm (str): Name of the trained model.
+        algorithm_description (str): Description of the training setup.
+        every_n_batches (int): Also close a window every N batches, None for epochs only.
+        batch_size (int): Number of items per batch, used for the energy per item.
+    Returns:
+        Keras Callback instance. Its `tracker` attribute holds the EnergyTracker.
+    """
+    try:
+        from tensorflow import keras  # type: ignore
+    except ImportError:
+        try:
+            import keras  # type: ignore
+        except ImportError as e:
+            raise ImportError("The Keras callback requires TensorFlow or Keras.") from e
+
+    class EnergyCallback(keras.callbacks.Callback):
+        """
+        Keras callback recording the energy per epoch of the training.
+        """
+
+        def __init__(self, tracker):
+            super().__init__()
+            self.tracker = tracker
+
+        def on_train_begin(self, logs=None):
+            self.tracker.begin()
+
+        def on_train_end(self, logs=None):
+            self.tracker.end()
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.tracker.epoch_begin(epoch)
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.tracker.batch_end()
+
+        def on_epoch_end(self, epoch, logs=None):
+            row = self.tracker.epoch_end(epoch)
+            if logs is not None:
+                logs["energy"] = row["Energy [%s]" % self.tracker.unit]
+                if row["Energy per item [%s]" % self.tracker.unit] is not None:
+                    logs["energy_per_item"] = row["Energy per item [%s]" % self.tracker.unit]
+
+    return EnergyCallback(EnergyTracker(meter, package, algorithm, algorithm_description, every_n_batches, batch_size))
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Streaming export of measured regions, user events and power series to the Chrome Trace Event format,
+which is opened by chrome://tracing and by the Perfetto UI (https://ui.perfetto.dev).
+"""
+__all__ = ["ChromeTraceWriter"]
+
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .timeline import COUNTER
+
+LOGGER = logging.getLogger(__name__)
+
+COUNTER_TID = 0
+
+
+class ChromeTraceWriter:
+    """
+    ChromeTraceWriter
+    ---------
+
+    Stream a trace in the JSON Array format of the Chrome Trace Event specification: nested user spans are written
+    as begin/end ("B"/"E") events on the thread that opened them, regions as complete ("X") events, user events as instant ("i") events
+    and the samples of every sensor as counter ("C") tracks in Watt, so that power is shown under the spans.
+
+    Events are appended to the file as they happen, one per line, and flushed every `flush_every` events. A trace
+    cut short by a crash stays readable, as the closing bracket of the array is optional in this format.
+    The writer is a PowerWrapper listener and is safe to use from several threads.
+
+    Attributes:
+        filepath (str): Path to the trace file.
+        pid (int): Process identifier of the events (the MPI rank for PowerMeterMPI).
+        events (int): Number of events written so far.
+    """
+
+    def __init__(self, filepath, pid=None, process_name=None, flush_every=256):
+        """
+        Initialize the ChromeTraceWriter instance and create (or truncate) the trace file.
+
+        Parameters:
+            filepath (str): Path to the trace file.
+            pid (int): Process identifier of the events, the operating system one by default.
+            process_name (str): Name of the process shown in the trace viewer.
+            flush_every (int): Number of events written between two flushes of the file.
+        """
+        self.filepath = filepath
+        self.pid = os.getpid() if pid is None else pid
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.file = open(filepath, "w")
+        self.file.write("[\n")
+        self.events = 0
+        self.threads = set()
+        self.last_counters = {}
+        self.__write({"name": "process_name", "ph": "M", "pid": self.pid, "tid": COUNTER_TID,
+                      "args": {"name": process_name or "ea2p %d" % self.pid}})
+        atexit.register(self.close)
+
+    @staticmethod
+    def __timestamp(timestamp=None):
+        """
+        Convert a time in seconds since the epoch to the microseconds of the trace.
+        """
+        return round((time.time() if timestamp is None else timestamp) * 1e6, 3)
+
+    def __write(self, event):
+        """
+        Append one event to the trace file. The lock must be held by the caller, or the writer not shared yet.
+        """
+        if self.file.closed:
+            return
+        self.file.write(json.dumps(event, separators=(",", ":"), default=str) + ",\n")
+        self.events += 1
+        if self.events % self.flush_every == 0:
+            self.file.flush()
+
+    def __thread_id(self):
+        """
+        Get the identifier of the calling thread, naming its track on first use.
+        """
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads.add(tid)
+            self.__write({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                          "args": {"name": threading.current_thread().name}})
+        return tid
+
+    def begin(self, name, category="region", timestamp=None, **args):
+        """
+        Open a span on the calling thread. Spans opened on the same thread must be closed in reverse order.
+
+        Parameters:
+            name (str): Name of the span.
+            category (str): Category of the span, used to filter events in the viewer.
+            timestamp (float): Time in seconds since the epoch, now by default.
+            args: Arguments shown in the details of the span.
+        """
+        with self.lock:
+            self.__write({"name": name, "cat": category, "ph": "B", "pid": self.pid, "tid": self.__thread_id(),
+                          "ts": self.__timestamp(timestamp), "args": args})
+
+    def end(self, timestamp=None, **args):
+        """
+        Close the last span opened on the calling thread.
+
+        Parameters:
+            timestamp (float): Time in seconds since the epoch, now by default.
+            args: Arguments merged with the ones given when the span was opened.
+        """
+        with self.lock:
+            self.__write({"ph": "E", "pid": self.pid, "tid": self.__thread_id(),
+                          "ts": self.__timestamp(timestamp), "args": args})
+
+    @contextlib.contextmanager
+    def span(self, name, category="region", **args):
+        """
+        Context manager writing a span around a block of code.
+        """
+        self.begin(name, category, **args)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def complete(self, name, start, end, category="region", tid=None, **args):
+        """
+        Write a span whose start and end are already known, e.g. a region closed by another thread than the one that opened it.
+
+        Parameters:
+            name (str): Name of the span.
+            start (float): Start of the span in seconds since the epoch.
+            end (float): End of the span in seconds since the epoch.
+            category (str): Category of the span.
+            tid (int): Thread of the span, the calling thread by default.
+            args: Arguments shown in the details of the span.
+        """
+        with self.lock:
+            if tid is None:
+                tid = self.__thread_id()
+            self.__write({"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": tid,
+                          "ts": self.__timestamp(start), "dur": round((end - start) * 1e6, 3), "args": args})
+
+    def instant(self, name, category="event", timestamp=None, **args):
+        """
+        Write an instant event on the calling thread.
+
+        Parameters:
+            name (str): Name of the event.
+            category (str): Category of the event.
+            timestamp (float): Time in seconds since the epoch, now by default.
+            args: Arguments shown in the details of the event.
+        """
+        with self.lock:
+            self.__write({"name": name, "cat": category, "ph": "i", "s": "t", "pid": self.pid,
+                          "tid": self.__thread_id(), "ts": self.__timestamp(timestamp), "args": args})
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Write the readings of one sampling tick as counter events in Watt. Energy counters (RAPL) are turned
+        into the mean power since their previous reading.
+        """
+        with self.lock:
+            for name, value in values.items():
+                if kind == COUNTER:
+                    previous = self.last_counters.get(name)
+                    self.last_counters[name] = (timestamp, value)
+                    if previous is None or timestamp <= previous[0] or value < previous[1]:
+                        continue
+                    value = (value - previous[1]) * 3600 / (timestamp - previous[0])
+                self.__write({"name": name, "cat": device, "ph": "C", "pid": self.pid, "tid": COUNTER_TID,
+                              "ts": self.__timestamp(timestamp), "args": {"W": round(value, 3)}})
+
+    def reset(self):
+        """
+        Forget the previous counter readings, at the start of a measurement.
+        """
+        with self.lock:
+            self.last_counters = {}
+
+    def flush(self):
+        """
+        Flush the buffered events to the trace file.
+        """
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self):
+        """
+        Terminate the JSON array and close the trace file.
+        """
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(json.dumps({"name": "trace_end", "ph": "i", "s": "g", "pid": self.pid,
+                                        "tid": COUNTER_TID, "ts": self.__timestamp()}) + "\n]\n")
+            self.file.close()
+        LOGGER.info("Chrome trace with %d events written to %s", self.events, self.filepath)
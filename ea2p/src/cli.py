@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+The `ea2p` command line: `ea2p run [options] -- command [args...]` measures the energy of a command and of all
+the processes it starts.
+"""
+__all__ = ["ProcessTreeMonitor", "main"]
+
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_FILE = "config_energy.json"
+# Signals received by the launcher and forwarded to the command
+FORWARDED_SIGNALS = ("SIGINT", "SIGTERM", "SIGHUP", "SIGQUIT", "SIGUSR1", "SIGUSR2")
+TERMINAL_SIGNALS = ("SIGINT", "SIGQUIT")
+
+
+class ProcessTreeMonitor:
+    """
+    ProcessTreeMonitor
+    ---------
+
+    Poll the process tree of a command: every descendant is tracked while it runs, so that the tree is accounted
+    for even when processes are re-parented or exit between two polls. The CPU time of the descendants that were
+    waited for is read exactly from the resource usage of the children of the launcher once the command exits.
+
+    Attributes:
+        pid (int): Process identifier of the command.
+        interval (float): Time between two polls in seconds.
+        pids (set): Identifiers of every process seen in the tree.
+        peak_rss (int): Highest total resident memory of the tree in bytes.
+        cpu_times (dict): Last CPU time (user and system) seen of every process, in seconds.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        """
+        Initialize the ProcessTreeMonitor instance and start polling.
+
+        Parameters:
+            pid (int): Process identifier of the command.
+            interval (float): Time between two polls in seconds.
+        """
+        import psutil  # type: ignore
+
+        self.psutil = psutil
+        self.pid = pid
+        self.interval = interval
+        self.pids = set()
+        self.peak_rss = 0
+        self.cpu_times = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name="ea2p-tree", daemon=True)
+        self.thread.start()
+
+    def poll(self):
+        """
+        Read the memory and CPU time of every process of the tree once.
+        """
+        try:
+            root = self.psutil.Process(self.pid)
+            processes = [root] + root.children(recursive=True)
+        except self.psutil.NoSuchProcess:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    times = process.cpu_times()
+            except (self.psutil.NoSuchProcess, self.psutil.AccessDenied):
+                continue
+            self.pids.add(process.pid)
+            self.cpu_times[process.pid] = times.user + times.system
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def __run(self):
+        self.poll()
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        """
+        Stop polling.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+
+def _tree_cpu_time(meter, monitor, cpu_time_before, start, end):
+    """
+    Get the CPU time of the process tree of the command. The resource usage of the waited-for children of the launcher
+    also counts the `nvidia-smi` and `rocm-smi` subprocesses of the sampler, so that their CPU time over the run (see
+    SamplerStats) is subtracted. The CPU times polled by the monitor are used when the resource usage is unknown, or
+    when the sampler spawns subprocesses without measuring their cost.
+    """
+    from .sampler_stats import children_cpu_time
+    from .wrapper import SUBPROCESS_BACKENDS
+
+    spawning = any(isinstance(obj, SUBPROCESS_BACKENDS) for obj in meter.power.power_objects)
+    if os.name != "posix" or (spawning and not meter.power.sampler_stats_enabled):
+        return sum(monitor.cpu_times.values())
+    sampler_cpu_time = meter.sampler_stats(start, end)["subprocess_cpu_time_s"]
+    return max(children_cpu_time() - cpu_time_before - sampler_cpu_time, 0.0)
+
+
+def _forward_signals(child):
+    """
+    Forward the signals received by the launcher to the command. Interrupts typed in the terminal are already
+    delivered to the command when it runs in the foreground process group, so they are only ignored by the launcher.
+
+    Returns:
+        Dictionary of the previous handlers, to restore them.
+    """
+    def in_foreground():
+        try:
+            return os.tcgetpgrp(sys.stdin.fileno()) == os.getpgrp()
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    def forward(signum, frame):
+        name = signal.Signals(signum).name
+        if name in TERMINAL_SIGNALS and in_foreground():
+            return
+        try:
+            child.send_signal(signum)
+        except ProcessLookupError:
+            pass
+
+    previous = {}
+    for name in FORWARDED_SIGNALS:
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            previous[signum] = signal.signal(signum, forward)
+    return previous
+
+
+def run(args):
+    """
+    Measure a command: start the sampler, start the command without a shell, account for its process tree,
+    and record the report when it exits.
+
+    Returns:
+        Exit code of the command, 128 + N when it was killed by the signal N.
+    """
+    command = args.command[1:] if args.command and args.command[0] == "--" else args.command
+    if not command:
+        raise SystemExit("ea2p run: missing command, e.g. `ea2p run -- python train.py`")
+
+    from .power_meter import PowerMeter
+    from .sampler_stats import children_cpu_time
+
+    meter = PowerMeter(
+        project_name=args.project,
+        output_filepath=args.output,
+        config_file=args.config,
+        output_format=args.format,
+        print_to_cli=not args.quiet,
+        timeline_filepath=args.timeline,
+        chrome_trace_filepath=args.chrome_trace,
+    )
+    algorithm = args.algorithm or Path(command[0]).name
+    description = args.description if args.description is not None else subprocess.list2cmdline(command)
+    region = meter.region(args.package, algorithm, description)
+    started, cpu_time_before = time.time(), children_cpu_time()
+    try:
+        child = subprocess.Popen(command)
+    except OSError as e:
+        print("ea2p run: %s: %s" % (command[0], e.strerror), file=sys.stderr)
+        returncode = 127 if isinstance(e, FileNotFoundError) else 126
+        region.annotate(**{"Exit code": returncode})
+        region.stop()
+        meter.flush()
+        return returncode
+
+    previous = _forward_signals(child)
+    monitor = ProcessTreeMonitor(child.pid, args.poll_interval)
+    try:
+        returncode = child.wait()
+    finally:
+        monitor.stop()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+    tree_cpu_time = _tree_cpu_time(meter, monitor, cpu_time_before, started, time.time())
+    region.annotate(**{
+        "Exit code": returncode,
+        "Processes": len(monitor.pids),
+        "Tree CPU Time [s]": round(tree_cpu_time, 5),
+        "Tree peak RSS [MB]": round(monitor.peak_rss / 2 ** 20, 3),
+    })
+    region.stop()
+    meter.flush()
+    return 128 - returncode if returncode < 0 else returncode
+
+
+def main(argv=None):
+    """
+    Command line entry point: `ea2p run [--config config_energy.json] -- command [args...]`.
+    """
+    parser = argparse.ArgumentParser(prog="ea2p", description="EA2P: Energy-Aware Application Profiler.")
+    subparsers = parser.add_subparsers(dest="subcommand", required=True)
+    run_parser = subparsers.add_parser("run", help="Measure the energy of a command and of its process tree.")
+    run_parser.add_argument("--config", help="Configuration file, %s in the working directory (or the default one) by default." % DEFAULT_CONFIG_FILE)
+    run_parser.add_argument("--project", default="ea2p_run", help="Project name of the report.")
+    run_parser.add_argument("--output", help="Output file of the report, energy_report.csv by default.")
+    run_parser.add_argument("--format", default="csv", choices=["csv", "sqlite"], help="Format of the output file.")
+    run_parser.add_argument("--package", default="command", help="Package name of the report.")
+    run_parser.add_argument("--algorithm", help="Algorithm name of the report, the name of the program by default.")
+    run_parser.add_argument("--description", help="Description of the report, the command line by default.")
+    run_parser.add_argument("--timeline", help="Parquet or Arrow file receiving every timestamped sample.")
+    run_parser.add_argument("--chrome-trace", help="Chrome Trace Event file of the run.")
+    run_parser.add_argument("--poll-interval", type=float, default=0.5, help="Time between two polls of the process tree in seconds.")
+    run_parser.add_argument("--quiet", action="store_true", help="Do not print the report.")
+    run_parser.add_argument("command", nargs=argparse.REMAINDER, help="Command to measure, after `--`.")
+    args = parser.parse_args(argv)
+
+    if args.config is None:
+        config = Path.cwd() / DEFAULT_CONFIG_FILE
+        args.config = config if config.exists() else Path(__file__).parent / DEFAULT_CONFIG_FILE
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Columnar export of the sample timelines recorded by PowerWrapper to Parquet or Arrow IPC files.
+"""
+__all__ = ["write_timeline", "read_timeline"]
+
+import logging
+from pathlib import Path
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+
+def _import_pyarrow():
+    """
+    Import pyarrow, which is only required for timeline export.
+    """
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.compute  # type: ignore
+        import pyarrow.ipc  # type: ignore
+        import pyarrow.parquet  # type: ignore
+    except ImportError as e:
+        raise ImportError(
+            "Timeline export requires pyarrow. Install it with 'pip install pyarrow'."
+        ) from e
+    return pyarrow
+
+
+def _file_format(filepath, file_format):
+    """
+    Get the file format from its explicit name or from the file suffix.
+    """
+    if file_format is None:
+        suffix = Path(filepath).suffix.lower()
+        if suffix in PARQUET_SUFFIXES:
+            return "parquet"
+        if suffix in ARROW_SUFFIXES:
+            return "arrow"
+        raise ValueError(
+            "Unable to infer the timeline format of %s. Use a .parquet or .arrow file "
+            "or pass file_format explicitly" % filepath
+        )
+    file_format = file_format.lower()
+    if file_format not in ("parquet", "arrow"):
+        raise ValueError("Unsupported timeline format %s, please use parquet or arrow" % file_format)
+    return file_format
+
+
+def _schema(pa):
+    return pa.schema([
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("rank", pa.int32()),
+        ("device", pa.dictionary(pa.int32(), pa.string())),
+        ("sensor", pa.dictionary(pa.int32(), pa.string())),
+        ("kind", pa.dictionary(pa.int32(), pa.string())),
+        ("value", pa.float64()),
+    ])
+
+
+def _batches(pa, store):
+    """
+    Build one record batch per sensor series of a SampleStore.
+    Dictionaries are shared by every batch, as required by the Arrow IPC file format.
+    """
+    schema = _schema(pa)
+    series = list(store.iter_series())
+    dictionaries = {
+        column: sorted({item[position] for item in series})
+        for column, position in (("sensor", 0), ("kind", 1), ("device", 2))
+    }
+    arrays = {column: pa.array(values, type=pa.string()) for column, values in dictionaries.items()}
+
+    def encode(column, value, size):
+        indices = np.full(size, dictionaries[column].index(value), dtype=np.int32)
+        return pa.DictionaryArray.from_arrays(pa.array(indices), arrays[column])
+
+    for sensor, kind, device, times, values in series:
+        size = len(times)
+        yield pa.record_batch([
+            pa.array((times * 1e6).astype(np.int64), type=pa.int64()).cast(schema.field("timestamp").type),
+            pa.array(np.full(size, store.rank, dtype=np.int32)),
+            encode("device", device, size),
+            encode("sensor", sensor, size),
+            encode("kind", kind, size),
+            pa.array(values, type=pa.float64()),
+        ], schema=schema)
+
+
+def write_timeline(store, filepath, file_format=None, compression=None):
+    """
+    Write every sample of a SampleStore to a Parquet or Arrow IPC file, one record batch (row group) per sensor.
+
+    Parameters:
+        store (SampleStore): The samples to export.
+        filepath (str): Path to the output file.
+        file_format (str): "parquet" or "arrow". Inferred from the file suffix when not given.
+        compression (str): Compression codec (e.g. "zstd", "lz4", "none"). Defaults to zstd for Parquet and to
+            uncompressed Arrow files, which are memory-mapped without copy on read.
+    Returns:
+        Path to the written file.
+    """
+    pa = _import_pyarrow()
+    filepath = Path(filepath)
+    file_format = _file_format(filepath, file_format)
+    schema = _schema(pa)
+
+    if file_format == "parquet":
+        with pa.parquet.ParquetWriter(str(filepath), schema, compression=compression or "zstd") as writer:
+            for batch in _batches(pa, store):
+                writer.write_batch(batch)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=None if compression in (None, "none") else compression)
+        with pa.OSFile(str(filepath), "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in _batches(pa, store):
+                writer.write_batch(batch)
+
+    LOGGER.info("Timeline with %d samples written to %s", len(store), filepath)
+    return filepath
+
+
+def read_timeline(filepath, sensors=None, start=None, end=None, file_format=None, to_pandas=False):
+    """
+    Read a timeline written by `write_timeline` through a memory map, keeping only the requested slice.
+
+    Parquet files are filtered on row group statistics so that only the matching sensors are decoded.
+    Uncompressed Arrow files are mapped without copy, so multi-GB traces are sliced without loading them whole.
+
+    Parameters:
+        filepath (str): Path to the timeline file.
+        sensors (list): Only keep these sensors.
+        start (datetime or str): Only keep the samples taken at or after this time (UTC).
+        end (datetime or str): Only keep the samples taken at or before this time (UTC).
+        file_format (str): "parquet" or "arrow". Inferred from the file suffix when not given.
+        to_pandas (bool): Return a DataFrame instead of a pyarrow Table.
+    Returns:
+        pyarrow Table (or DataFrame) with columns timestamp, rank, device, sensor, kind and value.
+    """
+    pa = _import_pyarrow()
+    file_format = _file_format(filepath, file_format)
+
+    if file_format == "parquet":
+        filters = [("sensor", "in", list(sensors))] if sensors is not None else None
+        table = pa.parquet.read_table(str(filepath), memory_map=True, filters=filters)
+        sensors = None
+    else:
+        table = pa.ipc.open_file(pa.memory_map(str(filepath), "r")).read_all()
+
+    mask = None
+    conditions = []
+    if sensors is not None:
+        conditions.append(pa.compute.is_in(table["sensor"].cast(pa.string()), value_set=pa.array(list(sensors))))
+    timestamp_type = table.schema.field("timestamp").type
+    if start is not None:
+        conditions.append(pa.compute.greater_equal(table["timestamp"], pa.scalar(_to_utc(start), type=timestamp_type)))
+    if end is not None:
+        conditions.append(pa.compute.less_equal(table["timestamp"], pa.scalar(_to_utc(end), type=timestamp_type)))
+    for condition in conditions:
+        mask = condition if mask is None else pa.compute.and_(mask, condition)
+    if mask is not None:
+        table = table.filter(mask)
+
+    return table.to_pandas() if to_pandas else table
+
+
+def _to_utc(value):
+    """
+    Convert a datetime or a string to a timezone-aware UTC datetime.
+    """
+    import pandas as pd  # type: ignore
+
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+    return timestamp.to_pydatetime()
@@ -12,8 +12,8 @@ from .power import PowerLinux
 from .utils import JOULE_TO_WATT
 
 class PowerClientIntel(PowerLinux):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, root=None):
+        super().__init__(root)
         self.cpu_sub_doms = self.get_cpu_sub_domains()
         self.power_draws = []
         self.record = {}
@@ -28,14 +28,15 @@ class PowerClientIntel(PowerLinux):
         cpu_sub_doms = []
         for dom, name in self.cpu_doms:
             dom_paths = glob.glob(
-                READ_RAPL_PATH.format(dom)
+                self.rapl_path(dom)
                 + RAPL_PATH_SUB_DOMS.format(dom, "*")
                 + RAPL_DEVICENAME_FILE
             )
-            for i, file in enumerate(dom_paths):
+            for file in sorted(dom_paths):
                 file = Path(file)
                 subdom_name = file.read_text().replace('\n','')
-                cpu_sub_doms.append((dom, i, subdom_name))
+                # sub-domain identifier of the "intel-rapl:<domain>:<sub-domain>" directory, glob order being arbitrary
+                cpu_sub_doms.append((dom, int(file.parent.name.split(":")[2]), subdom_name))
         return cpu_sub_doms
 
     def append_energy_usage(self):
@@ -70,13 +71,7 @@ class PowerClientIntel(PowerLinux):
         Returns:
         	Energy usage for the specified CPU sub-domain.
         """
-        energy_file = (
-            Path(READ_RAPL_PATH.format(domain))
-            / (RAPL_PATH_SUB_DOMS.format(domain, sub_domain))
-            / RAPL_ENERGY_FILE
-        )
-        energy = int(energy_file.read_text())
-        return energy
+        return self.read_counter(Path(self.rapl_path(domain)) / RAPL_PATH_SUB_DOMS.format(domain, sub_domain))
 
     def get_cpu_energy(self, cpu):
         """
@@ -87,14 +82,12 @@ class PowerClientIntel(PowerLinux):
         Returns:
         	Energy usage for the specified CPU.
         """
-        cpu_energy_file = Path(READ_RAPL_PATH.format(cpu)) / RAPL_ENERGY_FILE
-        energy = int(cpu_energy_file.read_text())
-        return energy
+        return self.read_counter(self.rapl_path(cpu))
 
 
 class PowerServerIntel(PowerLinux):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, root=None):
+        super().__init__(root)
         self.dram_ids = self.__get_drams_ids()
         self.power_draws = []
         self.record = {}
@@ -109,14 +102,14 @@ class PowerServerIntel(PowerLinux):
         dram_id_list = []
         for cpu in self.cpu_ids:
             dram_paths = glob.glob(
-                READ_RAPL_PATH.format(cpu)
+                self.rapl_path(cpu)
                 + RAPL_DRAM_PATH.format(cpu, "*")
                 + RAPL_DEVICENAME_FILE
             )
-            for i, dram_file in enumerate(dram_paths):
+            for dram_file in sorted(dram_paths):
                 dram_file = Path(dram_file)
                 if "dram" in dram_file.read_text():
-                    dram_id_list.append((cpu, i))
+                    dram_id_list.append((cpu, int(dram_file.parent.name.split(":")[2])))
                     break
         return dram_id_list
 
@@ -140,9 +133,7 @@ class PowerServerIntel(PowerLinux):
         Returns:
         	Energy usage for the specified CPU.
         """
-        cpu_energy_file = Path(READ_RAPL_PATH.format(cpu)) / RAPL_ENERGY_FILE
-        energy = int(cpu_energy_file.read_text())
-        return energy
+        return self.read_counter(self.rapl_path(cpu))
 
     def __get_dram_energy(self, cpu, dram):
         """
@@ -154,10 +145,4 @@ class PowerServerIntel(PowerLinux):
         Returns:
         	Energy usage for the specified DRAM.
         """
-        dram_energy_file = (
-            Path(READ_RAPL_PATH.format(cpu))
-            / (RAPL_DRAM_PATH.format(cpu, dram))
-            / RAPL_ENERGY_FILE
-        )
-        energy = int(dram_energy_file.read_text())
-        return energy
+        return self.read_counter(Path(self.rapl_path(cpu)) / RAPL_DRAM_PATH.format(cpu, dram))
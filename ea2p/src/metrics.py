@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Throughput-normalised efficiency metrics of the energy reports: energy per unit of work, average power,
+energy-delay product (EDP) and energy-delay-squared product (ED2P), per device.
+"""
+__all__ = ["add_efficiency", "aggregate_reports", "device_energies"]
+
+import pandas as pd  # type: ignore
+
+from .attribution import MEMORY_DOMAINS
+from .utils import TOTAL_CPU_TIME
+
+WORK_COLUMN = "Work"
+WORK_UNIT_COLUMN = "Work unit"
+ALL_DEVICES = "all"
+# Energy units of the configuration file, with their label and their value in Joule
+ENERGY_UNITS = {"j": ("J", 1.0), "wh": ("Wh", 3600.0), "kwh": ("kWh", 3600000.0)}
+# RAPL power planes already counted in the energy of their package
+PACKAGE_PLANES = ("core", "uncore")
+
+
+def _unit(energy_unit):
+    return ENERGY_UNITS.get(str(energy_unit).lower(), ENERGY_UNITS["wh"])
+
+
+def _energy_column(label, device):
+    return "Energy [%s] (%s)" % (label, device)
+
+
+def _device(sensor, device):
+    """
+    Get the device whose energy includes a sensor: RAPL DRAM (and server "energy_memory") domains are memory, and the power planes of a
+    package are left out, as the package domain already counts them. Returns None for a left out sensor.
+    """
+    name = sensor.lower()
+    if device == "cpu" and name in PACKAGE_PLANES:
+        return None
+    if device == "cpu" and any(domain in name for domain in MEMORY_DOMAINS):
+        return "ram"
+    return device
+
+
+def _metrics(energies, duration, work, work_unit, energy_unit):
+    """
+    Compute the efficiency metrics from the energy of every device.
+
+    Parameters:
+        energies (dict): Dictionary mapping device types to their energy in the configured unit.
+        duration (float): Duration of the measurement in seconds.
+        work (float): Units of work done during the measurement (samples, tokens, requests, FLOPs), None if unknown.
+        work_unit (str): Name of the unit of work.
+        energy_unit (str): Energy unit of the configuration file (J, Wh or kWh).
+    Returns:
+        Dictionary of report columns.
+    """
+    label, joules = _unit(energy_unit)
+    columns = {}
+    if work is not None:
+        columns[WORK_COLUMN] = work
+        columns[WORK_UNIT_COLUMN] = work_unit
+    energies = dict(energies)
+    energies[ALL_DEVICES] = sum(energies.values())
+    for device, energy in energies.items():
+        columns[_energy_column(label, device)] = energy
+        columns["Average power [W] (%s)" % device] = energy * joules / duration if duration > 0 else None
+        if work:
+            columns["Energy per %s [%s] (%s)" % (work_unit, label, device)] = energy / work
+        columns["EDP [%s.s] (%s)" % (label, device)] = energy * duration
+        columns["ED2P [%s.s2] (%s)" % (label, device)] = energy * duration ** 2
+    return columns
+
+
+def device_energies(record, sensor_devices):
+    """
+    Sum the energy of the sensors of every device in the first row of a report.
+
+    Parameters:
+        record (DataFrame): Report with one column per sensor.
+        sensor_devices (dict): Device type (cpu, gpu, ram) of every sensor, attributed counters being left out.
+    Returns:
+        Dictionary mapping device types to their energy in the unit of the report.
+    """
+    energies = {}
+    for sensor, device in sensor_devices.items():
+        device = _device(sensor, device)
+        if device is not None and sensor in record:
+            energies[device] = energies.get(device, 0.0) + float(record[sensor].iloc[0])
+    return energies
+
+
+def add_efficiency(record, sensor_devices, energy_unit, work=None, work_unit="item"):
+    """
+    Add the efficiency metrics of every device to a one-row energy report.
+
+    Parameters:
+        record (DataFrame): Report with one column per sensor and the duration column.
+        sensor_devices (dict): Device type (cpu, gpu, ram) of every sensor, attributed counters being left out.
+        energy_unit (str): Energy unit of the report (J, Wh or kWh).
+        work (float): Units of work done during the measurement, None if unknown.
+        work_unit (str): Name of the unit of work.
+    Returns:
+        The report with the metric columns.
+    """
+    duration = float(record[TOTAL_CPU_TIME].iloc[0]) if TOTAL_CPU_TIME in record else 0.0
+    columns = _metrics(device_energies(record, sensor_devices), duration, work, work_unit, energy_unit)
+    return pd.concat([record, pd.DataFrame(columns, index=record.index)], axis=1).round(8)
+
+
+def aggregate_reports(records, energy_unit, label_column=None, label="Total"):
+    """
+    Build the total row of reports measured in parallel (e.g. one per MPI rank).
+
+    Energies and work are summed and the duration is the longest one. The efficiency metrics are recomputed
+    from these totals instead of being summed, shares in percent are averaged, and times in milliseconds
+    (e.g. sampler tick durations) are the longest ones.
+
+    Parameters:
+        records (DataFrame): One report per row.
+        energy_unit (str): Energy unit of the reports (J, Wh or kWh).
+        label_column (str): Column receiving the label of the total row (e.g. "Rank").
+        label (str): Label of the total row.
+    Returns:
+        DataFrame with the total row, with the columns of the reports.
+    """
+    unit_label, joules = _unit(energy_unit)
+    numeric = records.select_dtypes("number")
+    total = {}
+    for column in numeric.columns:
+        if column == label_column:
+            continue
+        if column == TOTAL_CPU_TIME or column.endswith("[ms]"):
+            total[column] = numeric[column].max()
+        elif column.endswith("[%]"):
+            total[column] = numeric[column].mean()
+        else:
+            total[column] = numeric[column].sum()
+
+    prefix = "Energy [%s] (" % unit_label
+    energies = {
+        column[len(prefix):-1]: total[column] for column in total
+        if column.startswith(prefix) and column != _energy_column(unit_label, ALL_DEVICES)
+    }
+    if energies:
+        work = total.get(WORK_COLUMN) if WORK_COLUMN in records else None
+        work_unit = records[WORK_UNIT_COLUMN].dropna().iloc[0] if WORK_UNIT_COLUMN in records and work else "item"
+        total.update(_metrics(energies, total.get(TOTAL_CPU_TIME, 0.0), work, work_unit, energy_unit))
+
+    row = pd.DataFrame([total]).reindex(columns=records.columns).round(5).astype(object)
+    if label_column is not None:
+        row[label_column] = label
+    return row
@@ -3,21 +3,120 @@
 """
 Python classes monitoring Nvidia GPU's power usage by querying system management interface.
 """
-__all__ = ["PowerNvidia"]
+__all__ = ["PowerNvidia", "visible_devices"]
 
+import logging
+import os
 import subprocess
 
+LOGGER = logging.getLogger(__name__)
+
+
+def _import_nvml():
+    """
+    Import the NVML bindings, which are only required for per-process GPU accounting.
+    """
+    try:
+        import pynvml  # type: ignore
+    except ImportError as e:
+        raise ImportError(
+            "Per-process GPU accounting requires the NVML bindings. Install them with 'pip install nvidia-ml-py'."
+        ) from e
+    return pynvml
+
+
+def visible_devices(uuids=None, environ=None, names=None):
+    """
+    Get the indices of the GPUs listed in CUDA_VISIBLE_DEVICES, in the order of nvidia-smi and NVML (PCI bus order).
+
+    Numeric entries are indices in the CUDA enumeration order, which is the PCI bus order only when
+    CUDA_DEVICE_ORDER=PCI_BUS_ID is set, or when every GPU is of the same model (CUDA lists the fastest GPUs first,
+    ties being broken by PCI bus). On a node mixing GPU models without CUDA_DEVICE_ORDER=PCI_BUS_ID, numeric entries
+    cannot be resolved: a warning is logged and every GPU is measured. UUID entries are always resolved.
+
+    Parameters:
+        uuids (list): UUIDs of the GPUs, by nvidia-smi index, used to resolve the "GPU-..." entries.
+        environ (dict): Environment to read, os.environ by default.
+        names (list): Model names of the GPUs, by nvidia-smi index, to tell whether the node mixes GPU models.
+    Returns:
+        List of GPU indices, or None when CUDA_VISIBLE_DEVICES is not set or cannot be resolved (every GPU is visible).
+    """
+    environ = environ if environ is not None else os.environ
+    value = environ.get("CUDA_VISIBLE_DEVICES")
+    if value is None:
+        return None
+    pci_order = environ.get("CUDA_DEVICE_ORDER", "FASTEST_FIRST").upper() == "PCI_BUS_ID"
+    mixed = len(set(names or [])) > 1
+    indices = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if entry.lstrip("-").isdigit():
+            index = int(entry)
+            if index >= 0 and mixed and not pci_order:
+                LOGGER.warning(
+                    "CUDA_VISIBLE_DEVICES lists GPU indices in the CUDA order, which differs from the order of nvidia-smi "
+                    "on this node mixing GPU models: every GPU is measured. Set CUDA_DEVICE_ORDER=PCI_BUS_ID or list "
+                    "the GPU UUIDs to measure the visible GPUs only."
+                )
+                return None
+        else:
+            # UUIDs may be abbreviated to any unique prefix
+            matches = [i for i, uuid in enumerate(uuids or []) if uuid.startswith(entry)]
+            if len(matches) != 1:
+                LOGGER.warning("Unable to resolve the GPU %s of CUDA_VISIBLE_DEVICES", entry)
+                break
+            index = matches[0]
+        if index < 0:
+            # CUDA ignores the devices listed after an invalid entry
+            break
+        indices.append(index)
+    return indices
+
+
 class PowerNvidia():
     """
     Class for monitoring Nvidia GPU power usage
+
+    Board power is read with nvidia-smi. When per-process accounting is enabled, the SM utilization of every
+    process running on the GPUs is also read with NVML (`nvmlDeviceGetProcessUtilization`).
     """
 
-    def __init__(self):
+    def __init__(self, visible_only=False, nvml=None):
+        """
+        Parameters:
+            visible_only (bool): Only account for the GPUs listed in CUDA_VISIBLE_DEVICES.
+            nvml (module): NVML bindings (pynvml API) for per-process accounting, imported on first use by default.
+        """
         # Query drivers for the first time to avoid "Unknown" in the result. This also test the availability and working for Nvidia's drivers
         try:
             subprocess.check_output("nvidia-smi --query-gpu=power.draw --format=csv", shell=True)
         except subprocess.CalledProcessError:
             print("Error querying GPU power. Check if 'nvidia-smi' is installed and available.")
+        self.nvml = nvml
+        self.handles = None
+        self.last_seen = {}
+        self.devices = None
+        if visible_only:
+            uuids, names = self.__gpus()
+            self.devices = visible_devices(uuids, names=names)
+
+    def __gpus(self):
+        """
+        Get the UUIDs and the model names of the GPUs, by nvidia-smi index.
+        """
+        try:
+            output = subprocess.check_output(["nvidia-smi", "--query-gpu=index,uuid,name", "--format=csv,noheader"])
+        except (OSError, subprocess.CalledProcessError):
+            return [], []
+        gpus = {}
+        for line in output.decode("utf-8").splitlines():
+            fields = [field.strip() for field in line.split(",", 2)]
+            if len(fields) == 3 and fields[0].isdigit():
+                gpus[int(fields[0])] = (fields[1], fields[2])
+        ordered = [gpus[index] for index in sorted(gpus)]
+        return [uuid for uuid, name in ordered], [name for uuid, name in ordered]
 
     def append_energy_usage(self):
         """
@@ -32,6 +131,42 @@ class PowerNvidia():
         energy_usage = energy_usage.decode("utf-8").replace(" W", "")
         energy_usage = energy_usage.split("\n")[1:-1]
         #print(energy_usage)
-        energy = {"GPU " + str(i): (float(energy_usage[i])) for i in range(len(energy_usage))}
-        
+        energy = {"GPU " + str(i): (float(energy_usage[i])) for i in range(len(energy_usage))
+                  if self.devices is None or i in self.devices}
+
         return energy
+
+    def __get_handles(self):
+        """
+        Initialize NVML and get the handles of the accounted GPUs.
+        """
+        if self.handles is None:
+            if self.nvml is None:
+                self.nvml = _import_nvml()
+            self.nvml.nvmlInit()
+            count = self.nvml.nvmlDeviceGetCount()
+            self.handles = {i: self.nvml.nvmlDeviceGetHandleByIndex(i) for i in range(count)
+                            if self.devices is None or i in self.devices}
+        return self.handles
+
+    def process_utilization(self):
+        """
+        Read the SM utilization of the processes running on the GPUs since the previous call.
+
+        Returns:
+        - Dictionary mapping GPU names ("GPU 0") to dictionaries mapping process identifiers to their mean SM utilization [%].
+        """
+        utilization = {}
+        for index, handle in self.__get_handles().items():
+            try:
+                samples = self.nvml.nvmlDeviceGetProcessUtilization(handle, self.last_seen.get(index, 0))
+            except self.nvml.NVMLError:
+                # no process sample since the last call (NVML_ERROR_NOT_FOUND)
+                samples = []
+            sums, counts = {}, {}
+            for sample in samples:
+                sums[sample.pid] = sums.get(sample.pid, 0) + sample.smUtil
+                counts[sample.pid] = counts.get(sample.pid, 0) + 1
+                self.last_seen[index] = max(self.last_seen.get(index, 0), sample.timeStamp)
+            utilization["GPU " + str(index)] = {pid: sums[pid] / counts[pid] for pid in sums}
+        return utilization
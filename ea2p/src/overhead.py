@@ -0,0 +1,457 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the sampler itself: what a PowerWrapper costs (read latency of every backend, achievable
+sampling rate, tick jitter, CPU and GIL time of the sampling thread, start/stop latency, aggregation time versus
+run length) and how accurate it is against the ground truth of the hardware simulator. Results are written as
+JSON, so that versions can be compared.
+"""
+__all__ = ["read_latency", "sampling_rate", "sampler_cost", "start_stop_latency", "aggregation_time",
+           "energy_error", "run_suite", "compare", "main"]
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .sampler_stats import children_cpu_time
+from .simulator import HardwareSimulator, SERVER_CPU
+from .timeline import COUNTER
+from .utils import TOTAL_CPU_TIME
+
+LOGGER = logging.getLogger(__name__)
+
+SUITE_VERSION = 1
+# Power profile of the simulated package: idle, bursts shorter than most sampling intervals, then a plateau
+BURSTY_PROFILE = [(1.0, 8.0), (0.15, 45.0), (0.35, 10.0), (0.15, 45.0), (0.35, 10.0), (0.05, 60.0), (0.95, 12.0), (0, 25.0)]
+SIMULATED_CONFIG = {"devices_list": "cpu, gpu, ram", "sampling_freq": 0.1, "energy_unit": "J"}
+# Metrics compared between two results, and whether a higher value is better
+TRACKED_METRICS = {
+    "read_latency.*.median_ms": False,
+    "sampling_rate.ticks_per_s": True,
+    "sampler_cost.jitter.std_ms": False,
+    "sampler_cost.cpu_fraction": False,
+    "sampler_cost.gil.blocked_fraction": False,
+    "start_stop_latency.start.median_ms": False,
+    "start_stop_latency.stop.median_ms": False,
+    "aggregation_time.*.median_ms": False,
+    "energy_error.*.max_abs_error": False,
+}
+
+
+def _stats(seconds):
+    """
+    Summarize durations in seconds as milliseconds.
+    """
+    values = np.asarray(seconds, dtype=float) * 1e3
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "median_ms": float(np.median(values)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "std_ms": float(values.std()),
+    }
+
+
+def _backends(wrapper):
+    """
+    Returns:
+        List of (name, reading function) of the devices of a sampler.
+    """
+    backends = [(type(obj).__name__, obj.append_energy_usage) for obj in wrapper.power_objects]
+    if wrapper.intel:
+        backends.append((type(wrapper.intel_power).__name__, wrapper.intel_power.append_energy_usage))
+    return backends
+
+
+def _tick(wrapper):
+    """
+    Read every device of a sampler once, as one tick of its sampling loop.
+    """
+    if wrapper.power_objects:
+        wrapper.get_all_power(wrapper.power_objects)
+    if wrapper.intel:
+        wrapper.get_intel_energy()
+
+
+def read_latency(wrapper, reads=100):
+    """
+    Measure the time of one reading of every backend.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler whose backends are read.
+        reads (int): Number of readings of each backend.
+    Returns:
+        Dictionary mapping the backends to the statistics of their reading time.
+    """
+    results = {}
+    for name, read in _backends(wrapper):
+        durations = []
+        for _ in range(reads):
+            start = time.perf_counter()
+            read()
+            durations.append(time.perf_counter() - start)
+        results[name] = _stats(durations)
+    return results
+
+
+def sampling_rate(wrapper, duration=2.0):
+    """
+    Measure the highest sampling rate of a sampler: ticks run back to back, without sleeping.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler to measure.
+        duration (float): Length of the measurement in seconds.
+    Returns:
+        Dictionary with the number of ticks per second and the statistics of the tick duration.
+    """
+    wrapper.samples.clear()
+    durations = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        _tick(wrapper)
+        durations.append(time.perf_counter() - start)
+    wrapper.samples.clear()
+    return {"ticks_per_s": len(durations) / sum(durations) if durations else 0.0, "tick": _stats(durations)}
+
+
+def _gil_probe(duration):
+    """
+    Spin on the calling thread and measure the time it could not run, the other threads holding the GIL.
+
+    Returns:
+        List of the gaps between two iterations of the probe, in seconds.
+    """
+    gaps = []
+    end = time.perf_counter() + duration
+    last = time.perf_counter()
+    while last < end:
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+    return gaps
+
+
+def sampler_cost(wrapper, duration=5.0):
+    """
+    Measure the cost of the sampling thread of a sampler, in two phases. While the caller sleeps, the CPU time of the
+    process and of its children (e.g. `nvidia-smi`) is the cost of the sampler, and the timestamps of its samples
+    give the jitter of its ticks. While the caller spins, the time it is kept from running estimates how long the
+    sampler holds the GIL (compared with the same probe without sampler).
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler to measure.
+        duration (float): Length of each phase in seconds.
+    Returns:
+        Dictionary with the tick statistics and jitter, CPU time of the sampler and of its subprocesses, and GIL time.
+    """
+    cpu_before, children_before, wall_before = time.process_time(), children_cpu_time(), time.perf_counter()
+    wrapper.start()
+    time.sleep(duration)
+    wrapper.stop()
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    children = children_cpu_time() - children_before
+
+    sensor = next((s for s in wrapper.samples.sensors() if wrapper.samples.kind(s) != COUNTER), None)
+    sensor = sensor or next(iter(wrapper.samples.sensors()), None)
+    timestamps = wrapper.samples.get(sensor)[0] if sensor is not None else np.array([])
+    ticks = len(timestamps)
+    # the sampling loop reads the devices once more before its first tick and after its last one
+    periods = np.diff(timestamps)[1:-1]
+    jitter = _stats(np.abs(periods - np.median(periods))) if len(periods) else {"count": 0}
+
+    baseline_gaps = np.asarray(_gil_probe(min(duration, 1.0)))
+    threshold = max(10 * float(np.median(baseline_gaps)), 50e-6)
+    baseline_blocked = float(baseline_gaps[baseline_gaps > threshold].sum()) / (min(duration, 1.0))
+    wrapper.start()
+    gaps = np.asarray(_gil_probe(duration))
+    wrapper.stop()
+    blocked = gaps[gaps > threshold]
+    return {
+        "duration_s": wall,
+        "interval_s": wrapper.interval,
+        "ticks": ticks,
+        "period": _stats(periods),
+        "jitter": jitter,
+        "cpu_s": cpu,
+        "cpu_fraction": cpu / wall,
+        "subprocess_cpu_s": children,
+        "subprocess_cpu_fraction": children / wall,
+        "gil": {
+            "blocked_s": float(blocked.sum()),
+            "blocked_fraction": max(float(blocked.sum()) / duration - baseline_blocked, 0.0),
+            "stalls": int(len(blocked)),
+            "max_stall_ms": float(blocked.max() * 1e3) if len(blocked) else 0.0,
+        },
+    }
+
+
+def start_stop_latency(wrapper, repeats=10, run=0.05):
+    """
+    Measure the time of `start()` and of `stop()` (which includes building the report) on short runs.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler to measure.
+        repeats (int): Number of runs.
+        run (float): Length of each run in seconds.
+    Returns:
+        Dictionary with the statistics of the start and stop times.
+    """
+    starts, stops = [], []
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        wrapper.start()
+        starts.append(time.perf_counter() - begin)
+        time.sleep(run)
+        begin = time.perf_counter()
+        wrapper.stop()
+        stops.append(time.perf_counter() - begin)
+    return {"start": _stats(starts), "stop": _stats(stops)}
+
+
+def aggregation_time(wrapper, lengths=(10, 60, 600, 3600, 86400), repeats=5):
+    """
+    Measure the time to build the report of runs of increasing length, as done by `stop()`. The runs are not waited
+    for: the samples of every sensor of the sampler are generated at its sampling interval, counters increasing and
+    power constant, so that only the aggregation is measured.
+
+    Parameters:
+        wrapper (PowerWrapper): Sampler whose sensors and sample store are used.
+        lengths (list): Lengths of the runs in seconds.
+        repeats (int): Number of reports built for each length.
+    Returns:
+        Dictionary mapping the run lengths to the number of samples and the statistics of the report time.
+    """
+    wrapper.samples.clear()
+    _tick(wrapper)
+    sensors = {
+        sensor: (wrapper.samples.kind(sensor), wrapper.sensor_devices.get(sensor, ""))
+        for sensor in wrapper.samples.sensors()
+    }
+    interval = wrapper.interval or 1.0
+    results = {}
+    for length in lengths:
+        wrapper.samples.clear()
+        ticks = int(length / interval) + 1
+        start = time.time() - length
+        for tick in range(ticks):
+            timestamp = start + tick * interval
+            for sensor, (kind, device) in sensors.items():
+                value = tick * interval * 10.0 / 3600 if kind == COUNTER else 10.0
+                wrapper.samples.append(timestamp, {sensor: value}, kind=kind, device=device)
+        end = start + (ticks - 1) * interval
+        durations = []
+        for _ in range(repeats):
+            begin = time.perf_counter()
+            wrapper.energy_report(start, end)
+            durations.append(time.perf_counter() - begin)
+        results[str(length)] = dict(_stats(durations), samples=ticks * len(sensors))
+    wrapper.samples.clear()
+    return results
+
+
+def energy_error(config_file, root, intervals=(0.01, 0.1, 0.5, 1.0), duration=6.0, live=2.0):
+    """
+    Measure the energy error of the sampler against the ground truth of the hardware simulator, on a bursty power
+    profile: replayed on the simulated clock at several sampling intervals, for the client and the server RAPL
+    layouts, and on the wall clock for a live run.
+
+    Parameters:
+        config_file (str): Configuration file of the sampler.
+        root (str): Directory of the simulated trees.
+        intervals (list): Sampling intervals of the replays in seconds.
+        duration (float): Length of the replays in simulated seconds.
+        live (float): Length of the live run in seconds, 0 to skip it.
+    Returns:
+        Dictionary mapping each run to the relative error of every sensor and the largest absolute one.
+    """
+    from .wrapper import PowerWrapper
+
+    results = {}
+    for layout, cpu in (("client", None), ("server", SERVER_CPU)):
+        options = {"cpu": cpu} if cpu else {}
+        simulator = HardwareSimulator(Path(root) / layout, package=BURSTY_PROFILE, gpus=[BURSTY_PROFILE],
+                                      max_energy_range_uj=20_000_000, **options)
+        with simulator.activate():
+            wrapper = PowerWrapper(config_file)
+            for interval in intervals:
+                report = simulator.replay(wrapper, duration, interval)
+                errors = simulator.errors(report, wrapper.energy_unit, 0.0, duration)
+                results["%s replay %g s" % (layout, interval)] = dict(
+                    errors, max_abs_error=max(map(abs, errors.values()), default=0.0))
+            if live and layout == "client":
+                simulator.start()
+                try:
+                    wrapper.start()
+                    time.sleep(live)
+                    wrapper.stop()
+                finally:
+                    simulator.stop()
+                errors = simulator.errors(wrapper.record, wrapper.energy_unit, wrapper.start_time - simulator.origin,
+                                          wrapper.start_time - simulator.origin + float(wrapper.record[TOTAL_CPU_TIME].iloc[0]))
+                results["%s live %g s" % (layout, wrapper.interval)] = dict(
+                    errors, max_abs_error=max(map(abs, errors.values()), default=0.0))
+    return results
+
+
+def _environment(config_file, simulated):
+    try:
+        from importlib.metadata import version
+        ea2p_version = version("EA2P")
+    except Exception:
+        ea2p_version = None
+    with open(config_file) as file:
+        config = json.load(file)
+    return {
+        "suite_version": SUITE_VERSION,
+        "ea2p_version": ea2p_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "simulated": simulated,
+        "config": config,
+    }
+
+
+def run_suite(config_file=None, simulated=True, quick=False):
+    """
+    Run the whole benchmark suite.
+
+    Parameters:
+        config_file (str): Configuration file of the sampler. On simulated hardware, a configuration reading the CPU,
+            GPU and RAM every 100 ms by default.
+        simulated (bool): Measure the sampler on the simulated hardware, so that results only depend on the code and
+            the machine, or on the hardware of the host (the energy error is always measured on the simulator).
+        quick (bool): Shorter measurements, e.g. for a smoke test.
+    Returns:
+        Dictionary of the results, serializable as JSON.
+    """
+    from .wrapper import PowerWrapper
+
+    scale = 0.2 if quick else 1.0
+    with tempfile.TemporaryDirectory(prefix="ea2p-overhead-") as root:
+        if config_file is None:
+            config_file = Path(root) / "config_energy.json"
+            config_file.write_text(json.dumps(SIMULATED_CONFIG))
+        results = {"environment": _environment(config_file, simulated)}
+        # the simulated tree is not advanced, so that the simulator does not add its own thread to the measurements
+        simulator = HardwareSimulator(Path(root) / "host", package=15.0, gpus=[60.0]) if simulated else None
+        environ = dict(os.environ)
+        if simulator is not None:
+            os.environ.update(simulator.environ())
+        try:
+            wrapper = PowerWrapper(config_file)
+            LOGGER.info("Measuring the read latency of every backend")
+            results["read_latency"] = read_latency(wrapper, reads=int(100 * scale) or 1)
+            LOGGER.info("Measuring the highest sampling rate")
+            results["sampling_rate"] = sampling_rate(wrapper, duration=2.0 * scale)
+            LOGGER.info("Measuring the CPU time, jitter and GIL time of the sampling thread")
+            results["sampler_cost"] = sampler_cost(wrapper, duration=5.0 * scale)
+            LOGGER.info("Measuring the start and stop latency")
+            results["start_stop_latency"] = start_stop_latency(wrapper, repeats=int(10 * scale) or 1)
+            LOGGER.info("Measuring the aggregation time versus run length")
+            lengths = (10, 60, 600) if quick else (10, 60, 600, 3600, 86400)
+            results["aggregation_time"] = aggregation_time(wrapper, lengths=lengths, repeats=3 if quick else 5)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+        LOGGER.info("Measuring the energy error against the simulator")
+        results["energy_error"] = energy_error(config_file, Path(root) / "error", live=0.5 if quick else 2.0)
+    return results
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def _tracked(name):
+    for pattern, higher_is_better in TRACKED_METRICS.items():
+        head, _, tail = pattern.partition("*")
+        if name == pattern or (tail and name.startswith(head) and name.endswith(tail)
+                               and "." not in name[len(head):-len(tail)]):
+            return higher_is_better
+    return None
+
+
+def compare(previous, current, tolerance=0.2):
+    """
+    Compare two results of the suite and find the regressions.
+
+    Parameters:
+        previous (dict): Reference results, e.g. of the previous version.
+        current (dict): New results.
+        tolerance (float): Relative change of a metric tolerated before it is a regression.
+    Returns:
+        List of (metric, previous value, current value) of the tracked metrics that got worse by more than the tolerance.
+    """
+    before, after = _flatten(previous), _flatten(current)
+    regressions = []
+    for name, value in after.items():
+        higher_is_better = _tracked(name)
+        if higher_is_better is None or name not in before:
+            continue
+        reference = before[name]
+        if higher_is_better:
+            worse = value < reference * (1 - tolerance)
+        else:
+            # absolute slack for metrics close to 0 (errors, fractions, sub-millisecond times)
+            worse = value > reference * (1 + tolerance) + 1e-3
+        if worse:
+            regressions.append((name, reference, value))
+    return regressions
+
+
+def main(argv=None):
+    """
+    Command line entry point: `python -m ea2p.src.overhead [--output overhead.json] [--compare previous.json]`.
+    """
+    parser = argparse.ArgumentParser(description="Measure the overhead and accuracy of the EA2P sampler.")
+    parser.add_argument("--config", help="Configuration file of the sampler, a CPU, GPU and RAM one at 100 ms by default.")
+    parser.add_argument("--host", action="store_true", help="Measure the hardware of the host instead of the simulated hardware.")
+    parser.add_argument("--quick", action="store_true", help="Shorter measurements.")
+    parser.add_argument("--output", help="JSON file receiving the results, printed by default.")
+    parser.add_argument("--compare", help="JSON results of a previous version: exit with status 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change tolerated by --compare.")
+    args = parser.parse_args(argv)
+
+    if args.host and args.config is None:
+        parser.error("--host needs the --config of the sampler")
+    results = run_suite(args.config, simulated=not args.host, quick=args.quick)
+    text = json.dumps(results, indent=2, default=str)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+        print("Results written to %s" % args.output)
+    else:
+        print(text)
+    if args.compare:
+        regressions = compare(json.loads(Path(args.compare).read_text()), results, args.tolerance)
+        for name, before, after in regressions:
+            print("Regression: %s %.6g -> %.6g" % (name, before, after), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
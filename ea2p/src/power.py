@@ -57,11 +57,13 @@ class PowerProfiler(abc.ABC):
 class PowerLinux(PowerProfiler):
     """
     A class "PowerLinux" which inherits from "PowerProfiler" for energy/power profiling under Linux systems.
-    We have two statics methods to get the RAPL domains and subsdomains on the Linux system for Intel CPUs.
+    We have two methods to get the RAPL domains and subsdomains on the Linux system for Intel CPUs.
+
+    The sysfs tree is read under a hardware root ("/" by default, see utils.hardware_root), and the RAPL energy
+    counters are unwrapped: a reading below the previous one adds `max_energy_range_uj` to the counter.
     """
 
-    @staticmethod
-    def __get_cpu_ids():
+    def __get_cpu_ids(self):
         """
         Get CPU identifiers from files in CPU_IDS_DIR.
         
@@ -69,15 +71,14 @@ class PowerLinux(PowerProfiler):
         - List of CPU identifiers.
         """
         cpu_ids = []
-        for filename in glob.glob(CPU_IDS_DIR):
+        for filename in glob.glob(rooted(CPU_IDS_DIR, self.root)):
             with open(filename, "r") as f:
                 package_id = int(f.read())
             if package_id not in cpu_ids:
                 cpu_ids.append(package_id)
         return cpu_ids
 
-    @staticmethod
-    def __get_cpu_domains():
+    def __get_cpu_domains(self):
         """
         Get CPU domains from entries in POWERLOG_PATH_LINUX.
         
@@ -85,14 +86,47 @@ class PowerLinux(PowerProfiler):
         - List of tuples containing CPU domain information.
         """
         cpu_doms = []
-        for entry in os.scandir(POWERLOG_PATH_LINUX):
+        for entry in os.scandir(rooted(POWERLOG_PATH_LINUX, self.root)):
             if (entry.is_dir() and ("intel-rapl:" in entry.name)):
                 dom = (entry.name.split(":"))[1]
-                file = Path(READ_RAPL_PATH.format(int(dom))) / RAPL_DEVICENAME_FILE
+                file = Path(self.rapl_path(int(dom))) / RAPL_DEVICENAME_FILE
                 cpu_doms.append((int(dom), file.read_text().replace('\n','')))
         return cpu_doms
 
-    def __init__(self):
+    def __init__(self, root=None):
+        """
+        Parameters:
+        	root (str): Hardware root of the sysfs tree, "/" or the EA2P_HARDWARE_ROOT environment variable by default.
+        """
         super().__init__()
+        self.root = hardware_root(root)
+        self.counters = {}
         self.cpu_ids = self.__get_cpu_ids()
         self.cpu_doms = self.__get_cpu_domains()
+
+    def rapl_path(self, domain):
+        """
+        Get the directory of a RAPL package domain under the hardware root.
+        """
+        return rooted(READ_RAPL_PATH.format(domain), self.root)
+
+    def read_counter(self, directory):
+        """
+        Read the energy counter of a RAPL domain, unwrapped.
+
+        Parameters:
+        	directory (str): Directory of the domain.
+        Returns:
+        	Energy in micro joules since the first reading of the counter, plus the first reading.
+        """
+        directory = Path(directory)
+        value = int((directory / RAPL_ENERGY_FILE).read_text())
+        last, offset, energy_range = self.counters.get(directory, (value, 0, None))
+        if value < last:
+            if energy_range is None:
+                range_file = directory / RAPL_MAX_ENERGY_FILE
+                energy_range = int(range_file.read_text()) if range_file.exists() else 0
+            if energy_range:
+                offset += energy_range
+        self.counters[directory] = (value, offset, energy_range)
+        return value + offset
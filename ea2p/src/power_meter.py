@@ -3,16 +3,31 @@
 
 __all__ = ["PowerMeter"]
 
+import asyncio
+import contextlib
+import contextvars
 import datetime
+import functools
+import inspect
 import logging
-import traceback
+import threading
 
 import pandas as pd  # type: ignore
 
 from .wrapper import *
+from .writer import get_result_writer
+from .export import write_timeline
+from .profiler import EnergyProfiler
+from .chrome_trace import ChromeTraceWriter
+from .region import Region
+from .benchmark import run_benchmark
 
 LOGGER = logging.getLogger(__name__)
 
+# Stacks of the regions measured by the current asyncio task (or thread), keyed by the id of their PowerMeter.
+# The mapping is never mutated in place, so that every task keeps the stacks of the context it was created in.
+_REGIONS = contextvars.ContextVar("ea2p_regions", default={})
+
 
 class PowerMeter:
 
@@ -26,38 +41,61 @@ class PowerMeter:
         DATETIME_FORMAT (str): The format for datetime objects.
         DEFAULT_CONFIG_FILE (str): The default configuration file name to use for wrapper.
         DEFAULT_OUTPUT_FILEPATH (str): The default output file path to save results.
+        DEFAULT_SQLITE_FILEPATH (str): The default output file path when results are saved in SQLite.
         LOGGING_FILE (str): The filename for the experimentation logging file.
         project_name (str): Name of the experimentation project.
         config_file (str): Path to the configuration file for the wrapper initialisation.
         output_filepath (str): Path to the output file for results of profiling.
-        output_format (str): Format for the output file (e.g. csv).
+        output_format (str): Format for the output file (csv or sqlite).
         print_to_cli (bool): Flag to print the result of measurement in Terminal at the end (default True).
+        timeline_filepath (str): Path template of the optional Parquet/Arrow export of every timestamped sample.
+        profile_filepath (str): Path template of the optional energy flame graph (collapsed stacks weighted by energy).
+        profiler (EnergyProfiler): Sampler of the Python stacks of the measuring thread, when a profile is requested.
+        chrome_trace (ChromeTraceWriter): Optional Chrome trace receiving the regions, user spans and events, and the power counters.
         power (PowerWrapper): Instance of PowerWrapper class for power measurement.
+        writer (ResultWriter): Background writer shared by the instances recording into the same output file.
         used_package (str): Name of the package of algorithm to profile during power measurement.
         used_algorithm (str): Name of the profiled algorithm for power measurement.
         used_algorithm_description (str): Description of the algorithm used during power measurement.
         logging_filename (str): Path to the logging file of experiment.
+        local (local): Per-thread arguments and stack of the regions opened with start_measure.
 
     Methods:
         __init__: Initialize the PowerMeter instance.
-        measure_power: Decorator to measure power consumption during the execution of a function.
+        measure_power: Decorator to measure power consumption during the execution of a function, coroutine function or async generator.
         __set_used_arguments: Set the arguments used during power measurement.
         __call__: Set the arguments used during power measurement using a decorator syntax.
         __enter__: Enter method for context manager. Starts power measurement.
         __exit__: Exit method for context manager. Stops power measurement.
+        __aenter__: Enter method for asynchronous context manager. Starts power measurement without blocking the event loop.
+        __aexit__: Exit method for asynchronous context manager. Stops power measurement without blocking the event loop.
+        current_region: Get the innermost region opened by the calling asyncio task or thread.
+        region: Open an independent measured region on the shared sampler.
+        add_work: Count units of work done in the current region.
+        benchmark: Measure repeated runs of one or several functions and summarize their energy and time.
+        __on_region_start: Register a new region on the profiler and the trace.
+        __on_sampler_stop: Export the timeline and the energy flame graph once the sampler is stopped.
+        __on_region_stop: Print and queue the report of a closed region.
         start_measure: Start measuring power consumption.
         stop_measure: Stop measuring power consumption.
-        __record_data_to_file: Record power data to a file.
+        __record_data_to_file: Queue power data to be recorded to a file.
+        flush: Wait until the queued power data is written to the output file.
         __log_records: Log recorded power data.
+        __format_filepath: Substitute the placeholders of an output path template.
+        __export_timeline: Export every timestamped sample of the last measurement.
+        __export_profile: Write the energy flame graph of the last measurement.
+        span: Context manager writing a nested user span to the Chrome trace.
+        event: Write a user instant event to the Chrome trace.
     """
 
     DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"  # "%c"
     DEFAULT_CONFIG_FILE = "config_energy.json"
     DEFAULT__OUTPUT_FILEPATH = "energy_report.csv"
+    DEFAULT_SQLITE_FILEPATH = "energy_report.sqlite"
     LOGGING_FILE = "logging_file.txt"
 
     # Constructors
-    def __init__(self, project_name="test_project", output_filepath=None, config_file=None, output_format="csv", print_to_cli=True):
+    def __init__(self, project_name="test_project", output_filepath=None, config_file=None, output_format="csv", print_to_cli=True, timeline_filepath=None, profile_filepath=None, chrome_trace_filepath=None):
         """
         Initialize the PowerMeter instance.
 
@@ -65,26 +103,53 @@ class PowerMeter:
             config_file (str): Path to the configuration file.
             project_name (str): Name of the project.
             output_filepath (str): Path to the output file.
-            output_format (str): Format for the output file.
-            print_to_cli (bool): To print the result of measurement in Terminal at the end
+            output_format (str): Format for the output file, "csv" (default) or "sqlite" for an indexed SQLite database (see SQLiteResultStore).
+                Other formats fall back to csv with a warning.
+            print_to_cli (bool): To print the result of measurement in Terminal at the end, from the background writer
+            timeline_filepath (str): Optional Parquet (.parquet) or Arrow IPC (.arrow) file receiving every timestamped sample of each measurement,
+                written once the last open region stops the sampler. The path may contain {package}, {algorithm} and {datetime} placeholders
+                (the tags of that last region) to keep one file per measurement.
+            profile_filepath (str): Optional file receiving the energy flame graph of each measurement, in the collapsed-stack format
+                of flamegraph.pl and speedscope, weighted in millijoules. Same placeholders as timeline_filepath.
+            chrome_trace_filepath (str): Optional Chrome Trace Event JSON file (opened by chrome://tracing or ui.perfetto.dev) streaming
+                the measured regions, the user spans and events and the power of every sensor. The path may contain a {pid} placeholder.
         """
 
         self.project_name = project_name
         self.config_file = Path(config_file) if config_file else Path.cwd() / self.DEFAULT_CONFIG_FILE
-        self.output_filepath = Path(output_filepath) if output_filepath else Path.cwd() / self.DEFAULT__OUTPUT_FILEPATH
-        self.output_format = output_format
+        self.output_format = output_format.lower()
+        default_filepath = self.DEFAULT_SQLITE_FILEPATH if self.output_format == "sqlite" else self.DEFAULT__OUTPUT_FILEPATH
+        self.output_filepath = Path(output_filepath) if output_filepath else Path.cwd() / default_filepath
         self.print_to_cli = print_to_cli
+        self.timeline_filepath = timeline_filepath
+        self.profile_filepath = profile_filepath
 
         self.power = PowerWrapper(self.config_file)
+        self.writer = get_result_writer(self.output_filepath, self.output_format)
+        if self.timeline_filepath is not None:
+            # the exported timeline needs every raw sample, none are rolled into tiers
+            self.power.samples.raw_capacity = None
+        self.profiler = None
+        if self.profile_filepath is not None:
+            self.profiler = EnergyProfiler(self.power.samples, **self.power.profile_options)
+            self.power.listeners.append(self.profiler)
 
         self.used_package = ""
         self.used_algorithm = ""
         self.used_algorithm_description = ""
 
         self.logging_filename = PACKAGE_PATH / self.LOGGING_FILE
+        self.local = threading.local()
+
+        self.chrome_trace = None
+        if chrome_trace_filepath is not None:
+            self.chrome_trace = ChromeTraceWriter(
+                self.__format_filepath(chrome_trace_filepath), process_name=self.project_name,
+            )
+            self.power.listeners.append(self.chrome_trace)
 
 
-    def measure_power(self, package, algorithm, algorithm_description=""):
+    def measure_power(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
         Decorator to measure power consumption during the execution of a function.
 
@@ -92,6 +157,8 @@ class PowerMeter:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
+            work (float): Units of work done by each call, for the efficiency metrics. Calls may also count it with `add_work`.
+            work_unit (str): Name of the unit of work (e.g. "sample", "token", "request", "FLOP").
         Returns:
             Decorator function.
         """
@@ -103,19 +170,33 @@ class PowerMeter:
             )
 
         def decorator(func):
-            def wrapper(*args, **kwargs):
-                self.start_measure(
-                    package,
-                    algorithm,
-                    algorithm_description=algorithm_description,
-                )
-                try:
-                    results = func(*args, **kwargs)
-                finally:
-                    self.stop_measure()
-                return results
-
-            return wrapper
+            if inspect.isasyncgenfunction(func):
+                async def wrapper(*args, **kwargs):
+                    async with self(package, algorithm, algorithm_description, work, work_unit):
+                        async for item in func(*args, **kwargs):
+                            yield item
+
+            elif inspect.iscoroutinefunction(func):
+                async def wrapper(*args, **kwargs):
+                    async with self(package, algorithm, algorithm_description, work, work_unit):
+                        return await func(*args, **kwargs)
+
+            else:
+                def wrapper(*args, **kwargs):
+                    self.start_measure(
+                        package,
+                        algorithm,
+                        algorithm_description=algorithm_description,
+                        work=work,
+                        work_unit=work_unit,
+                    )
+                    try:
+                        results = func(*args, **kwargs)
+                    finally:
+                        self.stop_measure()
+                    return results
+
+            return functools.wraps(func)(wrapper)
 
         return decorator
 
@@ -133,28 +214,39 @@ class PowerMeter:
         self.used_algorithm = algorithm
         self.used_algorithm_description = algorithm_description
 
-    def __call__(self, package, algorithm, algorithm_description=""):
+    def __call__(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
         Set the arguments used during power measurement using a decorator syntax.
+        The arguments are kept per thread until the next `with` statement, so that threads sharing the instance do not mix them up.
 
         Parameters:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
+            work (float): Units of work done in the region, for the efficiency metrics.
+            work_unit (str): Name of the unit of work.
 
         """
         self.__set_used_arguments(package, algorithm, algorithm_description=algorithm_description)
+        self.local.pending = (package, algorithm, algorithm_description, work, work_unit)
         return self
 
+    def __pending_arguments(self):
+        """
+        Get the arguments given to the last call of the instance in this thread.
+        """
+        pending = getattr(self.local, "pending", None)
+        self.local.pending = None
+        return pending or (self.used_package, self.used_algorithm, self.used_algorithm_description, None, "item")
+
     def __enter__(self):
         """
         Enter method for context manager. Starts power measurement.
+
+        Returns:
+            Region handle of the measurement, holding its report once the block is left.
         """
-        self.start_measure(
-            self.used_package,
-            self.used_algorithm,
-            algorithm_description=self.used_algorithm_description,
-        )
+        return self.start_measure(*self.__pending_arguments())
 
     def __exit__(self, exit_type, value, traceback):
         """
@@ -162,59 +254,352 @@ class PowerMeter:
         """
         self.stop_measure()
 
-    def start_measure(self, package, algorithm, algorithm_description=""):
+    async def __aenter__(self):
+        """
+        Enter method for asynchronous context manager. The region is tagged on the current task through contextvars,
+        and the sampler is acquired in the default executor so that the event loop keeps running. The region itself
+        is opened on the thread of the event loop, which runs the coroutine. A task cancelled while the sampler
+        is being acquired releases it once acquired.
+
+        Returns:
+            Region handle of the measurement, holding its report once the block is left.
+        """
+        arguments = self.__pending_arguments()
+        thread_id = threading.get_ident()
+        parent = self.current_region()
+        acquiring = asyncio.get_running_loop().run_in_executor(None, self.power.acquire)
+        try:
+            started = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # no region will release the sampler: release it once the acquire completes
+            acquiring.add_done_callback(self.__release_acquired)
+            raise
+        region = self.region(*arguments, parent=parent, thread_id=thread_id, started=started)
+        self.__set_task_regions(self.__task_regions() + (region,))
+        return region
+
+    async def __aexit__(self, exit_type, value, traceback):
+        """
+        Exit method for asynchronous context manager. The report of the region is built and queued
+        in the default executor, so that the event loop keeps running.
+        """
+        regions = self.__task_regions()
+        self.__set_task_regions(regions[:-1])
+        await asyncio.get_running_loop().run_in_executor(None, regions[-1].stop)
+
+    def __release_acquired(self, acquiring):
+        """
+        Release the sampler acquired for a task cancelled while entering its region, in the default executor.
+        """
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            acquiring.get_loop().run_in_executor(None, self.power.release)
+
+    def __task_regions(self):
+        """
+        Get the stack of the regions of this instance opened by the current asyncio task.
+        """
+        return _REGIONS.get().get(id(self), ())
+
+    def __set_task_regions(self, regions):
+        """
+        Set the stack of the regions of this instance opened by the current asyncio task, leaving other instances untouched.
+        """
+        stacks = dict(_REGIONS.get())
+        if regions:
+            stacks[id(self)] = regions
+        else:
+            stacks.pop(id(self), None)
+        _REGIONS.set(stacks)
+
+    def current_region(self):
+        """
+        Get the innermost region opened by the calling asyncio task (or thread), e.g. to tag the logs of a request.
+
+        Returns:
+            Region handle, None outside of any region.
+        """
+        regions = self.__task_regions() or getattr(self.local, "regions", ())
+        return regions[-1] if regions else None
+
+    def region(self, package, algorithm, algorithm_description="", work=None, work_unit="item", parent=None,
+               thread_id=None, started=None):
+        """
+        Open an independent measured region. Any number of threads can open and close regions concurrently:
+        they share one sampler, started by the first open region and stopped by the last closed one,
+        and the report of each region is computed over its own time window.
+
+        Parameters:
+            package (str): Package name of the algorithm to profile.
+            algorithm (str): Name of the algorithm to profile.
+            algorithm_description (str): Description of the profiled algorithm.
+            work (float): Units of work done in the region (samples, tokens, requests, FLOPs). The report then gets
+                the energy per unit of work, average power, EDP and ED2P of every device.
+            work_unit (str): Name of the unit of work.
+            parent (Region): Enclosing region, the innermost region of the calling task or thread by default.
+            thread_id (int): Identifier of the thread running the region, the calling thread by default.
+            started (bool): Result of a `PowerWrapper.acquire` already done for the region (e.g. in an executor),
+                None to acquire the sampler here.
+        Returns:
+            Region handle. Call its `stop()` method (or use it as a context manager) to record the region.
+        """
+        return Region(
+            self.power, package, algorithm, algorithm_description, work, work_unit,
+            parent=parent if parent is not None else self.current_region(),
+            on_start=self.__on_region_start, on_stop=self.__on_region_stop, thread_id=thread_id, started=started,
+            on_sampler_stop=self.__on_sampler_stop,
+        )
+
+    def add_work(self, count):
+        """
+        Count units of work done in the innermost region of the calling task or thread.
+
+        Parameters:
+            count (float): Units of work to add.
+        """
+        region = self.current_region()
+        if region is None:
+            raise RuntimeError("add_work called outside of a measured region")
+        region.add_work(count)
+
+    def subscribe(self, callback=None, capacity=1024, policy="drop_oldest", batch_size=64, max_latency=0.5, devices=None):
+        """
+        Subscribe to the live samples of the sampler, e.g. to log them, export them or stop a job over an energy budget.
+        Slow subscribers never stall the sampling (see PowerWrapper.subscribe).
+
+        Parameters:
+            callback (callable): Function receiving every batch of samples on its own thread, None to pull them.
+            capacity (int): Number of samples the queue of the subscriber holds.
+            policy (str): Policy of a full queue among "drop_oldest", "block" and "coalesce".
+            batch_size (int): Largest number of samples of a batch.
+            max_latency (float): Longest time in seconds a batch waits to be filled.
+            devices (list): Device types (cpu, gpu, ram) to receive, every device by default.
+        Returns:
+            Subscription, to end with `unsubscribe`.
+        """
+        return self.power.subscribe(callback, capacity, policy, batch_size, max_latency, devices)
+
+    def unsubscribe(self, subscription, drain=True, timeout=None):
+        """
+        End a subscription, delivering its queued samples unless `drain` is false.
+        """
+        self.power.unsubscribe(subscription, drain, timeout)
+
+    def sampler_stats(self, start=None, end=None):
+        """
+        Get the cost of the sampler since it was last started, or over a time window.
+
+        Parameters:
+            start (float): Start of the window in seconds since the epoch.
+            end (float): End of the window in seconds since the epoch.
+        Returns:
+            Dictionary with the number of ticks and missed deadlines, the mean and p99 tick duration in milliseconds,
+            and the CPU time of the sampling thread and of its subprocesses (see SamplerStats.summary). Every count
+            is zero when the "sampler_stats" configuration entry is false.
+        """
+        return self.power.sampler_stats.summary(start, end)
+
+    def benchmark(self, func, repeats=10, warmup=1, interleave=False, seed=None, package="benchmark", algorithm=None,
+                  algorithm_description="", work=None, work_unit="item", confidence=0.95, resamples=1000, args=(), kwargs=None):
+        """
+        Measure repeated runs of one or several functions on one sampler, and summarize their energy and time with the
+        median, the interquartile range, a bootstrap confidence interval of the median and the number of outliers.
+        The whole benchmark is recorded as one region, each run being a time window of its samples.
+
+        Parameters:
+            func (callable): Function to benchmark, or a list or a dictionary of named candidate functions to compare.
+            repeats (int): Number of measured runs of every function.
+            warmup (int): Number of unmeasured runs of every function before the measured ones.
+            interleave (bool): Run the repetitions of the candidates in a random interleaved order.
+            seed (int): Seed of the order of the runs and of the bootstrap.
+            package (str): Package name of the region of the benchmark.
+            algorithm (str): Name of the region of the benchmark, the names of the candidates by default.
+            algorithm_description (str): Description of the benchmark.
+            work (float): Units of work done by each run, for the energy per unit of work.
+            work_unit (str): Name of the unit of work.
+            confidence (float): Level of the bootstrap confidence intervals.
+            resamples (int): Number of bootstrap resamples.
+            args (tuple): Positional arguments of every call.
+            kwargs (dict): Keyword arguments of every call.
+        Returns:
+            BenchmarkResult with the `runs` and their `summary()`.
+        """
+        if callable(func):
+            func = [func]
+        if not isinstance(func, dict):
+            func = {getattr(candidate, "__name__", repr(candidate)): candidate for candidate in func}
+        candidates = {name: functools.partial(candidate, *args, **(kwargs or {})) for name, candidate in func.items()}
+
+        def on_run(name, start, end):
+            if self.chrome_trace is not None:
+                self.chrome_trace.complete(name, start, end, category="benchmark")
+
+        with self.region(package, algorithm or ", ".join(candidates), algorithm_description):
+            result = run_benchmark(
+                self.power, candidates, repeats, warmup, interleave, seed, work, work_unit, confidence, resamples, on_run,
+            )
+        if self.print_to_cli:
+            print("Benchmark summary : \n\n")
+            print(result.summary())
+        return result
+
+    def __on_region_start(self, region, started):
+        """
+        Register the thread of a new region on the profiler, and reset the listeners when the sampler was started for it.
+        """
+        with self.power.lock:
+            if self.profiler is not None:
+                if started:
+                    self.profiler.reset([region.thread_id])
+                elif not self.profiler.all_threads:
+                    self.profiler.thread_ids.add(region.thread_id)
+            if self.chrome_trace is not None and started:
+                self.chrome_trace.reset()
+
+    def __on_sampler_stop(self, region):
+        """
+        Export the timeline and the energy flame graph of the whole measurement once the last region stopped the
+        sampler, so that closing a region never re-exports the samples of the regions before it.
+        """
+        self.__export_timeline(region)
+        self.__export_profile(region)
+
+    def __on_region_stop(self, region):
+        """
+        Print and queue the report of a closed region, and add it to the Chrome trace.
+        """
+        self.power.record = region.record
+        if self.chrome_trace is not None:
+            self.chrome_trace.complete(
+                region.algorithm, region.start_time, region.end_time, category=region.package or "region",
+                tid=region.thread_id, description=region.algorithm_description,
+                **{str(name): value for name, value in region.record.iloc[0].items()}
+            )
+
+        if self.print_to_cli :
+            self.writer.echo("Energy report for the experiment : \n\n", region.record.copy())
+
+        self.__log_records(
+            region.record,
+            algorithm=region.algorithm,
+            package=region.package,
+            algorithm_description=region.algorithm_description,
+        )
+
+    def start_measure(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
-        Start measuring power consumption.
+        Start measuring power consumption. Measurements started by different threads are independent,
+        and measurements nested in the same thread are stopped in reverse order.
 
         Parameters:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
-
+            work (float): Units of work done in the region, for the efficiency metrics.
+            work_unit (str): Name of the unit of work.
+        Returns:
+            Region handle of the measurement.
         """
-        self.power.start()
         self.__set_used_arguments(
             package,
             algorithm,
             algorithm_description=algorithm_description,
         )
+        region = self.region(package, algorithm, algorithm_description, work, work_unit)
+        self.local.regions = getattr(self.local, "regions", ()) + (region,)
+        return region
 
     def stop_measure(self):
         """
-        Stop measuring power consumption.
-        """
-        self.power.stop()
-
-        if self.print_to_cli :
-            print("Energy report for the experiment : \n\n")
-            print(self.power.record)
+        Stop the last measurement started by this thread. The report is queued to the background writer, so this method
+        returns without waiting on the disk. Use `flush()` when the output file must be up to date.
 
-        self.__log_records(
-            self.power.record,
-            algorithm=self.used_algorithm,
-            package=self.used_package,
-            algorithm_description=self.used_algorithm_description,
-        )
+        Returns:
+            Report of the measurement.
+        """
+        regions = getattr(self.local, "regions", ())
+        if not regions:
+            raise RuntimeError("stop_measure called without a matching start_measure in this thread")
+        self.local.regions = regions[:-1]
+        return regions[-1].stop()
 
     def __record_data_to_file(self, data):
         """
-        Record power data to a file.
+        Queue power data to be recorded to a file by the background writer.
 
         Parameters:
             data (DataFrame): Power data to be recorded.
         Returns:
-            True if recording is successful, False otherwise.
+            True if the data was queued, False otherwise.
+        """
+        return self.writer.submit(data)
+
+    def flush(self, timeout=None):
+        """
+        Block until every measurement recorded so far is written to the output file.
+
+        Parameters:
+            timeout (float): Maximum time in seconds to wait, None to wait forever.
+        Returns:
+            True if the pending records were written in time, False otherwise.
+        """
+        return self.writer.flush(timeout)
+
+    def span(self, name, **args):
+        """
+        Context manager writing a nested user span (e.g. "data loading") to the Chrome trace, if one was requested.
+
+        Parameters:
+            name (str): Name of the span.
+            args: Arguments shown in the details of the span.
+        """
+        if self.chrome_trace is None:
+            return contextlib.nullcontext()
+        return self.chrome_trace.span(name, category="user", **args)
+
+    def event(self, name, **args):
+        """
+        Write a user instant event (e.g. "checkpoint saved") to the Chrome trace, if one was requested.
+
+        Parameters:
+            name (str): Name of the event.
+            args: Arguments shown in the details of the event.
+        """
+        if self.chrome_trace is not None:
+            self.chrome_trace.instant(name, category="user", **args)
+
+    def __format_filepath(self, template, region=None):
+        """
+        Substitute the {package}, {algorithm}, {datetime} and {pid} placeholders of an output path template,
+        with the tags of a region when given.
+        """
+        return str(template).format(
+            package=region.package if region else self.used_package,
+            algorithm=region.algorithm if region else self.used_algorithm,
+            datetime=datetime.datetime.now().strftime("%Y%m%d-%H%M%S"),
+            pid=os.getpid(),
+        )
+
+    def __export_timeline(self, region):
         """
+        Export every timestamped sample of the shared sampler to the timeline file once it is stopped, if one was requested.
+        """
+        if self.timeline_filepath is None:
+            return
         try:
-            if self.output_filepath.exists():
-                data.to_csv(self.output_filepath, mode="a", index=False, header=False)
-            else:
-                data.to_csv(self.output_filepath, index=False)
-            return True
+            write_timeline(self.power.samples, self.__format_filepath(self.timeline_filepath, region))
+        except Exception as e:
+            LOGGER.error("Error during the timeline export: %s", str(e))
+
+    def __export_profile(self, region):
+        """
+        Write the energy flame graph of the shared sampler once it is stopped, if one was requested.
+        """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.write(self.__format_filepath(self.profile_filepath, region))
         except Exception as e:
-            LOGGER.error("Error during the CSV writing process: %s", str(e))
-            LOGGER.error(traceback.format_exc())
-            return False
+            LOGGER.error("Error during the energy profile export: %s", str(e))
 
     def __log_records(self, recorded_power, algorithm="", package="", algorithm_description=""):
         """
@@ -242,4 +627,4 @@ class PowerMeter:
                 axis=1,
             )
         )
-        LOGGER.info("Recorded into a file? %s", written)
+        LOGGER.info("Queued for recording into a file? %s", written)
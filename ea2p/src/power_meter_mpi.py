@@ -4,11 +4,17 @@
 __all__ = ["PowerMeterMPI"]
 
 from mpi4py import MPI
+import contextlib
 import datetime
 import pandas as pd
 import logging
-import traceback
-from .wrapper import * 
+import threading
+from .wrapper import *
+from .writer import get_result_writer
+from .export import write_timeline
+from .profiler import EnergyProfiler
+from .chrome_trace import ChromeTraceWriter
+from .metrics import aggregate_reports
 
 LOGGER = logging.getLogger(__name__)
 
@@ -22,13 +28,19 @@ class PowerMeterMPI:
         DATETIME_FORMAT (str): The format for datetime objects.
         DEFAULT_CONFIG_FILE (str): The default configuration file name to use for wrapper.
         DEFAULT_OUTPUT_FILEPATH (str): The default output file path to save results.
+        DEFAULT_SQLITE_FILEPATH (str): The default output file path when results are saved in SQLite.
         LOGGING_FILE (str): The filename for the experimentation logging file.
         project_name (str): Name of the experimentation project.
         config_file (str): Path to the configuration file for the wrapper initialisation.
         output_filepath (str): Path to the output file for results of profiling.
-        output_format (str): Format for the output file (e.g. csv).
+        output_format (str): Format for the output file (csv or sqlite).
         print_to_cli (bool): Flag to print the result of measurement in Terminal at the end (default True).
+        timeline_filepath (str): Path template of the optional Parquet/Arrow export of every timestamped sample.
+        profile_filepath (str): Path template of the optional energy flame graph (collapsed stacks weighted by energy).
+        profiler (EnergyProfiler): Sampler of the Python stacks of the measuring thread, when a profile is requested.
+        chrome_trace (ChromeTraceWriter): Optional Chrome trace receiving the regions, user spans and events, and the power counters.
         power (PowerWrapper): Instance of PowerWrapper class for power measurement.
+        writer (ResultWriter): Background writer shared by the instances recording into the same output file.
         used_package (str): Name of the package of algorithm to profile during power measurement.
         used_algorithm (str): Name of the profiled algorithm for power measurement.
         used_algorithm_description (str): Description of the algorithm used during power measurement.
@@ -43,16 +55,24 @@ class PowerMeterMPI:
         __exit__: Exit method for context manager. Stops power measurement.
         start_measure: Start measuring power consumption.
         stop_measure: Stop measuring power consumption.
-        __record_data_to_file: Record power data to a file.
+        add_work: Count units of work done by the rank in the current measurement.
+        __record_data_to_file: Queue power data to be recorded to a file.
+        flush: Wait until the queued power data is written to the output file.
         __log_records: Log recorded power data.
+        __format_filepath: Substitute the placeholders of an output path template.
+        __export_timeline: Export every timestamped sample of the last measurement.
+        __export_profile: Write the energy flame graph of the last measurement.
+        span: Context manager writing a nested user span to the Chrome trace.
+        event: Write a user instant event to the Chrome trace.
     """
 
     DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"
     DEFAULT_CONFIG_FILE = "config_energy.json"
     DEFAULT__OUTPUT_FILEPATH = "energy_report.csv"
+    DEFAULT_SQLITE_FILEPATH = "energy_report.sqlite"
     LOGGING_FILE = "logging_file.txt"
 
-    def __init__(self, project_name="test_project", output_filepath=None, config_file=None, output_format="csv", print_to_cli=True):
+    def __init__(self, project_name="test_project", output_filepath=None, config_file=None, output_format="csv", print_to_cli=True, timeline_filepath=None, profile_filepath=None, chrome_trace_filepath=None):
         """
         Initialize the PowerMeter instance. This initialization is done on every node of the system.
 
@@ -60,20 +80,40 @@ class PowerMeterMPI:
             config_file (str): Path to the configuration file.
             project_name (str): Name of the project.
             output_filepath (str): Path to the output file.
-            output_format (str): Format for the output file.
-            print_to_cli (bool): To print the result of measurement in Terminal at the end
+            output_format (str): Format for the output file, "csv" (default) or "sqlite" for an indexed SQLite database (see SQLiteResultStore).
+                Other formats fall back to csv with a warning.
+            print_to_cli (bool): To print the result of measurement in Terminal at the end, from the background writer
+            timeline_filepath (str): Optional Parquet (.parquet) or Arrow IPC (.arrow) file receiving every timestamped sample of each measurement.
+                The path may contain {package}, {algorithm} and {datetime} placeholders to keep one file per measurement, and a {rank} placeholder (added before the suffix when missing).
+            profile_filepath (str): Optional file receiving the energy flame graph of each measurement, in the collapsed-stack format
+                of flamegraph.pl and speedscope, weighted in millijoules. Same placeholders as timeline_filepath.
+            chrome_trace_filepath (str): Optional Chrome Trace Event JSON file (opened by chrome://tracing or ui.perfetto.dev) streaming
+                the measured regions, the user spans and events and the power of every sensor. The path may contain a {pid} placeholder and a {rank} placeholder (added before the suffix when missing).
         """
         self.project_name = project_name
         self.config_file = Path(config_file) if config_file else Path.cwd() / self.DEFAULT_CONFIG_FILE
-        self.output_filepath = Path(output_filepath) if output_filepath else Path.cwd() / self.DEFAULT__OUTPUT_FILEPATH
-        self.output_format = output_format
+        self.output_format = output_format.lower()
+        default_filepath = self.DEFAULT_SQLITE_FILEPATH if self.output_format == "sqlite" else self.DEFAULT__OUTPUT_FILEPATH
+        self.output_filepath = Path(output_filepath) if output_filepath else Path.cwd() / default_filepath
         self.print_to_cli = print_to_cli
+        self.timeline_filepath = timeline_filepath
+        self.profile_filepath = profile_filepath
 
         self.power = PowerWrapper(self.config_file)
+        self.writer = get_result_writer(self.output_filepath, self.output_format)
+        if self.timeline_filepath is not None:
+            # the exported timeline needs every raw sample, none are rolled into tiers
+            self.power.samples.raw_capacity = None
+        self.profiler = None
+        if self.profile_filepath is not None:
+            self.profiler = EnergyProfiler(self.power.samples, **self.power.profile_options)
+            self.power.listeners.append(self.profiler)
 
         self.used_package = ""
         self.used_algorithm = ""
         self.used_algorithm_description = ""
+        self.work = None
+        self.work_unit = "item"
 
         self.logging_filename = PACKAGE_PATH / self.LOGGING_FILE
 
@@ -81,8 +121,16 @@ class PowerMeterMPI:
         self.comm = MPI.COMM_WORLD
         self.rank = self.comm.Get_rank()
         self.size = self.comm.Get_size()
+        self.power.samples.rank = self.rank
 
-    def measure_power(self, package, algorithm, algorithm_description=""):
+        self.chrome_trace = None
+        if chrome_trace_filepath is not None:
+            self.chrome_trace = ChromeTraceWriter(
+                self.__format_filepath(chrome_trace_filepath), pid=self.rank, process_name=self.project_name + " rank " + str(self.rank),
+            )
+            self.power.listeners.append(self.chrome_trace)
+
+    def measure_power(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
         Decorator to measure power consumption during the execution of a function.
 
@@ -90,6 +138,8 @@ class PowerMeterMPI:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
+            work (float): Units of work done by the rank, for the efficiency metrics.
+            work_unit (str): Name of the unit of work (e.g. "sample", "token", "request", "FLOP").
         Returns:
             Decorator function.
         """
@@ -106,6 +156,8 @@ class PowerMeterMPI:
                     package,
                     algorithm,
                     algorithm_description=algorithm_description,
+                    work=work,
+                    work_unit=work_unit,
                 )
                 try:
                     results = func(*args, **kwargs)
@@ -131,7 +183,7 @@ class PowerMeterMPI:
         self.used_algorithm = algorithm
         self.used_algorithm_description = algorithm_description
 
-    def __call__(self, package, algorithm, algorithm_description=""):
+    def __call__(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
         Set the arguments used during power measurement using a decorator syntax.
 
@@ -139,9 +191,13 @@ class PowerMeterMPI:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
+            work (float): Units of work done by the rank, for the efficiency metrics.
+            work_unit (str): Name of the unit of work (e.g. "sample", "token", "request", "FLOP").
 
         """
         self.__set_used_arguments(package, algorithm, algorithm_description=algorithm_description)
+        self.work = work
+        self.work_unit = work_unit
         return self
 
     def __enter__(self):
@@ -152,6 +208,8 @@ class PowerMeterMPI:
             self.used_package,
             self.used_algorithm,
             algorithm_description=self.used_algorithm_description,
+            work=self.work,
+            work_unit=self.work_unit,
         )
 
     def __exit__(self, exit_type, value, traceback):
@@ -160,7 +218,7 @@ class PowerMeterMPI:
         """
         self.stop_measure()
 
-    def start_measure(self, package, algorithm, algorithm_description=""):
+    def start_measure(self, package, algorithm, algorithm_description="", work=None, work_unit="item"):
         """
         Start measuring power consumption on each MPI rank. 
 
@@ -168,20 +226,42 @@ class PowerMeterMPI:
             package (str): Package name of the algorithm to profile.
             algorithm (str): Name of the algorithm to profile in the list of instruction of the decorated function.
             algorithm_description (str): Description of the profiled algorithm acording to the experimental setup or tesbet details (eg, dataset used, epochs for training, batch size, etc...).
+            work (float): Units of work done by the rank, for the efficiency metrics.
+            work_unit (str): Name of the unit of work (e.g. "sample", "token", "request", "FLOP").
 
         """
+        if self.profiler is not None:
+            self.profiler.reset([threading.get_ident()])
+        if self.chrome_trace is not None:
+            self.chrome_trace.reset()
+            self.chrome_trace.begin(algorithm, category=package or "region", description=algorithm_description)
         self.power.start()
         self.__set_used_arguments(
             package,
             algorithm,
             algorithm_description=algorithm_description,
         )
+        self.work = work
+        self.work_unit = work_unit
+
+    def add_work(self, count):
+        """
+        Count units of work done by the rank in the current measurement.
+
+        Parameters:
+            count (float): Units of work to add.
+        """
+        self.work = (self.work or 0) + count
 
     def stop_measure(self):
         """
         Stop measuring power consumption and gather results from all MPI processes.
         """
-        self.power.stop()
+        self.power.stop(self.work, self.work_unit)
+        self.__export_timeline()
+        self.__export_profile()
+        if self.chrome_trace is not None:
+            self.chrome_trace.end(**{str(name): value for name, value in self.power.record.iloc[0].items()})
         local_record = self.power.record
 
         # Add rank number to local record
@@ -199,19 +279,15 @@ class PowerMeterMPI:
                 # Concatenate data from all processes, preserving the original ranks
                 global_record = pd.concat(global_record, ignore_index=True)
 
-                # Compute total energy and add the 'Rank' column for the total row
-                total_energy = global_record.sum(numeric_only=True)
-                total_energy['Rank'] = 'Total'
-                total_energy_row = pd.DataFrame([total_energy], columns=global_record.columns)
-                total_energy_row = total_energy_row.round(5)
+                # Compute the total row: summed energies and work, efficiency metrics of the totals
+                total_energy_row = aggregate_reports(global_record, self.power.energy_unit, label_column='Rank')
 
                 # Append the total row to the global record
                 global_record = pd.concat([global_record, total_energy_row], ignore_index=True)
 
                 # Print the result if required
                 if self.print_to_cli:
-                    print("Energy report for the experiment:\n")
-                    print(global_record)
+                    self.writer.echo("Energy report for the experiment:\n", global_record.copy())
 
                 # Log the results
                 self.__log_records(
@@ -225,23 +301,87 @@ class PowerMeterMPI:
 
     def __record_data_to_file(self, data):
         """
-        Record power data to a file.
+        Queue power data to be recorded to a file by the background writer.
 
         Parameters:
             data (DataFrame): Power data to be recorded.
         Returns:
-            True if recording is successful, False otherwise.
+            True if the data was queued, False otherwise.
+        """
+        return self.writer.submit(data)
+
+    def flush(self, timeout=None):
+        """
+        Block until every measurement recorded so far is written to the output file.
+
+        Parameters:
+            timeout (float): Maximum time in seconds to wait, None to wait forever.
+        Returns:
+            True if the pending records were written in time, False otherwise.
+        """
+        return self.writer.flush(timeout)
+
+    def span(self, name, **args):
+        """
+        Context manager writing a nested user span (e.g. "data loading") to the Chrome trace, if one was requested.
+
+        Parameters:
+            name (str): Name of the span.
+            args: Arguments shown in the details of the span.
         """
+        if self.chrome_trace is None:
+            return contextlib.nullcontext()
+        return self.chrome_trace.span(name, category="user", **args)
+
+    def event(self, name, **args):
+        """
+        Write a user instant event (e.g. "checkpoint saved") to the Chrome trace, if one was requested.
+
+        Parameters:
+            name (str): Name of the event.
+            args: Arguments shown in the details of the event.
+        """
+        if self.chrome_trace is not None:
+            self.chrome_trace.instant(name, category="user", **args)
+
+    def __format_filepath(self, template):
+        """
+        Substitute the {package}, {algorithm}, {datetime}, {pid} and {rank} placeholders of an output path template,
+        adding the rank before the suffix when the template has no {rank} placeholder.
+        """
+        filepath = str(template)
+        if "{rank}" not in filepath:
+            path = Path(filepath)
+            filepath = str(path.with_name(path.stem + "_rank{rank}" + path.suffix))
+        return filepath.format(
+            package=self.used_package,
+            algorithm=self.used_algorithm,
+            datetime=datetime.datetime.now().strftime("%Y%m%d-%H%M%S"),
+            rank=self.rank,
+            pid=os.getpid(),
+        )
+
+    def __export_timeline(self):
+        """
+        Export every timestamped sample of the last measurement to the timeline file, if one was requested.
+        """
+        if self.timeline_filepath is None:
+            return
         try:
-            if self.output_filepath.exists():
-                data.to_csv(self.output_filepath, mode="a", index=False, header=False)
-            else:
-                data.to_csv(self.output_filepath, index=False)
-            return True
+            write_timeline(self.power.samples, self.__format_filepath(self.timeline_filepath))
+        except Exception as e:
+            LOGGER.error("Error during the timeline export: %s", str(e))
+
+    def __export_profile(self):
+        """
+        Write the energy flame graph of the last measurement, if one was requested.
+        """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.write(self.__format_filepath(self.profile_filepath))
         except Exception as e:
-            LOGGER.error("Error during the CSV writing process: %s", str(e))
-            LOGGER.error(traceback.format_exc())
-            return False
+            LOGGER.error("Error during the energy profile export: %s", str(e))
 
     def __log_records(self, recorded_power, algorithm="", package="", algorithm_description=""):
         """
@@ -269,5 +409,5 @@ class PowerMeterMPI:
                 axis=1,
             )
         )
-        LOGGER.info("Recorded into a file? %s", written)
+        LOGGER.info("Queued for recording into a file? %s", written)
 
@@ -0,0 +1,244 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+RAPL power capping through the Linux powercap interface, and sweeps looking for the power cap with the best
+energy-to-solution of a job.
+"""
+__all__ = ["PowerCap", "SweepResult", "pareto_front", "sweep"]
+
+import contextlib
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from .metrics import ENERGY_UNITS, device_energies
+
+LOGGER = logging.getLogger(__name__)
+
+POWERCAP_ROOT = Path("/sys/class/powercap")
+INTEL_RAPL_ZONE = "intel-rapl:*"
+CAP_COLUMN = "Cap [W]"
+DURATION_COLUMN = "Duration [s]"
+ENERGY_COLUMN = "Energy [J]"
+UNCAPPED = "uncapped"
+
+
+def _microwatts(path):
+    return int(Path(path).read_text().strip())
+
+
+class PowerCap:
+    """
+    PowerCap
+    ---------
+
+    Power limits of the RAPL package zones of the Intel powercap backend (`intel-rapl:N`), set by writing
+    `constraint_<i>_power_limit_uw`. Writing the limits usually requires root.
+
+    Attributes:
+        root (Path): Root of the powercap tree, `/sys/class/powercap` by default (a fake tree in tests).
+        constraint (int): Index of the constraint to set (0 is the long term limit, 1 the short term one).
+        zones (list): Directories of the package zones.
+    """
+
+    def __init__(self, root=POWERCAP_ROOT, constraint=0, zones=None):
+        """
+        Initialize the PowerCap instance.
+
+        Parameters:
+            root (str): Root of the powercap tree.
+            constraint (int): Index of the constraint to set.
+            zones (list): Names of the zones to cap (e.g. ["intel-rapl:0"]), every package zone by default.
+        """
+        self.root = Path(root)
+        self.constraint = constraint
+        if zones is None:
+            self.zones = sorted(path for path in self.root.glob(INTEL_RAPL_ZONE) if path.name.count(":") == 1)
+        else:
+            self.zones = [self.root / zone for zone in zones]
+        if not self.zones:
+            raise FileNotFoundError("No Intel RAPL powercap zone found under %s" % self.root)
+
+    def __file(self, zone, name):
+        return zone / ("constraint_%d_%s" % (self.constraint, name))
+
+    def limits(self):
+        """
+        Returns:
+            Dictionary mapping the zone names to their current power limit in microwatts.
+        """
+        return {zone.name: _microwatts(self.__file(zone, "power_limit_uw")) for zone in self.zones}
+
+    def max_power(self):
+        """
+        Returns:
+            Dictionary mapping the zone names to the highest limit they accept in microwatts, None when unknown.
+        """
+        maxima = {}
+        for zone in self.zones:
+            path = self.__file(zone, "max_power_uw")
+            maxima[zone.name] = _microwatts(path) if path.exists() else None
+        return maxima
+
+    def set_limits(self, limits):
+        """
+        Write the power limit of every zone.
+
+        Parameters:
+            limits (dict): Dictionary mapping the zone names to their power limit in microwatts.
+        """
+        for zone in self.zones:
+            if zone.name not in limits:
+                continue
+            try:
+                self.__file(zone, "power_limit_uw").write_text("%d\n" % limits[zone.name])
+            except PermissionError as e:
+                raise PermissionError("Setting RAPL power limits requires write access to %s (run as root)" % zone) from e
+
+    def set_cap(self, watts):
+        """
+        Cap every zone to the same power limit.
+
+        Parameters:
+            watts (float): Power limit of each package in Watt.
+        """
+        maxima = self.max_power()
+        limits = {}
+        for zone in self.zones:
+            limit = int(round(watts * 1e6))
+            if maxima[zone.name] and limit > maxima[zone.name]:
+                raise ValueError("%s W is above the maximum power limit of %s (%s W)" % (watts, zone.name, maxima[zone.name] / 1e6))
+            limits[zone.name] = limit
+        self.set_limits(limits)
+
+    @contextlib.contextmanager
+    def capped(self, watts):
+        """
+        Context manager running a block of code under a power cap, and restoring the previous limits afterwards,
+        even when the block fails.
+
+        Parameters:
+            watts (float): Power limit of each package in Watt, None to keep the current limits.
+        """
+        original = self.limits()
+        try:
+            if watts is not None:
+                self.set_cap(watts)
+            yield self
+        finally:
+            self.set_limits(original)
+
+
+def pareto_front(results, x=DURATION_COLUMN, y=ENERGY_COLUMN):
+    """
+    Find the runs that no other run beats on both time and energy.
+
+    Parameters:
+        results (DataFrame): One row per run.
+        x (str): First objective, to minimize.
+        y (str): Second objective, to minimize.
+    Returns:
+        Boolean Series, True for the rows on the Pareto front.
+    """
+    front = pd.Series(False, index=results.index)
+    best = np.inf
+    for index in results.sort_values([x, y]).index:
+        if results.at[index, y] < best:
+            front[index] = True
+            best = results.at[index, y]
+    return front
+
+
+class SweepResult:
+    """
+    SweepResult
+    ---------
+
+    Energy and time of a job at every power cap of a sweep.
+
+    Attributes:
+        runs (DataFrame): One row per run: cap, repetition, duration, energy of every device and total energy in Joule.
+        results (DataFrame): One row per cap with the median duration, energy and average power of its runs,
+            and whether it is on the Pareto front of time and energy.
+    """
+
+    def __init__(self, runs):
+        """
+        Initialize the SweepResult instance.
+
+        Parameters:
+            runs (DataFrame): One row per run.
+        """
+        self.runs = runs
+        results = runs.drop(columns=["Repeat"]).groupby(CAP_COLUMN, sort=False).median()
+        results["Average power [W]"] = results[ENERGY_COLUMN] / results[DURATION_COLUMN]
+        results["Pareto"] = pareto_front(results)
+        self.results = results.reset_index().round(5)
+
+    def best(self):
+        """
+        Returns:
+            Row of the cap with the lowest energy-to-solution.
+        """
+        return self.results.loc[self.results[ENERGY_COLUMN].idxmin()]
+
+    def pareto(self):
+        """
+        Returns:
+            Rows of the caps on the Pareto front, from the fastest to the most frugal.
+        """
+        return self.results[self.results["Pareto"]].sort_values(DURATION_COLUMN).reset_index(drop=True)
+
+    def __repr__(self):
+        return repr(self.results)
+
+
+def sweep(meter, func, caps, repeats=1, package="powercap", algorithm=None, algorithm_description="",
+          root=POWERCAP_ROOT, constraint=0, zones=None, settle=1.0, args=(), kwargs=None):
+    """
+    Run a job under every power cap of a sweep and measure its energy and time with a PowerMeter.
+    The original power limits are restored afterwards, also when the job fails or is interrupted.
+
+    Parameters:
+        meter (PowerMeter): PowerMeter measuring the runs. Each run is recorded as a region with its cap in the description.
+        func (callable): The job.
+        caps (list): Power limits of each package in Watt to try. None runs the job under the current limits.
+        repeats (int): Number of runs at every cap, the results being their medians.
+        package (str): Package name of the recorded regions.
+        algorithm (str): Name of the recorded regions, the name of the job by default.
+        algorithm_description (str): Description of the job, completed with the cap of each run.
+        root (str): Root of the powercap tree.
+        constraint (int): Index of the constraint to set (0 is the long term limit).
+        zones (list): Names of the zones to cap, every package zone by default.
+        settle (float): Time in seconds left to the package to reach its new power limit before each run.
+        args (tuple): Positional arguments of the job.
+        kwargs (dict): Keyword arguments of the job.
+    Returns:
+        SweepResult.
+    """
+    powercap = PowerCap(root, constraint, zones)
+    algorithm = algorithm or getattr(func, "__name__", "job")
+    joules = ENERGY_UNITS.get(str(meter.power.energy_unit).lower(), ENERGY_UNITS["wh"])[1]
+    rows = []
+    original = powercap.limits()
+    try:
+        for cap in caps:
+            with powercap.capped(cap):
+                time.sleep(settle)
+                for repeat in range(repeats):
+                    description = "%s power cap %s" % (algorithm_description, "%s W" % cap if cap is not None else UNCAPPED)
+                    with meter.region(package, algorithm, description.strip()) as region:
+                        func(*args, **(kwargs or {}))
+                    energies = device_energies(region.record, meter.power.sensor_devices)
+                    row = {CAP_COLUMN: cap if cap is not None else UNCAPPED, "Repeat": repeat,
+                           DURATION_COLUMN: region.end_time - region.start_time}
+                    row.update({"Energy [J] (%s)" % device: energy * joules for device, energy in energies.items()})
+                    row[ENERGY_COLUMN] = sum(energies.values()) * joules
+                    rows.append(row)
+                    LOGGER.info("Power cap %s: %.3f s, %.3f J", row[CAP_COLUMN], row[DURATION_COLUMN], row[ENERGY_COLUMN])
+    finally:
+        powercap.set_limits(original)
+    return SweepResult(pd.DataFrame(rows))
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Energy flame graphs: Python stacks sampled by the PowerWrapper thread, weighted by the energy of each interval.
+"""
+__all__ = ["EnergyProfiler"]
+
+import logging
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .metrics import _device
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EnergyProfiler:
+    """
+    EnergyProfiler
+    ---------
+
+    Sample the Python stacks of the measured threads from the PowerWrapper sampling thread and charge the energy of
+    each interval to the stacks sampled at its end, like a sampling profiler weighted by Joules instead of samples.
+    The energy of an interval is the one of every device, RAPL core and uncore planes being counted in their package.
+
+    The profiler is a PowerWrapper listener: stacks are captured with `sys._current_frames()` at most once per
+    `interval` seconds, and only the frame labels are kept (interned) during the run. The energy of the intervals
+    is computed once at the end from the samples, so the sampler only pays for the stack walks. Their cost is
+    bounded by `max_depth` and by `max_overhead`, the largest share of the wall time spent capturing stacks:
+    captures are skipped when it would be exceeded.
+
+    The result is written in the collapsed-stack format read by flamegraph.pl, inferno and speedscope,
+    one "frame;frame;frame weight" line per distinct stack.
+
+    Attributes:
+        samples (SampleStore): Samples of the PowerWrapper, used to compute the energy of each interval.
+        interval (float): Minimum time between two stack captures in seconds (0 captures at every sampler tick).
+        max_depth (int): Maximum number of frames kept per stack, from the innermost one.
+        max_overhead (float): Maximum share of the wall time spent capturing stacks.
+        all_threads (bool): Whether every thread but the sampler is profiled, instead of the threads given at reset.
+        thread_ids (set): Identifiers of the profiled threads, every thread but the sampler when empty.
+        overhead (float): Time spent capturing stacks since the last reset, in seconds.
+    """
+
+    def __init__(self, samples, interval=0.0, max_depth=64, max_overhead=0.05, all_threads=False):
+        """
+        Initialize the EnergyProfiler instance.
+
+        Parameters:
+            samples (SampleStore): Samples of the PowerWrapper.
+            interval (float): Minimum time between two stack captures in seconds.
+            max_depth (int): Maximum number of frames kept per stack.
+            max_overhead (float): Maximum share of the wall time spent capturing stacks.
+            all_threads (bool): Profile every thread but the sampler, instead of the threads given at reset.
+        """
+        self.samples = samples
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_overhead = max_overhead
+        self.all_threads = all_threads
+        self.reset()
+
+    def reset(self, thread_ids=None):
+        """
+        Forget the captured stacks, at the start of a measurement.
+
+        Parameters:
+            thread_ids (list): Identifiers of the threads to profile, every thread but the sampler by default.
+        """
+        self.thread_ids = set() if self.all_threads else set(thread_ids or ())
+        self.start_time = time.time()
+        self.next_capture = 0.0
+        self.overhead = 0.0
+        self.sensors = set()
+        self.stacks = {}
+        self.captures = []
+        self.labels = {}
+
+    def __label(self, code):
+        """
+        Get the label of a code object, as "function (file:line)".
+        """
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = "%s (%s:%d)" % (
+                getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        return label
+
+    def __capture(self, timestamp):
+        """
+        Capture the stacks of the profiled threads.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        sampler = threading.get_ident()
+        stack_ids = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler or (self.thread_ids and thread_id not in self.thread_ids):
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self.__label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, "Thread %d" % thread_id))
+            stack = tuple(reversed(labels))
+            stack_ids.append(self.stacks.setdefault(stack, len(self.stacks)))
+        if stack_ids:
+            self.captures.append((timestamp, stack_ids))
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Capture the stacks of the profiled threads when a capture is due.
+        """
+        # the power planes of a package are left out, the package domain already counting them
+        self.sensors.update(sensor for sensor in values if _device(sensor, device) is not None)
+        if timestamp < self.next_capture:
+            return
+        started = time.perf_counter()
+        self.__capture(timestamp)
+        cost = time.perf_counter() - started
+        self.overhead += cost
+        # wait long enough for the capture cost to stay below max_overhead of the wall time
+        self.next_capture = timestamp + max(self.interval, cost / self.max_overhead if self.max_overhead else 0.0)
+
+    def energies(self):
+        """
+        Charge the energy of every interval between two captures to the stacks captured at its end,
+        split evenly between the profiled threads.
+
+        Returns:
+            Dictionary mapping stacks (tuples of frame labels, outermost first) to their energy in Joules.
+        """
+        if not self.captures:
+            return {}
+        ends = np.array([timestamp for timestamp, stack_ids in self.captures])
+        starts = np.concatenate(([min(self.start_time, ends[0])], ends[:-1]))
+        interval_energies = np.zeros(len(ends))
+        for sensor in self.sensors:
+            if sensor in self.samples.sensors():
+                interval_energies += self.samples.batch_energy(sensor, starts, ends)
+
+        stacks = {stack_id: stack for stack, stack_id in self.stacks.items()}
+        energies = {}
+        for energy, (timestamp, stack_ids) in zip(interval_energies * 3600, self.captures):
+            for stack_id in stack_ids:
+                stack = stacks[stack_id]
+                energies[stack] = energies.get(stack, 0.0) + energy / len(stack_ids)
+        return energies
+
+    def collapsed(self, unit="mJ"):
+        """
+        Get the collapsed stacks weighted by energy, heaviest first.
+
+        Parameters:
+            unit (str): Unit of the integer weights, "mJ" (default), "uJ" or "J".
+        Returns:
+            List of "frame;frame;frame weight" lines.
+        """
+        scale = {"J": 1, "mJ": 1e3, "uJ": 1e6}[unit]
+        weights = [(";".join(stack), int(round(energy * scale))) for stack, energy in self.energies().items()]
+        return ["%s %d" % (stack, weight) for stack, weight in sorted(weights, key=lambda item: -item[1]) if weight > 0]
+
+    def write(self, filepath, unit="mJ"):
+        """
+        Write the collapsed stacks weighted by energy to a file, to be rendered with flamegraph.pl or speedscope.
+
+        Parameters:
+            filepath (str): Path to the output file.
+            unit (str): Unit of the integer weights, "mJ" (default), "uJ" or "J".
+        """
+        lines = self.collapsed(unit)
+        with open(filepath, "w") as fp:
+            fp.write("\n".join(lines) + ("\n" if lines else ""))
+        LOGGER.info("Energy profile with %d stacks written to %s (%.3f s spent capturing %d samples)",
+                    len(lines), filepath, self.overhead, len(self.captures))
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Handles of the regions measured concurrently on the shared sampler of a PowerMeter.
+"""
+__all__ = ["Region"]
+
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Region:
+    """
+    Region
+    ---------
+
+    Handle of one measured region. Every region holds its own tags, start and end times and report, so that
+    any number of threads (or asyncio tasks) can open and close regions on the same PowerMeter concurrently.
+
+    The sampler of the PowerWrapper is shared and reference counted: the first open region starts it and the
+    last closed region stops it. The report of a region is the energy of every sensor over its time window,
+    queried from the shared samples.
+
+    Attributes:
+        package (str): Package name of the measured algorithm.
+        algorithm (str): Name of the measured algorithm.
+        algorithm_description (str): Description of the measured algorithm.
+        work (float): Units of work done in the region (samples, tokens, requests, FLOPs), None if unknown.
+        work_unit (str): Name of the unit of work.
+        parent (Region): Enclosing region of the same thread or task, which receives the work of the region
+            when it has no work count of its own.
+        columns (dict): Extra columns of the report (see annotate).
+        thread_id (int): Identifier of the thread that opened the region.
+        start_time (float): Start of the region in seconds since the epoch.
+        end_time (float): End of the region in seconds since the epoch, None while it is open.
+        record (DataFrame): Report of the region, None while it is open.
+    """
+
+    def __init__(self, wrapper, package, algorithm, algorithm_description="", work=None, work_unit="item",
+                 parent=None, on_start=None, on_stop=None, thread_id=None, started=None, on_sampler_stop=None):
+        """
+        Initialize the Region instance and start measuring.
+
+        Parameters:
+            wrapper (PowerWrapper): Shared sampler.
+            package (str): Package name of the measured algorithm.
+            algorithm (str): Name of the measured algorithm.
+            algorithm_description (str): Description of the measured algorithm.
+            work (float): Units of work done in the region, may also be counted with `add_work`.
+            work_unit (str): Name of the unit of work (e.g. "sample", "token", "request", "FLOP").
+            parent (Region): Enclosing region.
+            on_start (callable): Called with the region and whether the sampler was started for it, once it is open.
+            on_stop (callable): Called with the region once its report is built.
+            thread_id (int): Identifier of the thread running the region, the calling thread by default (the thread of
+                the event loop for a region opened from a coroutine).
+            started (bool): Result of a `wrapper.acquire()` already done by the caller, e.g. in an executor so that the
+                event loop is not blocked, None to acquire the sampler here.
+            on_sampler_stop (callable): Called with the region when closing it stopped the shared sampler, before
+                another region can restart it.
+        """
+        self.wrapper = wrapper
+        self.package = package
+        self.algorithm = algorithm
+        self.algorithm_description = algorithm_description
+        self.work = work
+        self.work_unit = work_unit
+        self.children_work = None
+        self.columns = {}
+        self.parent = parent
+        self.on_stop = on_stop
+        self.on_sampler_stop = on_sampler_stop
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.lock = threading.Lock()
+        self.end_time = None
+        self.record = None
+        if started is None:
+            started = wrapper.acquire()
+        self.start_time = time.time()
+        if on_start is not None:
+            on_start(self, started)
+
+    @property
+    def closed(self):
+        """
+        True once the region is stopped.
+        """
+        return self.end_time is not None
+
+    def add_work(self, count):
+        """
+        Count units of work done in the region, e.g. the items of each processed batch.
+
+        Parameters:
+            count (float): Units of work to add.
+        """
+        with self.lock:
+            self.work = (self.work or 0) + count
+
+    def __add_children_work(self, count):
+        """
+        Receive the work of a closed nested region.
+        """
+        with self.lock:
+            self.children_work = (self.children_work or 0) + count
+
+    def annotate(self, **columns):
+        """
+        Add columns to the report of the region, e.g. counters measured by the caller. Columns given after the
+        region is stopped are not recorded.
+
+        Parameters:
+            columns: Names and values of the columns.
+        """
+        with self.lock:
+            self.columns.update(columns)
+
+    def total_work(self):
+        """
+        Returns:
+            Work count of the region, or the sum of the work of its nested regions when it has no count of its own.
+        """
+        return self.work if self.work is not None else self.children_work
+
+    def stop(self):
+        """
+        Stop measuring the region and build its report. Stopping a region twice returns the same report.
+
+        Returns:
+            DataFrame with one row of energies in the configured energy unit and the duration of the region.
+        """
+        with self.lock:
+            if self.end_time is not None:
+                return self.record
+            self.end_time = time.time()
+            work = self.total_work()
+            try:
+                self.record = self.wrapper.energy_report(self.start_time, self.end_time, work, self.work_unit)
+                for name, value in self.columns.items():
+                    self.record[name] = value
+            finally:
+                on_stopped = None
+                if self.on_sampler_stop is not None:
+                    on_stopped = lambda: self.on_sampler_stop(self)
+                self.wrapper.release(on_stopped)
+        if work is not None and self.parent is not None and self.parent.work_unit == self.work_unit:
+            self.parent.__add_children_work(work)
+        if self.on_stop is not None:
+            self.on_stop(self)
+        return self.record
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exit_type, value, traceback):
+        self.stop()
+
+    def __repr__(self):
+        state = "closed" if self.closed else "open"
+        return "Region(%r, %r, %s)" % (self.package, self.algorithm, state)
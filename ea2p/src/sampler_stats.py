@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Self-overhead of the sampler: every tick of the sampling thread is timed, so that reports show how much the
+measurement perturbed the run.
+"""
+__all__ = ["SamplerStats", "add_sampler_stats", "children_cpu_time"]
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .metrics import ENERGY_UNITS, device_energies
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 100000       # ticks kept, older ones only count in the totals
+FIELDS = ("times", "durations", "cpu", "subprocess", "children_cpu", "node_busy", "missed", "intervals")
+# Report columns of the summary entries
+COLUMNS = {
+    "ticks": "Sampler ticks",
+    "missed_deadlines": "Sampler missed deadlines",
+    "tick_mean_ms": "Sampler tick mean [ms]",
+    "tick_p99_ms": "Sampler tick p99 [ms]",
+    "interval_mean_ms": "Sampler interval mean [ms]",
+    "cpu_time_s": "Sampler CPU time [s]",
+    "subprocess_time_s": "Sampler subprocess time [s]",
+}
+
+
+def children_cpu_time():
+    """
+    Returns:
+        CPU time (user and system) of the children of the process that were waited for, in seconds, 0 when unknown.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class SamplerStats:
+    """
+    SamplerStats
+    ---------
+
+    Cost of the ticks of a sampling thread: duration, CPU time of the thread (`time.thread_time`), wall time of the
+    devices read through a subprocess (`nvidia-smi`, `rocm-smi`) and CPU time of these subprocesses, and whether the
+    tick missed its deadline. The last `capacity` ticks are kept in a ring buffer, so that the cost can be summarized
+    over any recent time window, e.g. the one of a region.
+
+    The energy of the sampler is estimated by sharing the CPU energy of the window among the busy CPU time of the node
+    (read from /proc/stat at every tick), as done by the process attribution.
+
+    Attributes:
+        capacity (int): Number of ticks kept.
+        ticks (int): Number of ticks since the last reset.
+        missed (int): Number of missed deadlines since the last reset.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Initialize the SamplerStats instance.
+
+        Parameters:
+            capacity (int): Number of ticks kept in the ring buffer.
+        """
+        self.capacity = int(capacity)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every tick.
+        """
+        with self.lock:
+            self.buffers = {field: np.zeros(self.capacity) for field in FIELDS}
+            self.size = 0
+            self.position = 0
+            self.ticks = 0
+            self.missed = 0
+
+    def tick(self, timestamp, duration, cpu, subprocess=0.0, children_cpu=0.0, node_busy=np.nan, missed=False,
+             interval=np.nan):
+        """
+        Record one tick of the sampling thread.
+
+        Parameters:
+            timestamp (float): Start of the tick in seconds since the epoch.
+            duration (float): Wall time of the tick in seconds.
+            cpu (float): CPU time of the sampling thread during the tick in seconds.
+            subprocess (float): Wall time of the readings done through a subprocess in seconds.
+            children_cpu (float): CPU time of these subprocesses in seconds.
+            node_busy (float): Cumulative busy CPU time of the node at the tick in seconds, NaN when unknown.
+            missed (bool): Whether the tick ended after the deadline of the next one.
+            interval (float): Interval before the next tick in seconds, which varies with adaptive sampling.
+        """
+        with self.lock:
+            values = (timestamp, duration, cpu, subprocess, children_cpu, node_busy, float(missed), interval)
+            for field, value in zip(FIELDS, values):
+                self.buffers[field][self.position] = value
+            self.position = (self.position + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            self.ticks += 1
+            self.missed += bool(missed)
+
+    def window(self, start=None, end=None):
+        """
+        Get the ticks started in a time window.
+
+        Returns:
+            Dictionary mapping the fields to arrays of the ticks of the window, oldest first.
+        """
+        with self.lock:
+            if self.size == self.capacity:
+                order = np.roll(np.arange(self.capacity), -self.position)
+            else:
+                order = np.arange(self.size)
+            ticks = {field: buffer[order] for field, buffer in self.buffers.items()}
+        mask = np.ones(len(ticks["times"]), dtype=bool)
+        if start is not None:
+            mask &= ticks["times"] >= start
+        if end is not None:
+            mask &= ticks["times"] <= end
+        return {field: values[mask] for field, values in ticks.items()}
+
+    def summary(self, start=None, end=None, cpu_energy=None, total_energy=None, cpus=None):
+        """
+        Summarize the cost of the sampler over a time window, every kept tick by default.
+
+        Parameters:
+            start (float): Start of the window in seconds since the epoch.
+            end (float): End of the window in seconds since the epoch.
+            cpu_energy (float): CPU energy of the window, to estimate the energy of the sampler in the same unit.
+            total_energy (float): Energy of every device over the window, to estimate the share of the sampler.
+            cpus (int): Number of logical CPUs, to share the CPU energy by capacity when the busy time is unknown.
+        Returns:
+            Dictionary with the number of ticks and missed deadlines, the mean and 99th percentile tick duration and
+            the mean interval between ticks in milliseconds, the CPU time of the sampling thread and of its
+            subprocesses and the wall time of the subprocesses in seconds, and the estimated energy and energy share.
+        """
+        ticks = self.window(start, end)
+        durations = ticks["durations"] * 1e3
+        cpu = float(ticks["cpu"].sum() + ticks["children_cpu"].sum())
+        summary = {
+            "ticks": int(len(durations)),
+            "missed_deadlines": int(ticks["missed"].sum()),
+            "tick_mean_ms": float(durations.mean()) if len(durations) else 0.0,
+            "tick_p99_ms": float(np.percentile(durations, 99)) if len(durations) else 0.0,
+            "interval_mean_ms": float(np.nanmean(ticks["intervals"]) * 1e3) if len(durations) else 0.0,
+            "cpu_time_s": float(ticks["cpu"].sum()),
+            "subprocess_time_s": float(ticks["subprocess"].sum()),
+            "subprocess_cpu_time_s": float(ticks["children_cpu"].sum()),
+        }
+        if cpu_energy is not None:
+            busy = ticks["node_busy"]
+            busy = busy[~np.isnan(busy)]
+            node_cpu = float(busy[-1] - busy[0]) if len(busy) > 1 else 0.0
+            if node_cpu <= 0 and cpus and len(ticks["times"]) > 1:
+                node_cpu = cpus * float(ticks["times"][-1] - ticks["times"][0])
+            energy = cpu_energy * min(cpu / node_cpu, 1.0) if node_cpu > 0 else 0.0
+            summary["energy"] = energy
+            summary["energy_share"] = energy / total_energy if total_energy else 0.0
+        return summary
+
+    def __repr__(self):
+        return "SamplerStats(%d ticks, %d missed deadlines)" % (self.ticks, self.missed)
+
+
+def add_sampler_stats(record, stats, sensor_devices, energy_unit, start=None, end=None):
+    """
+    Add the cost of the sampler over the window of a one-row energy report to the report.
+
+    Parameters:
+        record (DataFrame): Report with one column per sensor.
+        stats (SamplerStats): Ticks of the sampler.
+        sensor_devices (dict): Device type (cpu, gpu, ram) of every sensor, attributed counters being left out.
+        energy_unit (str): Energy unit of the report (J, Wh or kWh).
+        start (float): Start of the window of the report in seconds since the epoch.
+        end (float): End of the window of the report in seconds since the epoch.
+    Returns:
+        The report with the "Sampler ..." columns: ticks, missed deadlines, mean and p99 tick duration, mean interval, CPU time
+        of the sampling thread, wall time of its subprocesses, and estimated energy and energy share.
+    """
+    energies = device_energies(record, sensor_devices)
+    summary = stats.summary(start, end, cpu_energy=energies.get("cpu", 0.0), total_energy=sum(energies.values()),
+                            cpus=os.cpu_count())
+    record = record.copy()
+    for name, column in COLUMNS.items():
+        record[column] = round(summary[name], 5)
+    record["Sampler energy [%s]" % ENERGY_UNITS.get(str(energy_unit).lower(), ENERGY_UNITS["wh"])[0]] = round(summary["energy"], 8)
+    record["Sampler energy share [%]"] = round(100 * summary["energy_share"], 5)
+    return record
@@ -0,0 +1,420 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Deterministic hardware simulator: a synthetic powercap, hwmon, cgroup and procfs tree driven by scripted power
+profiles, with stub `nvidia-smi`, `rocm-smi`, `rocminfo` and `dmidecode` executables, so that the backends and
+whole PowerMeter runs can be tested on any machine against a known ground-truth energy.
+"""
+__all__ = ["Profile", "HardwareSimulator"]
+
+import contextlib
+import logging
+import os
+import stat
+import threading
+import time
+from pathlib import Path
+
+from .utils import HARDWARE_ROOT_ENV
+from .metrics import ENERGY_UNITS
+
+LOGGER = logging.getLogger(__name__)
+
+CLIENT_CPU = "Intel(R) Core(TM) i7-8665U CPU @ 1.90GHz"
+SERVER_CPU = "Intel(R) Xeon(R) Gold 6130 CPU @ 2.10GHz"
+# Default wraparound of the RAPL energy counters (the value of most Intel CPUs), in micro joules
+MAX_ENERGY_RANGE_UJ = 262143328850
+GIB = 2 ** 30
+
+
+class Profile:
+    """
+    Profile
+    ---------
+
+    Piecewise-constant profile of a power (in Watt) or of a number of busy CPUs: a list of (duration, value)
+    segments, the last value being held after the end of the script.
+
+    Attributes:
+        segments (list): List of (duration in seconds, value) tuples.
+    """
+
+    def __init__(self, segments):
+        """
+        Initialize the Profile instance.
+
+        Parameters:
+            segments (float or list): Constant value, or list of (duration in seconds, value) tuples.
+        """
+        if isinstance(segments, Profile):
+            segments = segments.segments
+        elif isinstance(segments, (int, float)):
+            segments = [(0.0, float(segments))]
+        if not segments:
+            raise ValueError("A profile needs at least one segment")
+        self.segments = [(float(duration), float(value)) for duration, value in segments]
+
+    def value(self, t):
+        """
+        Returns:
+            Value of the profile at `t` seconds from its start.
+        """
+        elapsed = 0.0
+        for duration, value in self.segments:
+            elapsed += duration
+            if t < elapsed:
+                return value
+        return self.segments[-1][1]
+
+    def integral(self, t):
+        """
+        Returns:
+            Integral of the profile from its start to `t` seconds (Joule for a power profile).
+        """
+        total, elapsed = 0.0, 0.0
+        for duration, value in self.segments[:-1]:
+            if t <= elapsed + duration:
+                return total + value * max(t - elapsed, 0.0)
+            total += value * duration
+            elapsed += duration
+        return total + self.segments[-1][1] * max(t - elapsed, 0.0)
+
+
+def _profile(value):
+    return None if value is None else Profile(value)
+
+
+class HardwareSimulator:
+    """
+    HardwareSimulator
+    ---------
+
+    Synthetic hardware tree under a root directory, read by the backends when `hardware_root` (or the
+    EA2P_HARDWARE_ROOT environment variable) points to it:
+
+    - `/sys/class/powercap/intel-rapl/intel-rapl:<socket>` package domains and their sub-domains, whose `energy_uj`
+      counters integrate the power profiles and wrap around at `max_energy_range_uj`, with their power limits,
+    - `/sys/devices/system/cpu/cpu*/topology/physical_package_id`, `/proc/cpuinfo`, `/proc/stat`, `/proc/meminfo`,
+    - `/sys/class/hwmon/hwmon0/power1_input` with the power of the first package,
+    - `/sys/fs/cgroup/<path>/cpu.stat` and `memory.current` of the simulated cgroups,
+    - `/sys/class/dmi/id/bios_version` and `bios_date`, `/sys/devices/system/cpu/cpu0/microcode/version`,
+    - `bin/nvidia-smi`, `bin/rocm-smi`, `bin/rocminfo`, `bin/dmidecode` and `bin/sudo` stubs, to put first in the PATH.
+
+    The tree shows the state of the hardware at a simulated time, set with `advance`. `replay` drives the samplers of
+    a PowerWrapper on a simulated clock for deterministic runs, while `start` follows the wall clock for whole
+    PowerMeter runs on a background thread. `expected` gives the ground-truth energy of every sensor.
+
+    Attributes:
+        root (Path): Root of the simulated tree.
+        cpu (str): CPU brand, a Core (client RAPL layout) or a Xeon (server layout).
+        sockets (int): Number of CPU packages.
+        package (Profile): Power of each package.
+        subdomains (dict): Power profile of each RAPL sub-domain of every package (e.g. "core", "dram").
+        gpus (list): Power profiles of the Nvidia GPUs.
+        amd_gpus (list): Power profiles of the AMD GPUs.
+        cgroups (dict): Busy CPU and memory profiles of the simulated cgroups.
+        max_energy_range_uj (int): Wraparound of the RAPL counters.
+        origin (float): Wall clock time of the simulated time 0 when following the wall clock.
+    """
+
+    def __init__(self, root, cpu=CLIENT_CPU, sockets=1, cpus_per_socket=4, package=15.0, subdomains=None, gpus=(),
+                 amd_gpus=(), busy=None, cgroups=None, memory_total=16 * GIB, memory_used=4 * GIB,
+                 max_energy_range_uj=MAX_ENERGY_RANGE_UJ, dimms=2, dimm_type="DDR4", dimm_size_gb=16,
+                 bios_version="1.0.0", bios_date="01/01/2024", microcode="0x1"):
+        """
+        Initialize the HardwareSimulator instance and build the tree at simulated time 0.
+
+        Parameters:
+            root (str): Root of the simulated tree, created if needed.
+            cpu (str): CPU brand. "Core(TM)" brands get the client RAPL layout (package, core, uncore...),
+                "Xeon" brands the server one (package and dram).
+            sockets (int): Number of CPU packages.
+            cpus_per_socket (int): Number of logical CPUs of each package.
+            package (Profile): Power profile of each package in Watt (a number or a list of (duration, Watt) segments).
+            subdomains (dict): Power profile of each RAPL sub-domain, {"core": 8.0} for a Core and {"dram": 5.0}
+                for a Xeon by default.
+            gpus (list): Power profiles of the Nvidia GPUs.
+            amd_gpus (list): Power profiles of the AMD GPUs.
+            busy (Profile): Number of busy CPUs of the node, the sum of the cgroups by default.
+            cgroups (dict): Dictionary mapping cgroup paths to {"cpu": busy CPUs profile, "memory": bytes}.
+            memory_total (int): Memory size of the node in bytes.
+            memory_used (int): Memory in use on the node in bytes.
+            max_energy_range_uj (int): Wraparound of the RAPL energy counters in micro joules.
+            dimms (int): Number of memory modules listed by dmidecode.
+            dimm_type (str): Type of the memory modules.
+            dimm_size_gb (int): Size of each memory module in GB.
+            bios_version (str): BIOS version of the DMI tree.
+            bios_date (str): BIOS date of the DMI tree.
+            microcode (str): CPU microcode revision.
+        """
+        self.root = Path(root)
+        self.cpu = cpu
+        self.server = "Xeon" in cpu
+        self.sockets = sockets
+        self.cpus_per_socket = cpus_per_socket
+        self.package = Profile(package)
+        if subdomains is None:
+            subdomains = {"dram": 5.0} if self.server else {"core": 8.0}
+        self.subdomains = {name: Profile(profile) for name, profile in subdomains.items()}
+        self.gpus = [Profile(profile) for profile in gpus]
+        self.amd_gpus = [Profile(profile) for profile in amd_gpus]
+        self.cgroups = {
+            path: {"cpu": Profile(spec.get("cpu", 0.0)), "memory": int(spec.get("memory", 0))}
+            for path, spec in (cgroups or {}).items()
+        }
+        self.busy = _profile(busy)
+        self.memory_total = memory_total
+        self.memory_used = memory_used
+        self.max_energy_range_uj = max_energy_range_uj
+        self.dimms = dimms
+        self.dimm_type = dimm_type
+        self.dimm_size_gb = dimm_size_gb
+        self.bios_version = bios_version
+        self.bios_date = bios_date
+        self.microcode = microcode
+        self.origin = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.__build()
+        self.advance(0.0)
+
+    # Tree
+
+    def path(self, path):
+        """
+        Returns:
+            Path of an absolute path of the hardware trees in the simulated tree.
+        """
+        return self.root / str(path).lstrip("/")
+
+    def __write(self, path, content):
+        path = self.path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name("." + path.name + ".tmp")
+        temporary.write_text(content)
+        # readers never see a partially written file
+        os.replace(temporary, path)
+
+    def __stub(self, name, script):
+        self.__write("/bin/" + name, "#!/bin/sh\n" + script)
+        path = self.path("/bin/" + name)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def __rapl(self, socket, sub=None):
+        directory = "/sys/class/powercap/intel-rapl/intel-rapl:%d" % socket
+        return directory if sub is None else directory + "/intel-rapl:%d:%d" % (socket, sub)
+
+    def __build(self):
+        """
+        Write the static part of the tree and the stub executables.
+        """
+        cpus = self.sockets * self.cpus_per_socket
+        for cpu in range(cpus):
+            self.__write("/sys/devices/system/cpu/cpu%d/topology/physical_package_id" % cpu, "%d\n" % (cpu // self.cpus_per_socket))
+        self.__write("/proc/cpuinfo", "".join(
+            "processor\t: %d\nmodel name\t: %s\nphysical id\t: %d\n\n" % (cpu, self.cpu, cpu // self.cpus_per_socket)
+            for cpu in range(cpus)
+        ))
+        self.__write("/proc/meminfo", "MemTotal:       %d kB\nMemFree:        %d kB\nMemAvailable:   %d kB\n" % (
+            self.memory_total // 1024, (self.memory_total - self.memory_used) // 1024, (self.memory_total - self.memory_used) // 1024))
+        for socket in range(self.sockets):
+            domains = [(None, "package-%d" % socket)] + list(enumerate(self.subdomains))
+            for sub, name in domains:
+                directory = self.__rapl(socket, sub)
+                self.__write(directory + "/name", name + "\n")
+                self.__write(directory + "/max_energy_range_uj", "%d\n" % self.max_energy_range_uj)
+                self.__write(directory + "/enabled", "1\n")
+                for constraint, label in enumerate(("long_term", "short_term")):
+                    self.__write(directory + "/constraint_%d_name" % constraint, label + "\n")
+                    self.__write(directory + "/constraint_%d_power_limit_uw" % constraint, "%d\n" % 125000000)
+                    self.__write(directory + "/constraint_%d_max_power_uw" % constraint, "%d\n" % 250000000)
+        self.__write("/sys/class/hwmon/hwmon0/name", "ea2p_simulator\n")
+        self.__write("/sys/class/dmi/id/bios_version", self.bios_version + "\n")
+        self.__write("/sys/class/dmi/id/bios_date", self.bios_date + "\n")
+        self.__write("/sys/devices/system/cpu/cpu0/microcode/version", self.microcode + "\n")
+        for path, spec in self.cgroups.items():
+            self.__write("/sys/fs/cgroup/%s/memory.current" % path.strip("/"), "%d\n" % spec["memory"])
+
+        state = self.path("/sim")
+        self.__write("/sim/nvidia_uuid.csv", "".join(
+            "%d, GPU-%08d-0000-0000-0000-000000000000, NVIDIA Simulated GPU\n" % (i, i) for i in range(len(self.gpus))))
+        if self.gpus:
+            self.__stub("nvidia-smi", (
+                'case "$*" in\n'
+                '  *uuid*) cat "%s/nvidia_uuid.csv" ;;\n'
+                '  *power.draw*) cat "%s/nvidia_power.csv" ;;\n'
+                '  *) echo "NVIDIA-SMI simulated by ea2p" ;;\n'
+                'esac\n'
+            ) % (state, state))
+        else:
+            self.__stub("nvidia-smi", "exit 9\n")
+        self.__stub("rocm-smi", 'cat "%s/rocm_power.txt"\n' % state)
+        self.__stub("rocminfo", 'echo "ROCk module is loaded (simulated by ea2p)"\n' if self.amd_gpus else "exit 1\n")
+        self.__stub("dmidecode", 'cat "%s/dmidecode.txt"\n' % state)
+        self.__stub("sudo", 'exec "$@"\n')
+        self.__write("/sim/dmidecode.txt", "".join(
+            "Memory Device\n\tSize: %d GB\n\tType: %s\n\n" % (self.dimm_size_gb, self.dimm_type) for _ in range(self.dimms)
+        ))
+
+    def advance(self, t):
+        """
+        Update the tree to the state of the hardware at simulated time `t`.
+
+        Parameters:
+            t (float): Simulated time in seconds.
+        """
+        for socket in range(self.sockets):
+            profiles = [(None, self.package)] + list(enumerate(self.subdomains.values()))
+            for sub, profile in profiles:
+                energy_uj = int(profile.integral(t) * 1e6) % self.max_energy_range_uj
+                self.__write(self.__rapl(socket, sub) + "/energy_uj", "%d\n" % energy_uj)
+        self.__write("/sys/class/hwmon/hwmon0/power1_input", "%d\n" % int(self.package.value(t) * 1e6))
+        self.__write("/sim/nvidia_power.csv", "power.draw [W]\n" + "".join(
+            "%.2f W\n" % profile.value(t) for profile in self.gpus))
+        self.__write("/sim/rocm_power.txt", "".join(
+            "GPU[%d] : Average Graphics Package Power (W): %.2f\n" % (i, profile.value(t)) for i, profile in enumerate(self.amd_gpus)))
+
+        clock_ticks = os.sysconf("SC_CLK_TCK")
+        cpus = self.sockets * self.cpus_per_socket
+        busy = self.busy.integral(t) if self.busy is not None else sum(spec["cpu"].integral(t) for spec in self.cgroups.values())
+        idle = max(cpus * t - busy, 0.0)
+        self.__write("/proc/stat", "cpu  %d 0 0 %d 0 0 0 0 0 0\n" % (busy * clock_ticks, idle * clock_ticks))
+        for path, spec in self.cgroups.items():
+            usage_usec = int(spec["cpu"].integral(t) * 1e6)
+            self.__write("/sys/fs/cgroup/%s/cpu.stat" % path.strip("/"), "usage_usec %d\nuser_usec %d\nsystem_usec 0\n" % (usage_usec, usage_usec))
+
+    # Ground truth
+
+    def expected(self, start, end):
+        """
+        Get the ground-truth energy of every sensor between two simulated times, named as the backends report them.
+
+        Returns:
+            Dictionary mapping sensor names to their energy in Joule.
+        """
+        def energy(profile):
+            return profile.integral(end) - profile.integral(start)
+
+        sensors = {}
+        if self.server:
+            sensors["energy_cpu"] = self.sockets * energy(self.package)
+            if "dram" in self.subdomains:
+                sensors["energy_memory"] = self.sockets * energy(self.subdomains["dram"])
+        else:
+            for socket in range(self.sockets):
+                sensors["package-%d" % socket] = energy(self.package)
+            for name, profile in self.subdomains.items():
+                # the client backend names sub-domains without their socket
+                sensors[name] = energy(profile)
+        for i, profile in enumerate(self.gpus):
+            sensors["GPU " + str(i)] = energy(profile)
+        for i, profile in enumerate(self.amd_gpus):
+            sensors["GPU[%d]" % i] = energy(profile)
+        return sensors
+
+    def errors(self, report, energy_unit, start, end):
+        """
+        Compare a report with the ground truth.
+
+        Parameters:
+            report (DataFrame): Report of a PowerWrapper over the simulated window.
+            energy_unit (str): Energy unit of the report.
+            start (float): Start of the window in simulated seconds.
+            end (float): End of the window in simulated seconds.
+        Returns:
+            Dictionary mapping the simulated sensors of the report to their relative error.
+        """
+        joules = ENERGY_UNITS.get(str(energy_unit).lower(), ENERGY_UNITS["wh"])[1]
+        errors = {}
+        for sensor, truth in self.expected(start, end).items():
+            if sensor in report and truth:
+                errors[sensor] = (float(report[sensor].iloc[0]) * joules - truth) / truth
+        return errors
+
+    # Clocks
+
+    def environ(self, environ=None):
+        """
+        Returns:
+            Copy of an environment (os.environ by default) pointing the backends to the simulated tree and stubs.
+        """
+        environ = dict(os.environ if environ is None else environ)
+        environ[HARDWARE_ROOT_ENV] = str(self.root)
+        environ["PATH"] = str(self.path("/bin")) + os.pathsep + environ.get("PATH", "")
+        return environ
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Context manager pointing the backends of the current process to the simulated tree and stubs.
+        """
+        previous = dict(os.environ)
+        os.environ.update(self.environ())
+        try:
+            yield self
+        finally:
+            os.environ.clear()
+            os.environ.update(previous)
+
+    def replay(self, wrapper, duration, interval=None, start=0.0):
+        """
+        Drive the devices of a PowerWrapper on the simulated clock, without its sampling thread: at every tick the tree
+        is advanced and every device read once, so that runs are deterministic.
+
+        Parameters:
+            wrapper (PowerWrapper): PowerWrapper created on the simulated tree.
+            duration (float): Length of the run in simulated seconds.
+            interval (float): Sampling interval in simulated seconds, the one of the wrapper by default.
+            start (float): Simulated time of the first tick.
+        Returns:
+            Report of the run, as built by `PowerWrapper.energy_report`.
+        """
+        interval = interval or wrapper.interval
+        ticks = int(round(duration / interval))
+        wrapper.samples.clear()
+        for attribution in wrapper.attributions:
+            attribution.reset()
+        for tick in range(ticks + 1):
+            t = start + tick * interval
+            self.advance(t)
+            if wrapper.power_objects:
+                wrapper.get_all_power(wrapper.power_objects, timestamp=t)
+            if wrapper.intel:
+                wrapper.get_intel_energy(timestamp=t)
+        end = start + ticks * interval
+        return wrapper.energy_report(start, end)
+
+    def __run(self, resolution):
+        while not self.stopped.wait(resolution):
+            self.advance(time.time() - self.origin)
+
+    def start(self, resolution=0.001):
+        """
+        Follow the wall clock on a background thread, for whole PowerMeter runs: simulated time 0 is now.
+
+        Parameters:
+            resolution (float): Time between two updates of the tree in seconds.
+        """
+        self.origin = time.time()
+        self.advance(0.0)
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.__run, args=(resolution,), name="ea2p-simulator", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop following the wall clock.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def expected_between(self, start_time, end_time):
+        """
+        Get the ground-truth energy between two wall clock times, while following the wall clock.
+
+        Returns:
+            Dictionary mapping sensor names to their energy in Joule.
+        """
+        return self.expected(start_time - self.origin, end_time - self.origin)
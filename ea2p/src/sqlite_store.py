@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Indexed SQLite backend for the energy reports of PowerMeter and PowerMeterMPI.
+"""
+__all__ = ["SQLiteResultStore"]
+
+import datetime
+import os
+import socket
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    project_name TEXT NOT NULL,
+    host TEXT,
+    pid INTEGER,
+    started TEXT
+);
+CREATE TABLE IF NOT EXISTS regions (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    datetime TEXT,
+    package TEXT,
+    algorithm TEXT,
+    parameters TEXT,
+    rank TEXT
+);
+CREATE TABLE IF NOT EXISTS sensors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS "values" (
+    region_id INTEGER NOT NULL REFERENCES regions(id),
+    sensor_id INTEGER NOT NULL REFERENCES sensors(id),
+    value REAL,
+    PRIMARY KEY (region_id, sensor_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_runs_project ON runs(project_name);
+CREATE INDEX IF NOT EXISTS idx_regions_run ON regions(run_id);
+CREATE INDEX IF NOT EXISTS idx_regions_algorithm ON regions(algorithm);
+CREATE INDEX IF NOT EXISTS idx_regions_package ON regions(package);
+CREATE INDEX IF NOT EXISTS idx_regions_datetime ON regions(datetime);
+CREATE INDEX IF NOT EXISTS idx_values_sensor ON "values"(sensor_id);
+"""
+
+# Report columns stored in the runs and regions tables, every other column is a sensor value.
+PROJECT_COLUMN = "Project Name"
+DATETIME_COLUMN = "Datetime"
+REGION_COLUMNS = {
+    "Package": "package",
+    "Algorithm": "algorithm",
+    "Algorithm's parameters": "parameters",
+    "Rank": "rank",
+}
+REPORT_DATETIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+TOTAL_RANK = "Total"
+
+
+class SQLiteResultStore:
+    """
+    SQLiteResultStore
+    ---------
+
+    Store energy reports in a local SQLite database (WAL mode) with a normalized schema:
+    runs (one per project and process), regions (one per measurement), sensors and values.
+    Runs and regions are indexed on project name, algorithm, package and datetime so that summaries
+    over thousands of measurements are computed by SQLite without loading the whole history.
+
+    The store is used as a sink by the background ResultWriter (`write` and `close` methods) and
+    exposes a small query API (`projects`, `summary`, `regions`, `values`).
+
+    Attributes:
+        filepath (Path): Path to the SQLite database.
+    """
+
+    def __init__(self, filepath):
+        """
+        Initialize the SQLiteResultStore instance, creating the database schema if needed.
+
+        Parameters:
+            filepath (str): Path to the SQLite database file.
+        """
+        self.filepath = Path(filepath)
+        self.lock = threading.Lock()
+        self.connection = self.__connect()
+        self.connection.executescript(SCHEMA)
+        self.runs = {}
+        self.sensors = dict(self.connection.execute("SELECT name, id FROM sensors"))
+
+    def __connect(self):
+        """
+        Open a connection to the database in WAL mode so that readers never block the writer.
+
+        Returns:
+            sqlite3 Connection instance.
+        """
+        connection = sqlite3.connect(self.filepath, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @staticmethod
+    def __to_iso(value):
+        """
+        Convert a report datetime to ISO 8601 so that datetimes sort and compare as text.
+        """
+        if isinstance(value, datetime.datetime):
+            return value.isoformat(sep=" ", timespec="seconds")
+        try:
+            return datetime.datetime.strptime(str(value), REPORT_DATETIME_FORMAT).isoformat(sep=" ")
+        except ValueError:
+            return str(value)
+
+    def __get_run(self, cursor, project_name):
+        """
+        Get the identifier of the run of this process for a project, creating it on first use.
+        """
+        run_id = self.runs.get(project_name)
+        if run_id is None:
+            cursor.execute(
+                "INSERT INTO runs (project_name, host, pid, started) VALUES (?, ?, ?, ?)",
+                (project_name, socket.gethostname(), os.getpid(), self.__to_iso(datetime.datetime.now())),
+            )
+            run_id = self.runs[project_name] = cursor.lastrowid
+        return run_id
+
+    def __get_sensor(self, cursor, name):
+        """
+        Get the identifier of a sensor, creating it on first use.
+        """
+        sensor_id = self.sensors.get(name)
+        if sensor_id is None:
+            cursor.execute("INSERT OR IGNORE INTO sensors (name) VALUES (?)", (name,))
+            sensor_id = cursor.execute("SELECT id FROM sensors WHERE name = ?", (name,)).fetchone()[0]
+            self.sensors[name] = sensor_id
+        return sensor_id
+
+    def write(self, rows):
+        """
+        Insert report rows in a single transaction.
+
+        Parameters:
+            rows (list): List of dictionaries mapping report columns to values.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.cursor()
+            values = []
+            for row in rows:
+                run_id = self.__get_run(cursor, str(row.get(PROJECT_COLUMN, "")))
+                region = {column: row.get(name) for name, column in REGION_COLUMNS.items()}
+                if region["rank"] is not None:
+                    region["rank"] = str(region["rank"])
+                cursor.execute(
+                    "INSERT INTO regions (run_id, datetime, package, algorithm, parameters, rank) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (run_id, self.__to_iso(row.get(DATETIME_COLUMN, "")), region["package"],
+                     region["algorithm"], region["parameters"], region["rank"]),
+                )
+                region_id = cursor.lastrowid
+                for name, value in row.items():
+                    if name in REGION_COLUMNS or name in (PROJECT_COLUMN, DATETIME_COLUMN):
+                        continue
+                    try:
+                        value = float(value)
+                    except (TypeError, ValueError):
+                        continue
+                    if value != value:
+                        continue
+                    values.append((region_id, self.__get_sensor(cursor, name), value))
+            cursor.executemany('INSERT INTO "values" (region_id, sensor_id, value) VALUES (?, ?, ?)', values)
+
+    def close(self):
+        """
+        Close the connection to the database.
+        """
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def __filters(project_name=None, package=None, algorithm=None, since=None, until=None):
+        """
+        Build the WHERE clause shared by the query methods.
+
+        Returns:
+            Tuple of the SQL clause and its parameters.
+        """
+        clauses, params = [], []
+        for column, value in (("runs.project_name", project_name), ("regions.package", package),
+                              ("regions.algorithm", algorithm)):
+            if value is not None:
+                clauses.append(column + " = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("regions.datetime >= ?")
+            params.append(SQLiteResultStore.__to_iso(since))
+        if until is not None:
+            clauses.append("regions.datetime <= ?")
+            params.append(SQLiteResultStore.__to_iso(until))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def __query(self, sql, params=()):
+        """
+        Run a read query and return the rows as dictionaries.
+        """
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def projects(self):
+        """
+        List the recorded projects.
+
+        Returns:
+            List of dictionaries with the project name, its number of runs and of regions.
+        """
+        return self.__query(
+            "SELECT runs.project_name AS project_name, COUNT(DISTINCT runs.id) AS runs, "
+            "COUNT(regions.id) AS regions FROM runs LEFT JOIN regions ON regions.run_id = runs.id "
+            "GROUP BY runs.project_name ORDER BY runs.project_name"
+        )
+
+    def summary(self, project_name=None, package=None, algorithm=None, since=None, until=None,
+                sensor=None, group_by=("package", "algorithm"), include_totals=False):
+        """
+        Summarize the recorded values per sensor, computed by SQLite.
+
+        Parameters:
+            project_name (str): Only keep the regions of this project.
+            package (str): Only keep the regions of this package.
+            algorithm (str): Only keep the regions of this algorithm.
+            since (str or datetime): Only keep the regions recorded at or after this datetime.
+            until (str or datetime): Only keep the regions recorded at or before this datetime.
+            sensor (str): Only summarize this sensor.
+            group_by (tuple): Region attributes to group on, among project_name, package, algorithm, parameters and rank.
+            include_totals (bool): Keep the "Total" rows added by PowerMeterMPI, which would count every rank twice.
+        Returns:
+            List of dictionaries with the grouping attributes, the sensor name and the count, total, mean, min and max values.
+        """
+        allowed = {"project_name": "runs.project_name", "package": "regions.package",
+                   "algorithm": "regions.algorithm", "parameters": "regions.parameters", "rank": "regions.rank"}
+        unknown = set(group_by) - set(allowed)
+        if unknown:
+            raise ValueError("Unsupported group_by attributes: %s" % ", ".join(sorted(unknown)))
+        where, params = self.__filters(project_name, package, algorithm, since, until)
+        if sensor is not None:
+            where += (" AND" if where else " WHERE") + " sensors.name = ?"
+            params.append(sensor)
+        if not include_totals:
+            where += (" AND" if where else " WHERE") + " (regions.rank IS NULL OR regions.rank != ?)"
+            params.append(TOTAL_RANK)
+        groups = [allowed[attribute] + " AS " + attribute for attribute in group_by]
+        group_columns = [allowed[attribute] for attribute in group_by] + ["sensors.name"]
+        return self.__query(
+            "SELECT " + ", ".join(groups + ["sensors.name AS sensor"]) + ", COUNT(*) AS count, "
+            "SUM(v.value) AS total, AVG(v.value) AS mean, MIN(v.value) AS min, MAX(v.value) AS max "
+            'FROM "values" AS v JOIN sensors ON sensors.id = v.sensor_id '
+            "JOIN regions ON regions.id = v.region_id JOIN runs ON runs.id = regions.run_id"
+            + where + " GROUP BY " + ", ".join(group_columns) + " ORDER BY " + ", ".join(group_columns),
+            params,
+        )
+
+    def regions(self, project_name=None, package=None, algorithm=None, since=None, until=None, limit=None):
+        """
+        List the recorded regions (one per measurement), most recent first.
+
+        Parameters:
+            project_name (str): Only keep the regions of this project.
+            package (str): Only keep the regions of this package.
+            algorithm (str): Only keep the regions of this algorithm.
+            since (str or datetime): Only keep the regions recorded at or after this datetime.
+            until (str or datetime): Only keep the regions recorded at or before this datetime.
+            limit (int): Maximum number of regions to return.
+        Returns:
+            List of dictionaries describing the regions.
+        """
+        where, params = self.__filters(project_name, package, algorithm, since, until)
+        sql = ("SELECT regions.id AS id, runs.project_name AS project_name, runs.host AS host, "
+               "regions.datetime AS datetime, regions.package AS package, regions.algorithm AS algorithm, "
+               "regions.parameters AS parameters, regions.rank AS rank "
+               "FROM regions JOIN runs ON runs.id = regions.run_id" + where + " ORDER BY regions.datetime DESC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self.__query(sql, params)
+
+    def values(self, region_id):
+        """
+        Get the sensor values recorded for a region.
+
+        Parameters:
+            region_id (int): Identifier of the region, as returned by `regions`.
+        Returns:
+            Dictionary mapping sensor names to values.
+        """
+        rows = self.__query(
+            'SELECT sensors.name AS name, v.value AS value FROM "values" AS v '
+            "JOIN sensors ON sensors.id = v.sensor_id WHERE v.region_id = ?",
+            (region_id,),
+        )
+        return {row["name"]: row["value"] for row in rows}
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Live subscriptions to the samples of a PowerWrapper: consumers (loggers, exporters, budget guards, callbacks)
+receive batches of timestamped samples through bounded queues, without ever stalling the sampling loop.
+"""
+__all__ = ["Sample", "Subscription", "POLICIES"]
+
+import collections
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+COALESCE = "coalesce"
+POLICIES = (DROP_OLDEST, BLOCK, COALESCE)
+BACKLOG_FACTOR = 100        # samples waiting for a blocked queue, in queue capacities
+
+Sample = collections.namedtuple("Sample", ["timestamp", "values", "kind", "device"])
+Sample.__doc__ = """
+Readings of one device at one sampling tick: time in seconds since the epoch, dictionary mapping the sensor names to
+their readings, kind of the readings (power in Watt or cumulative energy counter in Watt-hour) and device type.
+"""
+
+
+class Subscription:
+    """
+    Subscription
+    ---------
+
+    Bounded queue of the samples of a PowerWrapper, registered as one of its listeners (see PowerWrapper.subscribe).
+    The sampling thread only appends to the queue, and never waits on the consumer. When the queue is full, the policy
+    decides what happens to a new sample:
+
+    - "drop_oldest": the oldest queued sample is dropped,
+    - "coalesce": the new readings are merged into the newest queued sample of the same device (the consumer gets
+      the latest reading of every sensor, with fewer points), or the oldest sample is dropped when there is none,
+    - "block": no sample is lost. A pump thread moves the samples into the queue and waits while it is full, the
+      samples piling up in a backlog meanwhile. Only a backlog of `backlog` samples overflows, dropping its oldest.
+
+    Samples are consumed in batches, pulled with `get` (or by iterating on the subscription) or pushed to a callback
+    on a delivery thread. A batch holds up to `batch_size` samples, and waits at most `max_latency` seconds after its
+    first sample for more.
+
+    Attributes:
+        capacity (int): Number of samples the queue holds.
+        policy (str): Policy of a full queue among "drop_oldest", "block" and "coalesce".
+        batch_size (int): Largest number of samples of a batch.
+        max_latency (float): Longest time in seconds a batch waits to be filled.
+        devices (set): Device types (cpu, gpu, ram) received, every device by default.
+        callback (callable): Function receiving every batch, None for a pull consumer.
+        closed (bool): Whether the subscription was closed.
+    """
+
+    def __init__(self, capacity=1024, policy=DROP_OLDEST, batch_size=64, max_latency=0.5, callback=None, devices=None,
+                 backlog=None):
+        """
+        Initialize the Subscription instance.
+
+        Parameters:
+            capacity (int): Number of samples the queue holds.
+            policy (str): Policy of a full queue among "drop_oldest", "block" and "coalesce".
+            batch_size (int): Largest number of samples of a batch.
+            max_latency (float): Longest time in seconds a batch waits to be filled, 0 to return what is queued.
+            callback (callable): Function receiving every batch (a list of Sample) on a delivery thread.
+            devices (list): Device types (cpu, gpu, ram) to receive, every device by default.
+            backlog (int): Samples waiting for a full queue with the "block" policy, 100 times the capacity by default.
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown subscription policy %r, expected one of %s" % (policy, ", ".join(POLICIES)))
+        if capacity < 1 or batch_size < 1:
+            raise ValueError("The capacity and batch size of a subscription must be positive")
+        self.capacity = capacity
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.devices = set(devices) if devices is not None else None
+        self.callback = callback
+        self.closed = False
+        self.discarded = False
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.counts = collections.Counter()
+        self.pump = None
+        self.pumped = policy != BLOCK
+        if policy == BLOCK:
+            self.backlog = collections.deque(maxlen=backlog or BACKLOG_FACTOR * capacity)
+            self.backlog_condition = threading.Condition()
+            self.pump = threading.Thread(target=self.__pump, name="ea2p-subscription-pump", daemon=True)
+            self.pump.start()
+        self.delivery = None
+        if callback is not None:
+            self.delivery = threading.Thread(target=self.__deliver, name="ea2p-subscription", daemon=True)
+            self.delivery.start()
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Queue the readings of one device, called by the sampling thread. This method never blocks on the consumer.
+        """
+        if self.closed or (self.devices is not None and device not in self.devices):
+            return
+        sample = Sample(timestamp, dict(values), kind, device)
+        if self.policy == BLOCK:
+            with self.backlog_condition:
+                if len(self.backlog) == self.backlog.maxlen:
+                    self.counts["backlog_dropped"] += 1
+                self.backlog.append(sample)
+                self.backlog_condition.notify()
+            return
+        with self.condition:
+            self.counts["received"] += 1
+            if len(self.queue) >= self.capacity:
+                if self.policy == COALESCE and self.__coalesce(sample):
+                    self.counts["coalesced"] += 1
+                    return
+                self.queue.popleft()
+                self.counts["dropped"] += 1
+            self.queue.append(sample)
+            self.condition.notify_all()
+
+    def __coalesce(self, sample):
+        """
+        Merge a sample into the newest queued sample of the same device and kind.
+
+        Returns:
+            True if the sample was merged.
+        """
+        for index in range(len(self.queue) - 1, -1, -1):
+            queued = self.queue[index]
+            if queued.device == sample.device and queued.kind == sample.kind:
+                self.queue[index] = Sample(sample.timestamp, {**queued.values, **sample.values}, sample.kind, sample.device)
+                return True
+        return False
+
+    def __pump(self):
+        """
+        Move the backlog into the queue, waiting while the queue is full ("block" policy), until the subscription
+        is closed and the backlog empty.
+        """
+        while True:
+            with self.backlog_condition:
+                while not self.backlog and not self.closed:
+                    self.backlog_condition.wait()
+                sample = self.backlog.popleft() if self.backlog and not self.discarded else None
+            if sample is None:
+                break
+            with self.condition:
+                if len(self.queue) >= self.capacity:
+                    blocked = time.perf_counter()
+                    while len(self.queue) >= self.capacity and not self.discarded:
+                        self.condition.wait()
+                    self.counts["blocked_ms"] += (time.perf_counter() - blocked) * 1e3
+                if self.discarded:
+                    break
+                self.counts["received"] += 1
+                self.queue.append(sample)
+                self.condition.notify_all()
+        with self.condition:
+            self.pumped = True
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Get the next batch of samples.
+
+        Parameters:
+            timeout (float): Longest time in seconds to wait for a first sample, None to wait until one arrives.
+        Returns:
+            List of Sample, oldest first, empty on timeout, None once the subscription is closed and drained.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.queue:
+                if self.closed and self.pumped:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self.condition.wait(remaining)
+            fill = time.monotonic() + self.max_latency
+            while len(self.queue) < self.batch_size and not (self.closed and self.pumped):
+                remaining = fill - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            self.counts["delivered"] += len(batch)
+            self.condition.notify_all()
+            return batch
+
+    def __iter__(self):
+        """
+        Iterate on the batches until the subscription is closed and drained.
+        """
+        while True:
+            batch = self.get()
+            if batch is None:
+                return
+            yield batch
+
+    def __deliver(self):
+        """
+        Push every batch to the callback. A failing callback is logged, and does not end the subscription.
+        """
+        for batch in self:
+            try:
+                self.callback(batch)
+            except Exception:
+                self.counts["errors"] += 1
+                LOGGER.exception("Subscription callback %r failed", self.callback)
+
+    def close(self, drain=True, timeout=None):
+        """
+        Stop receiving samples.
+
+        Parameters:
+            drain (bool): Keep the queued samples (and the backlog of the "block" policy) for the consumer, which gets
+                them before the end of the subscription. Otherwise they are dropped.
+            timeout (float): Longest time in seconds to wait for the pump and delivery threads to end.
+        """
+        with self.condition:
+            self.closed = True
+            if not drain:
+                self.discarded = True
+                self.counts["dropped"] += len(self.queue)
+                self.queue.clear()
+            self.condition.notify_all()
+        if self.pump is not None:
+            with self.backlog_condition:
+                if not drain:
+                    self.counts["backlog_dropped"] += len(self.backlog)
+                    self.backlog.clear()
+                self.backlog_condition.notify_all()
+            if self.delivery is not None or not drain:
+                self.pump.join(timeout)
+        if self.delivery is not None and self.delivery is not threading.current_thread():
+            self.delivery.join(timeout)
+
+    def stats(self):
+        """
+        Returns:
+            Dictionary with the number of samples received, delivered, dropped and coalesced, the number queued and
+            waiting in the backlog, the time the pump waited on a full queue in milliseconds, and callback errors.
+        """
+        with self.condition:
+            stats = {name: self.counts[name] for name in ("received", "delivered", "dropped", "coalesced", "blocked_ms", "errors")}
+            stats["queued"] = len(self.queue)
+        stats["dropped"] += self.counts["backlog_dropped"]
+        stats["backlog"] = len(self.backlog) if self.pump is not None else 0
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exit_type, value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return "Subscription(%s, %d/%d queued)" % (self.policy, len(self.queue), self.capacity)
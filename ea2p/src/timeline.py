@@ -0,0 +1,543 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+In-memory store of the timestamped samples collected by PowerWrapper.
+"""
+__all__ = ["SampleStore", "POWER", "COUNTER"]
+
+import threading
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+POWER = "power"         # instantaneous power samples in Watt (GPU, RAM)
+COUNTER = "energy"      # cumulative energy counters in Watt-hour (RAPL)
+
+# (resolution in seconds, maximum number of buckets) of the rollup tiers, from the finest to the coarsest
+DEFAULT_TIERS = ((1, 3600), (60, 1440), (3600, 24 * 366))
+
+
+class _Tier:
+    """
+    Growable columnar buffer of fixed-resolution buckets (e.g. 1 s, 1 min, 1 h) summarizing older samples.
+
+    Each bucket keeps its first and last sample time with the cumulative energy at these times, so that
+    the cumulative energy stays piecewise linear across buckets, and the min, max, sum and count of the power
+    readings, and the energy since the end of the previous bucket (the bucket energies add up exactly).
+    """
+
+    FIELDS = ("key", "start", "end", "start_energy", "end_energy", "min", "max", "sum", "count", "energy")
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.size = 0
+        self.columns = {field: np.empty(64, dtype=np.float64) for field in self.FIELDS}
+
+    def __getitem__(self, field):
+        return self.columns[field][:self.size]
+
+    def append(self, buckets):
+        """
+        Append buckets (a dictionary of equally long arrays), merging the first one with the last bucket
+        of the tier when they fall in the same time slot.
+        """
+        if self.size and len(buckets["key"]) and buckets["key"][0] == self.columns["key"][self.size - 1]:
+            last = self.size - 1
+            columns = self.columns
+            columns["end"][last] = buckets["end"][0]
+            columns["end_energy"][last] = buckets["end_energy"][0]
+            columns["min"][last] = min(columns["min"][last], buckets["min"][0])
+            columns["max"][last] = max(columns["max"][last], buckets["max"][0])
+            for field in ("sum", "count", "energy"):
+                columns[field][last] += buckets[field][0]
+            buckets = {field: values[1:] for field, values in buckets.items()}
+
+        count = len(buckets["key"])
+        if self.size + count > len(self.columns["key"]):
+            capacity = max(2 * len(self.columns["key"]), self.size + count)
+            self.columns = {field: np.resize(values, capacity) for field, values in self.columns.items()}
+        for field in self.FIELDS:
+            self.columns[field][self.size:self.size + count] = buckets[field]
+        self.size += count
+
+    def pop_oldest(self, count):
+        """
+        Remove the oldest buckets, returned as a dictionary of arrays.
+        """
+        popped = {field: values[:count].copy() for field, values in self.columns.items()}
+        self.columns = {field: values[count:].copy() for field, values in self.columns.items()}
+        self.size -= count
+        return popped
+
+    def points(self):
+        """
+        Returns:
+            Times and cumulative energies of the bucket edges, interleaved and increasing.
+        """
+        times = np.empty(2 * self.size)
+        energy = np.empty(2 * self.size)
+        times[0::2], times[1::2] = self["start"], self["end"]
+        energy[0::2], energy[1::2] = self["start_energy"], self["end_energy"]
+        return times, energy
+
+
+def _buckets(resolution, starts, ends, start_energies, end_energies, mins, maxs, sums, counts, energies):
+    """
+    Group consecutive rows sharing the same time slot into buckets of a coarser resolution.
+    """
+    slots = np.floor(starts / resolution)
+    edges = np.flatnonzero(np.diff(slots)) + 1
+    firsts = np.concatenate(([0], edges))
+    lasts = np.concatenate((edges, [len(slots)])) - 1
+    return {
+        "key": slots[firsts],
+        "start": starts[firsts],
+        "end": ends[lasts],
+        "start_energy": start_energies[firsts],
+        "end_energy": end_energies[lasts],
+        "min": np.minimum.reduceat(mins, firsts),
+        "max": np.maximum.reduceat(maxs, firsts),
+        "sum": np.add.reduceat(sums, firsts),
+        "count": np.add.reduceat(counts, firsts),
+        "energy": np.add.reduceat(energies, firsts),
+    }
+
+
+class _Series:
+    """
+    Growable columnar buffer holding the samples of one sensor and their cumulative energy.
+
+    The cumulative energy (Watt-hour) at each sample is a prefix sum: power readings are held constant until
+    the next sample, counter readings contribute their non-negative delta (a negative delta, i.e. a counter
+    reset, is replaced by the previous delta as PowerWrapper does).
+
+    Only the `raw_capacity` most recent samples are kept raw. Older samples are rolled into coarser tiers
+    (1 s, 1 min, 1 h by default), each tier spilling its oldest buckets into the next one when full.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, kind, device, raw_capacity=None, tiers=()):
+        self.kind = kind
+        self.device = device
+        self.size = 0
+        self.last_delta = 0.0
+        self.raw_capacity = raw_capacity
+        self.tiers = [_Tier(resolution, capacity) for resolution, capacity in tiers]
+        self.rolled = None          # (time, cumulative energy) of the last sample rolled into the tiers
+        self.times = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+        self.values = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+        self.energy = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+
+    def _grow(self):
+        capacity = 2 * len(self.times)
+        self.times = np.resize(self.times, capacity)
+        self.values = np.resize(self.values, capacity)
+        self.energy = np.resize(self.energy, capacity)
+
+    def append(self, timestamp, value):
+        if self.raw_capacity and self.size >= self.raw_capacity:
+            self._roll(self.size // 2)
+        elif self.size == len(self.times):
+            self._grow()
+        if self.size == 0 and self.rolled is None:
+            energy = 0.0
+        else:
+            previous_time, previous_value, previous_energy = self._last()
+            if self.kind == COUNTER:
+                delta = value - previous_value
+                if delta < 0:
+                    delta = self.last_delta
+                self.last_delta = delta
+                energy = previous_energy + delta
+            else:
+                energy = previous_energy + previous_value * (timestamp - previous_time) / 3600
+        self.times[self.size] = timestamp
+        self.values[self.size] = value
+        self.energy[self.size] = energy
+        self.size += 1
+
+    def _last(self):
+        """
+        Time, reading and cumulative energy of the most recent sample.
+        """
+        if self.size:
+            return self.times[self.size - 1], self.values[self.size - 1], self.energy[self.size - 1]
+        return self.rolled
+
+    def _roll(self, count):
+        """
+        Move the `count` oldest raw samples into the first tier. New arrays are allocated so that views
+        handed out by `SampleStore.iter_series` stay valid.
+        """
+        times, values, energy = self.times[:count], self.values[:count], self.energy[:count]
+        if self.tiers:
+            if self.kind == COUNTER:
+                previous_time, previous_energy = (self.rolled[0], self.rolled[2]) if self.rolled else (times[0], energy[0])
+                elapsed = np.diff(times, prepend=previous_time)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    power = np.where(elapsed > 0, np.diff(energy, prepend=previous_energy) * 3600 / elapsed, 0.0)
+                if self.rolled is None and count > 1:
+                    power[0] = power[1]
+            else:
+                power = values
+            previous_energy = self.rolled[2] if self.rolled else energy[0]
+            energies = np.diff(energy, prepend=previous_energy)
+            self._spill(0, _buckets(self.tiers[0].resolution, times, times, energy, energy,
+                                    power, power, power, np.ones(count), energies))
+        self.rolled = (times[-1], values[-1], energy[-1])
+
+        capacity = len(self.times)
+        for name in ("times", "values", "energy"):
+            buffer = np.empty(capacity, dtype=np.float64)
+            buffer[:self.size - count] = getattr(self, name)[count:self.size]
+            setattr(self, name, buffer)
+        self.size -= count
+
+    def _spill(self, level, buckets):
+        """
+        Append buckets to a tier, rolling its oldest buckets into the next tier when it is full.
+        """
+        tier = self.tiers[level]
+        tier.append(buckets)
+        if tier.size <= tier.capacity:
+            return
+        popped = tier.pop_oldest(tier.size - tier.capacity // 2)
+        if level + 1 < len(self.tiers):
+            self._spill(level + 1, _buckets(self.tiers[level + 1].resolution, popped["start"],
+                                            popped["end"], popped["start_energy"], popped["end_energy"],
+                                            popped["min"], popped["max"], popped["sum"], popped["count"],
+                                            popped["energy"]))
+
+    def levels(self):
+        """
+        Times and cumulative energies of every level, from the finest (raw samples) to the coarsest tier.
+        """
+        levels = [(self.times[:self.size], self.energy[:self.size])]
+        levels.extend(tier.points() for tier in self.tiers)
+        return levels
+
+    def cumulative_at(self, timestamps):
+        """
+        Cumulative energy at arbitrary times. Each time is answered by the finest level covering it, with two
+        binary searches per window through np.interp and a linear interpolation between the surrounding points.
+        After the last sample, a power series keeps its last reading, so that a window ending between two
+        samples is not cut short.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        result = np.empty(timestamps.shape)
+        remaining = np.ones(timestamps.shape, dtype=bool)
+        anchor = None
+        for times, energy in self.levels():
+            if len(times) == 0:
+                continue
+            covered = remaining & (timestamps >= times[0])
+            inside = covered if anchor is None else covered & (timestamps <= times[-1])
+            result[inside] = np.interp(timestamps[inside], times, energy)
+            gap = covered & ~inside
+            if gap.any():
+                # between the end of this level and the first point of the finer one
+                result[gap] = np.interp(timestamps[gap], [times[-1], anchor[0]], [energy[-1], anchor[1]])
+            remaining &= ~covered
+            anchor = (times[0], energy[0])
+        if anchor is not None:
+            result[remaining] = anchor[1]
+        else:
+            result[remaining] = 0.0
+        last = self._last()
+        if self.kind == POWER and last is not None:
+            # the last power reading holds until the queried time, as it would until the next sample
+            after = timestamps > last[0]
+            result[after] = last[2] + last[1] * (timestamps[after] - last[0]) / 3600
+        return result
+
+    def total(self):
+        """
+        Energy since the first sample, exact whatever was rolled into the tiers.
+        """
+        last = self._last()
+        return float(last[2]) if last is not None else 0.0
+
+
+class SampleStore:
+    """
+    SampleStore
+    ---------
+
+    Columnar store of every timestamped sample read by the PowerWrapper sampler, one series per sensor.
+
+    Sensors are either instantaneous power readings in Watt (kind POWER, e.g. "GPU 0") or cumulative
+    energy counters in Watt-hour (kind COUNTER, e.g. RAPL "package-0"). Each sensor is tagged with the
+    device type it belongs to (cpu, gpu, ram).
+
+    The store maintains the cumulative energy of every sensor as samples arrive, so the energy over any
+    time window is answered with two binary searches and an interpolation at the edges (`energy`,
+    `energies`), and many windows at once with `batch_energy`.
+
+    When `raw_capacity` is set, only the most recent samples of each sensor are kept raw and older ones are
+    rolled into coarser tiers (1 s, 1 min and 1 h buckets with min, max, mean and energy), so memory stays
+    bounded on week-long runs. Queries use the finest level covering each time, and energy totals stay exact.
+
+    Attributes:
+        rank (int): Rank of the process owning the samples, reported in the timeline (0 without MPI).
+        raw_capacity (int): Maximum number of raw samples kept per sensor, None to keep every sample.
+        tiers (tuple): Resolution in seconds and maximum number of buckets of each rollup tier.
+    """
+
+    def __init__(self, rank=0, raw_capacity=None, tiers=DEFAULT_TIERS):
+        """
+        Initialize an empty SampleStore instance.
+
+        Parameters:
+            rank (int): Rank of the process owning the samples.
+            raw_capacity (int): Maximum number of raw samples kept per sensor, None to keep every sample.
+            tiers (tuple): Resolution in seconds and maximum number of buckets of each rollup tier, from the finest.
+        """
+        self.rank = rank
+        self.raw_capacity = raw_capacity
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def clear(self):
+        """
+        Drop every recorded sample.
+        """
+        with self.lock:
+            self.series = {}
+
+    def append(self, timestamp, values, kind=POWER, device=""):
+        """
+        Record the readings of one sampling tick.
+
+        Parameters:
+            timestamp (float): Time of the readings in seconds since the epoch.
+            values (dict): Dictionary mapping sensor names to readings.
+            kind (str): POWER for readings in Watt, COUNTER for cumulative energy in Watt-hour.
+            device (str): Device type of the sensors (cpu, gpu, ram).
+        """
+        with self.lock:
+            for sensor, value in values.items():
+                series = self.series.get(sensor)
+                if series is None:
+                    series = self.series[sensor] = _Series(kind, device, self.raw_capacity, self.tiers)
+                series.append(timestamp, value)
+
+    def sensors(self):
+        """
+        Returns:
+            List of the recorded sensor names.
+        """
+        return list(self.series)
+
+    def kind(self, sensor):
+        """
+        Returns:
+            The kind (POWER or COUNTER) of a sensor.
+        """
+        return self.series[sensor].kind
+
+    def get(self, sensor):
+        """
+        Get the raw samples of a sensor (older samples may have been rolled into tiers).
+
+        Parameters:
+            sensor (str): Name of the sensor.
+        Returns:
+            Tuple of two numpy arrays: timestamps and readings.
+        """
+        with self.lock:
+            series = self.series[sensor]
+            return series.times[:series.size].copy(), series.values[:series.size].copy()
+
+    def cumulative(self, sensor):
+        """
+        Get the cumulative energy of a sensor at each of its raw samples.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+        Returns:
+            Tuple of two numpy arrays: timestamps and cumulative energy in Watt-hour.
+        """
+        with self.lock:
+            series = self.series[sensor]
+            return series.times[:series.size].copy(), series.energy[:series.size].copy()
+
+    def energy(self, sensor, start, end):
+        """
+        Get the energy of a sensor between two times in O(log n), from its cumulative energy.
+        The energy before the first sample is zero, and a power reading holds after the last sample.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+            start (float): Start of the window in seconds since the epoch.
+            end (float): End of the window in seconds since the epoch.
+        Returns:
+            Energy in Watt-hour.
+        """
+        with self.lock:
+            series = self.series[sensor]
+            if series.size == 0:
+                return 0.0
+            start_energy, end_energy = series.cumulative_at([start, end])
+        return float(end_energy - start_energy)
+
+    def energies(self, start, end):
+        """
+        Get the energy of every sensor between two times.
+
+        Parameters:
+            start (float): Start of the window in seconds since the epoch.
+            end (float): End of the window in seconds since the epoch.
+        Returns:
+            Dictionary mapping sensor names to energies in Watt-hour.
+        """
+        return {sensor: self.energy(sensor, start, end) for sensor in self.sensors()}
+
+    def batch_energy(self, sensor, starts, ends):
+        """
+        Get the energy of a sensor over many windows at once.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+            starts (array): Start of each window in seconds since the epoch.
+            ends (array): End of each window in seconds since the epoch.
+        Returns:
+            Numpy array with the energy of each window in Watt-hour.
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        with self.lock:
+            series = self.series[sensor]
+            if series.size == 0:
+                return np.zeros(np.broadcast(starts, ends).shape)
+            return series.cumulative_at(ends) - series.cumulative_at(starts)
+
+    def total(self, sensor):
+        """
+        Get the energy of a sensor since its first sample, exact even when samples were rolled into tiers.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+        Returns:
+            Energy in Watt-hour.
+        """
+        with self.lock:
+            return self.series[sensor].total()
+
+    def totals(self):
+        """
+        Returns:
+            Dictionary mapping sensor names to their energy since their first sample in Watt-hour.
+        """
+        return {sensor: self.total(sensor) for sensor in self.sensors()}
+
+    def rollup(self, sensor, resolution):
+        """
+        Get the buckets of a rollup tier.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+            resolution (float): Resolution of the tier in seconds (e.g. 1, 60 or 3600).
+        Returns:
+            DataFrame with columns start, end, min, max, mean (Watt) and energy (Watt-hour), one row per bucket.
+        """
+        with self.lock:
+            tier = next((tier for tier in self.series[sensor].tiers if tier.resolution == resolution), None)
+            if tier is None:
+                raise ValueError("No rollup tier with a resolution of %s seconds" % resolution)
+            frame = pd.DataFrame({
+                "start": pd.to_datetime(tier["start"], unit="s", utc=True),
+                "end": pd.to_datetime(tier["end"], unit="s", utc=True),
+                "min": tier["min"].copy(),
+                "max": tier["max"].copy(),
+                "mean": tier["sum"] / tier["count"],
+                "energy": tier["energy"].copy(),
+            })
+        return frame
+
+    def stats(self, sensor, start, end):
+        """
+        Get the power statistics and the energy of a sensor over a time window, each part of the window being
+        answered by the finest level (raw samples or rollup tier) that covers it.
+
+        Parameters:
+            sensor (str): Name of the sensor.
+            start (float): Start of the window in seconds since the epoch.
+            end (float): End of the window in seconds since the epoch.
+        Returns:
+            Dictionary with the min, max and mean power in Watt and the energy in Watt-hour.
+        """
+        with self.lock:
+            series = self.series[sensor]
+            minimum, maximum, total, count = np.inf, -np.inf, 0.0, 0.0
+            upper = end
+            times, values, energy = (series.times[:series.size], series.values[:series.size],
+                                     series.energy[:series.size])
+            if series.size:
+                if series.kind == COUNTER:
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        values = np.diff(energy, prepend=energy[0]) * 3600 / np.diff(times, prepend=times[0])
+                    values[0] = values[1] if series.size > 1 else 0.0
+                selected = values[(times >= start) & (times <= upper)]
+                if len(selected):
+                    minimum, maximum = min(minimum, selected.min()), max(maximum, selected.max())
+                    total, count = total + selected.sum(), count + len(selected)
+                upper = min(upper, times[0])
+            for tier in series.tiers:
+                if tier.size == 0 or upper < start:
+                    continue
+                selected = (tier["end"] >= start) & (tier["start"] <= upper)
+                if selected.any():
+                    minimum = min(minimum, tier["min"][selected].min())
+                    maximum = max(maximum, tier["max"][selected].max())
+                    total, count = total + tier["sum"][selected].sum(), count + tier["count"][selected].sum()
+                upper = min(upper, tier["start"][0])
+            window_energy = series.cumulative_at([start, end]) if (series.size or series.rolled) else np.zeros(2)
+        return {
+            "min": float(minimum) if count else np.nan,
+            "max": float(maximum) if count else np.nan,
+            "mean": float(total / count) if count else np.nan,
+            "energy": float(window_energy[1] - window_energy[0]),
+        }
+
+    def __len__(self):
+        return sum(series.size for series in self.series.values())
+
+    def iter_series(self):
+        """
+        Iterate over the raw samples of every series without copying them.
+
+        Returns:
+            Iterator of tuples (sensor, kind, device, timestamps, readings).
+        """
+        with self.lock:
+            items = [(sensor, series.kind, series.device, series.times[:series.size], series.values[:series.size])
+                     for sensor, series in self.series.items()]
+        return iter(items)
+
+    def to_frame(self):
+        """
+        Get every sample in long format, one line per sensor reading.
+
+        Returns:
+            DataFrame with columns timestamp, rank, device, sensor, kind and value.
+        """
+        frames = [
+            pd.DataFrame({
+                "timestamp": pd.to_datetime(times, unit="s", utc=True),
+                "rank": np.int32(self.rank),
+                "device": device,
+                "sensor": sensor,
+                "kind": kind,
+                "value": values,
+            })
+            for sensor, kind, device, times, values in self.iter_series()
+        ]
+        if not frames:
+            return pd.DataFrame(columns=["timestamp", "rank", "device", "sensor", "kind", "value"])
+        frame = pd.concat(frames, ignore_index=True)
+        for column in ("device", "sensor", "kind"):
+            frame[column] = frame[column].astype("category")
+        return frame
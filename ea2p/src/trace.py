@@ -0,0 +1,323 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Crash-safe, append-only binary trace of the samples read by PowerWrapper, and its recovery tool.
+
+File layout: the trace is a sequence of segments. A segment starts with a header
+(MAGIC, header length, JSON description of the sensors, CRC32) followed by fixed-size frames:
+
+    type (u8) | padding (3 bytes) | sequence (u32) | time (f64) | one f64 per sensor | CRC32 (u32)
+
+SAMPLE frames hold the time elapsed since the previous frame, the power readings in Watt and the
+delta of the energy counters in Watt-hour since the previous frame (NaN when a sensor was not read).
+CHECKPOINT frames hold the absolute time, the absolute counter values and the energy integrated so far
+for power sensors, so that a reader can resynchronize and check its totals. A new segment is started
+when new sensors appear. Recovery stops at the first truncated or corrupted frame.
+"""
+__all__ = ["TraceWriter", "recover_trace"]
+
+import argparse
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .timeline import SampleStore, POWER, COUNTER
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"EA2PTRC1"
+VERSION = 1
+SEGMENT_HEADER = struct.Struct("<8sI")
+CRC = struct.Struct("<I")
+SAMPLE = 1
+CHECKPOINT = 2
+
+
+def _frame_struct(sensors_count):
+    return struct.Struct("<B3xId" + "d" * sensors_count)
+
+
+class TraceWriter:
+    """
+    TraceWriter
+    ---------
+
+    Append the samples of PowerWrapper to a binary trace file as they are read, so that the energy
+    data of a job killed by the scheduler or the OOM killer can be rebuilt with `recover_trace`.
+
+    Writes are buffered and made durable with `fsync` every `fsync_every` frames or `fsync_interval`
+    seconds, and at every checkpoint. The `fsync` calls run on a background thread, so that a slow disk
+    never delays the sampling thread, which only appends to the buffer.
+
+    Attributes:
+        filepath (str): Path to the trace file.
+        sensors (list): Sensors of the current segment, as (name, kind, device) tuples.
+    """
+
+    def __init__(self, filepath, fsync_every=64, fsync_interval=1.0, checkpoint_every=256, rank=0):
+        """
+        Initialize the TraceWriter instance and create (or truncate) the trace file.
+
+        Parameters:
+            filepath (str): Path to the trace file.
+            fsync_every (int): Number of frames written between two fsync calls.
+            fsync_interval (float): Maximum time in seconds between two fsync calls.
+            checkpoint_every (int): Number of sample frames between two checkpoint frames.
+            rank (int): Rank of the process writing the trace.
+        """
+        self.filepath = filepath
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.checkpoint_every = checkpoint_every
+        self.rank = rank
+        self.file = open(filepath, "wb")
+        self.sensors = []
+        self.index = {}
+        self.frame = None
+        self.sequence = 0
+        self.last_time = None
+        self.last_values = {}
+        self.last_times = {}
+        self.totals = {}
+        self.pending = 0
+        self.since_checkpoint = 0
+        self.last_sync = time.monotonic()
+        self.sync_requested = threading.Event()
+        self.closing = False
+        self.syncer = threading.Thread(target=self.__run_syncer, name="ea2p-trace-sync", daemon=True)
+        self.syncer.start()
+
+    def __write_segment(self):
+        """
+        Start a new segment describing the current list of sensors.
+        """
+        header = json.dumps({
+            "version": VERSION,
+            "rank": self.rank,
+            "sensors": [{"name": name, "kind": kind, "device": device} for name, kind, device in self.sensors],
+        }).encode("utf-8")
+        self.file.write(SEGMENT_HEADER.pack(MAGIC, len(header)) + header + CRC.pack(zlib.crc32(header)))
+        self.frame = _frame_struct(len(self.sensors))
+        self.index = {name: i for i, (name, kind, device) in enumerate(self.sensors)}
+
+    def __write_frame(self, frame_type, frame_time, values):
+        """
+        Write one fixed-size frame followed by its CRC32.
+        """
+        data = self.frame.pack(frame_type, self.sequence, frame_time, *values)
+        self.file.write(data + CRC.pack(zlib.crc32(data)))
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.pending += 1
+
+    def __checkpoint(self, timestamp):
+        """
+        Write a checkpoint frame with absolute counters and integrated power, then sync the file.
+        """
+        values = []
+        for name, kind, device in self.sensors:
+            if kind == COUNTER:
+                values.append(self.last_values.get(name, math.nan))
+            else:
+                values.append(self.totals.get(name, 0.0))
+        self.__write_frame(CHECKPOINT, timestamp, values)
+        self.since_checkpoint = 0
+        self.request_sync()
+
+    def on_sample(self, timestamp, values, kind, device):
+        """
+        Append the readings of one sampling tick to the trace.
+
+        Parameters:
+            timestamp (float): Time of the readings in seconds since the epoch.
+            values (dict): Dictionary mapping sensor names to readings.
+            kind (str): POWER for readings in Watt, COUNTER for cumulative energy in Watt-hour.
+            device (str): Device type of the sensors.
+        """
+        new_sensors = [(name, kind, device) for name in values if name not in self.index]
+        if new_sensors:
+            self.sensors.extend(new_sensors)
+            if kind == COUNTER:
+                self.last_values.update({name: values[name] for name, kind, device in new_sensors})
+            if self.last_time is None:
+                self.last_time = timestamp
+            self.__write_segment()
+            self.__checkpoint(self.last_time)
+
+        frame_values = [math.nan] * len(self.sensors)
+        for name, value in values.items():
+            previous = self.last_values.get(name)
+            if kind == COUNTER:
+                frame_values[self.index[name]] = value - previous
+            else:
+                if previous is not None:
+                    self.totals[name] = self.totals.get(name, 0.0) + previous * (timestamp - self.last_times[name]) / 3600
+                frame_values[self.index[name]] = value
+                self.last_times[name] = timestamp
+            self.last_values[name] = value
+
+        self.__write_frame(SAMPLE, timestamp - self.last_time, frame_values)
+        self.last_time = timestamp
+        self.since_checkpoint += 1
+
+        if self.since_checkpoint >= self.checkpoint_every:
+            self.__checkpoint(timestamp)
+        elif self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.request_sync()
+
+    def request_sync(self):
+        """
+        Ask the background thread to make the frames written so far durable, without waiting for it.
+        """
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.sync_requested.set()
+
+    def __run_syncer(self):
+        """
+        Background loop running the requested fsync calls until the trace is closed.
+        """
+        while True:
+            self.sync_requested.wait()
+            self.sync_requested.clear()
+            if self.closing:
+                return
+            try:
+                self.__flush()
+            except (OSError, ValueError) as e:
+                LOGGER.error("Error while syncing the trace %s: %s", self.filepath, str(e))
+
+    def __flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def sync(self):
+        """
+        Flush the buffered frames and make them durable on disk, waiting for the disk.
+        """
+        self.__flush()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """
+        Write a final checkpoint and close the trace file.
+        """
+        if self.file.closed:
+            return
+        if self.last_time is not None:
+            self.__checkpoint(self.last_time)
+        self.closing = True
+        self.sync_requested.set()
+        self.syncer.join()
+        self.sync()
+        self.file.close()
+
+
+def recover_trace(filepath):
+    """
+    Rebuild the samples and the energy totals of a trace up to its last complete frame.
+
+    Energy counters are summed over their non-negative deltas (a negative delta is a counter reset and is skipped),
+    power readings are integrated over the elapsed time between frames.
+
+    Parameters:
+        filepath (str): Path to the trace file.
+    Returns:
+        Tuple of a SampleStore holding every recovered sample and a dictionary mapping sensor names
+        to their energy in Watt-hour.
+    """
+    with open(filepath, "rb") as fp:
+        data = fp.read()
+
+    store = SampleStore()
+    totals = {}
+    absolute = {}
+    last_power = {}
+    current_time = None
+    frames = 0
+    offset = 0
+    complete = True
+
+    while complete and data[offset:offset + len(MAGIC)] == MAGIC:
+        header_length = SEGMENT_HEADER.unpack_from(data, offset)[1] if offset + SEGMENT_HEADER.size <= len(data) else 0
+        header_end = offset + SEGMENT_HEADER.size + header_length
+        header = data[offset + SEGMENT_HEADER.size:header_end]
+        if header_end + CRC.size > len(data) or CRC.unpack_from(data, header_end)[0] != zlib.crc32(header):
+            break
+        header = json.loads(header.decode("utf-8"))
+        store.rank = header.get("rank", 0)
+        sensors = [(sensor["name"], sensor["kind"], sensor["device"]) for sensor in header["sensors"]]
+        frame = _frame_struct(len(sensors))
+        offset = header_end + CRC.size
+
+        while data[offset:offset + len(MAGIC)] != MAGIC:
+            if offset + frame.size + CRC.size > len(data):
+                complete = False
+                break
+            raw = data[offset:offset + frame.size]
+            if CRC.unpack_from(data, offset + frame.size)[0] != zlib.crc32(raw):
+                LOGGER.warning("Corrupted frame at byte %d of %s, recovery stops there", offset, filepath)
+                complete = False
+                break
+            frame_type, sequence, frame_time, *values = frame.unpack(raw)
+            offset += frame.size + CRC.size
+            frames += 1
+
+            if frame_type == CHECKPOINT:
+                current_time = frame_time
+                for (name, kind, device), value in zip(sensors, values):
+                    if kind == COUNTER and not math.isnan(value):
+                        absolute[name] = value
+                continue
+
+            current_time += frame_time
+            for (name, kind, device), value in zip(sensors, values):
+                if math.isnan(value):
+                    continue
+                if kind == COUNTER:
+                    absolute[name] += value
+                    totals[name] = totals.get(name, 0.0) + max(value, 0.0)
+                    value = absolute[name]
+                else:
+                    if name in last_power:
+                        previous_value, previous_time = last_power[name]
+                        totals[name] = totals.get(name, 0.0) + previous_value * (current_time - previous_time) / 3600
+                    totals.setdefault(name, 0.0)
+                    last_power[name] = (value, current_time)
+                store.append(current_time, {name: value}, kind=kind, device=device)
+
+    if offset < len(data):
+        LOGGER.warning("%d trailing bytes of %s ignored after the last complete frame", len(data) - offset, filepath)
+    LOGGER.info("%d frames recovered from %s", frames, filepath)
+    return store, totals
+
+
+def main(argv=None):
+    """
+    Command line entry point: `python -m ea2p.src.trace recover trace.bin [--timeline timeline.parquet]`.
+    """
+    parser = argparse.ArgumentParser(description="Recover the energy data of an EA2P binary trace.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    recover = subparsers.add_parser("recover", help="Rebuild energy totals and timeline up to the last complete frame.")
+    recover.add_argument("trace", help="Path to the binary trace file.")
+    recover.add_argument("--timeline", help="Optional Parquet or Arrow file receiving the recovered samples.")
+    args = parser.parse_args(argv)
+
+    store, totals = recover_trace(args.trace)
+    print("Recovered %d samples from %s\n" % (len(store), args.trace))
+    print("%-30s %15s %15s" % ("Sensor", "Energy [Wh]", "Energy [J]"))
+    for name, energy in totals.items():
+        print("%-30s %15.6f %15.3f" % (name, energy, energy * 3600))
+    if args.timeline:
+        from .export import write_timeline
+        write_timeline(store, args.timeline)
+        print("\nTimeline written to %s" % args.timeline)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,10 +36,35 @@ RAPL_DEVICENAME_FILE = "name"
 RAPL_ENERGY_FILE = "energy_uj"
 RAPL_DRAM_PATH = "intel-rapl:{}:{}/"  # rapl_socket_id, rapl_device_id
 RAPL_PATH_SUB_DOMS = "intel-rapl:{}:{}/"  # rapl_socket_id, rapl_device_id
+RAPL_MAX_ENERGY_FILE = "max_energy_range_uj"
 
+# Root of the sysfs and procfs trees read by the backends, "/" on a real host (a simulated tree in tests)
+HARDWARE_ROOT_ENV = "EA2P_HARDWARE_ROOT"
 
 
+def hardware_root(root=None):
+    """
+    Get the root of the hardware trees: the given one, else the EA2P_HARDWARE_ROOT environment variable, else "/".
+    """
+    return str(root or os.environ.get(HARDWARE_ROOT_ENV) or "/")
 
 
+def rooted(path, root=None):
+    """
+    Prefix an absolute path (or glob pattern) of the hardware trees with the hardware root, keeping its trailing slash.
+    """
+    root = hardware_root(root).rstrip("/")
+    return root + str(path) if root else str(path)
 
 
+def read_cpu_brand(root=None):
+    """
+    Get the brand of the CPU: from the cpuinfo of the hardware root when it is not "/", else from cpuinfo.
+    """
+    if hardware_root(root) == "/":
+        return cpuinfo.get_cpu_info()['brand_raw']
+    with open(rooted("/proc/cpuinfo", root), "r") as fp:
+        for line in fp:
+            if line.startswith("model name"):
+                return line.split(":", 1)[1].strip()
+    return ""
@@ -7,6 +7,14 @@ from .power import *
 from .intel import PowerClientIntel, PowerServerIntel
 from .amd import PowerAmdCpu, PowerAmdGpu
 from .ram import PowerRam
+from .timeline import SampleStore, POWER, COUNTER
+from .trace import TraceWriter
+from .metrics import add_efficiency
+from .calibration import BaselineCache, calibrate, hardware_inventory, firmware_versions, DEFAULT_CACHE_FILE, DMI_ROOT
+from .attribution import ProcessCpuAttribution, CgroupAttribution, GpuProcessAttribution, CGROUP_ROOT, PROC_ROOT, read_busy_time
+from .sampler_stats import SamplerStats, add_sampler_stats, children_cpu_time, DEFAULT_CAPACITY
+from .adaptive import AdaptiveInterval
+from .subscription import Subscription
 
 import logging
 import subprocess
@@ -16,6 +24,9 @@ import time
 LOGGER = logging.getLogger(__name__)
 WH_TO_JOULE = 3600
 WH_TO_KW = 1/1000
+DEFAULT_RAW_SAMPLES = 100000     # raw samples kept per sensor before rolling older ones into 1 s / 1 min / 1 h tiers
+# Backends reading the devices through a subprocess (nvidia-smi, rocm-smi), timed apart in the sampler stats
+SUBPROCESS_BACKENDS = (PowerNvidia, PowerAmdGpu)
 
 
 class PowerWrapper(PowerProfiler):
@@ -32,6 +43,22 @@ class PowerWrapper(PowerProfiler):
         thread (Thread): The main Python Thread instance that coordinates measurement from other subprocess threads.
         interval (float): A float value to specify the sampling frequency of measurements.
         power_objects (list): A list that stores different instances of measurements classes for various devices.
+        samples (SampleStore): Timestamped samples read since the last start, per sensor. Only the `raw_samples` most recent samples
+            of each sensor are kept raw (see the configuration file), older ones are rolled into coarser tiers.
+        listeners (list): Objects notified of every sample through their `on_sample(timestamp, values, kind, device)` method, and closed at stop.
+        trace_file (str): Optional path template of the crash-safe binary trace written while sampling (see TraceWriter).
+        attributions (list): Attribution listeners charging part of the node energy to processes (see the "attribution" configuration entry).
+        lock (RLock): Lock ordering the samples recorded by the sampling thread and by the threads closing regions.
+        hardware_root (str): Root of the sysfs and procfs trees read by the backends (see the "hardware_root" configuration entry).
+        baseline (Baseline): Idle power of the sensors of the host, split from the reports when the "baseline" configuration entry is set.
+        baseline_cache (BaselineCache): Per-host cache of the idle baselines (see the "baseline_*" configuration entries).
+        efficiency_metrics (bool): Whether every report gets the efficiency metrics, even without a work count (see the "efficiency_metrics" configuration entry).
+        sensor_devices (dict): Device type (cpu, gpu, ram) of every sensor read from the devices, without the attributed counters.
+        users (int): Number of regions currently sharing the sampler (see acquire and release).
+        adaptive (AdaptiveInterval): Chooses the interval of every tick when the "adaptive_sampling" configuration entry is set, None otherwise.
+        sampler_stats (SamplerStats): Cost of every tick of the sampling thread, added to the reports as "Sampler ..." columns.
+        sampler_stats_enabled (bool): Whether the cost of the ticks is measured at all (the "sampler_stats" configuration entry).
+        profile_options (dict): Options of the EnergyProfiler used by PowerMeter for energy flame graphs (see the "profile_*" configuration entries).
         intel (bool): A boolean value indicating the presence (True) or absence (False) of an Intel CPU.
         amd (bool): A boolean value indicating the presence (True) or absence (False) of an AMD CPU.
 
@@ -41,6 +68,21 @@ class PowerWrapper(PowerProfiler):
         get_power_consumption(list): Continuously get energy usage from all specified power monitoring instances.
         __set_power(str): Create instances of power monitoring classes based on the specified power devices ("e.g., "cpu, Ram, gpu").
         get_all_power(list): Get energy usage from all specified power monitoring instances at a specific sampling period.
+        get_intel_energy(): Read the Intel RAPL energy counters.
+        record_sample(float, dict, str, str): Store the readings of one device and notify the listeners.
+        convert_energy(DataFrame): Convert energies from Watt-hour to the configured energy unit.
+        energy_between(float, float): Get the energy of every sensor over a time window.
+        energy_windows(array, array): Get the energy of every sensor over many time windows at once.
+        acquire(): Register a region on the shared sampler, starting it for the first region.
+        release(callable): Unregister a region, stopping the sampler after the last one.
+        energy_report(float, float): Build the report of a time window of the shared sampler.
+        efficiency(DataFrame): Add the efficiency metrics of every device to a report.
+        add_sampler_stats(DataFrame, float, float): Add the cost of the sampler over a time window to a report.
+        subscribe(callable): Subscribe to the samples through a bounded queue.
+        unsubscribe(Subscription): End a subscription.
+        calibrate(float): Measure and cache the idle power of every sensor.
+        load_baseline(): Get the cached baseline of the host, unless it is stale.
+        split_baseline(DataFrame): Add the baseline and dynamic energy of every sensor to a report.
 
     """
 
@@ -64,7 +106,51 @@ class PowerWrapper(PowerProfiler):
         self.amd = False
         self.intel = False
         self.intel_ram = False
+        self.gpu_visible_only = config.get('gpu_visible_only', False)
+        self.hardware_root = hardware_root(config.get('hardware_root'))
         self.power_objects = self.__set_power(self.power_devices)
+        self.samples = SampleStore(raw_capacity=config.get('raw_samples', DEFAULT_RAW_SAMPLES))
+        self.lock = threading.RLock()
+        self.users = 0
+        self.users_lock = threading.Lock()
+        self.sensor_devices = {}
+        self.efficiency_metrics = config.get('efficiency_metrics', False)
+        self.baseline_cache = BaselineCache(config.get('baseline_cache') or DEFAULT_CACHE_FILE)
+        self.baseline_duration = config.get('baseline_duration', 10.0)
+        self.baseline_max_age_days = config.get('baseline_max_age_days')
+        self.dmi_root = config.get('dmi_root') or rooted(DMI_ROOT, self.hardware_root)
+        self.baseline = self.load_baseline() if config.get('baseline', False) else None
+        self.listeners = []
+        self.trace_file = config.get('trace_file')
+        self.trace = None
+        self.trace_options = {
+            "fsync_every": config.get('trace_fsync_every', 64),
+            "fsync_interval": config.get('trace_fsync_interval', 1.0),
+            "checkpoint_every": config.get('trace_checkpoint_every', 256),
+        }
+        self.attributions = self.__set_attributions(config)
+        self.listeners.extend(self.attributions)
+        self.adaptive = None
+        if config.get('adaptive_sampling', False):
+            self.adaptive = AdaptiveInterval(
+                self.interval,
+                min_interval=config.get('adaptive_min_interval'),
+                max_interval=config.get('adaptive_max_interval'),
+                threshold=config.get('adaptive_threshold', 0.1),
+                window=config.get('adaptive_window', 8),
+                backoff=config.get('adaptive_backoff', 1.25),
+            )
+            self.listeners.append(self.adaptive)
+        self.sampler_stats = SamplerStats(config.get('sampler_stats_capacity', DEFAULT_CAPACITY))
+        self.sampler_stats_enabled = config.get('sampler_stats', True)
+        self.proc_root = config.get('proc_root') or rooted(PROC_ROOT, self.hardware_root)
+        self.proc_stat_readable = True
+        self.profile_options = {
+            "interval": config.get('profile_interval', 0.0),
+            "max_depth": config.get('profile_max_depth', 64),
+            "max_overhead": config.get('profile_max_overhead', 0.05),
+            "all_threads": config.get('profile_all_threads', False),
+        }
 
     def __set_power(self, power_devices):
         """
@@ -82,15 +168,15 @@ class PowerWrapper(PowerProfiler):
             raise ValueError("Please specify at least one device type to monitor in [cpu, gpu, ram] ")
 
         if "cpu" in power_devices:
-            cpu_brand = cpuinfo.get_cpu_info()['brand_raw']
+            cpu_brand = read_cpu_brand(self.hardware_root)
             if "Core(TM)" in cpu_brand:
                 self.intel = True
-                self.intel_power = PowerClientIntel()
+                self.intel_power = PowerClientIntel(self.hardware_root)
             elif "Xeon" in cpu_brand:
                 self.intel = True
-                self.intel_power = PowerServerIntel()
+                self.intel_power = PowerServerIntel(self.hardware_root)
             elif "AMD" in cpu_brand:
-                self.amd_power = PowerAmdCpu()
+                self.amd_power = PowerAmdCpu(self.interval)
                 self.amd = True
                 LOGGER.info("AMD found")
             else:
@@ -103,7 +189,7 @@ class PowerWrapper(PowerProfiler):
         if "gpu" in power_devices:
             try:
                 subprocess.check_output('nvidia-smi')
-                power_objects.append(PowerNvidia())
+                power_objects.append(PowerNvidia(visible_only=self.gpu_visible_only))
             except Exception:
                 pass
 
@@ -118,22 +204,153 @@ class PowerWrapper(PowerProfiler):
 
         return power_objects
 
-    def get_all_power(self, power_objects):
+    def __set_attributions(self, config):
+        """
+        Create the attribution listeners requested in the configuration file.
+
+        Parameters:
+        	config (dict): The configuration. Its "attribution" entry is a comma-separated list of modes among
+        	[process, cgroup, gpu], "attribution_pid" the process to charge (the current process by default), "cgroups"
+        	the cgroup v2 paths to charge, "cgroup_root" and "proc_root" the mount points of cgroupfs and procfs.
+
+        Returns:
+        	attributions (list): A list of attribution listeners.
+        """
+        modes = (config.get('attribution') or "").lower()
+        attributions = list()
+        if "process" in modes:
+            if self.intel:
+                attributions.append(ProcessCpuAttribution(self.samples, pid=config.get('attribution_pid')))
+            else:
+                LOGGER.warning("Process attribution requires the Intel RAPL energy counters, it is disabled")
+        if "cgroup" in modes:
+            if not self.intel:
+                LOGGER.warning("Cgroup attribution requires the Intel RAPL energy counters, it is disabled")
+            elif not config.get('cgroups'):
+                LOGGER.warning("Cgroup attribution requires a list of cgroups in the configuration, it is disabled")
+            else:
+                attributions.append(CgroupAttribution(
+                    self.samples, config['cgroups'],
+                    cgroup_root=config.get('cgroup_root') or rooted(CGROUP_ROOT, self.hardware_root),
+                    proc_root=config.get('proc_root') or rooted(PROC_ROOT, self.hardware_root),
+                ))
+        if "gpu" in modes:
+            gpus = [obj for obj in self.power_objects if isinstance(obj, PowerNvidia)]
+            if not gpus:
+                LOGGER.warning("GPU attribution requires Nvidia GPUs, it is disabled")
+            try:
+                for gpu in gpus:
+                    attributions.append(GpuProcessAttribution(self.samples, gpu, pid=config.get('attribution_pid')))
+            except ImportError as e:
+                LOGGER.warning("GPU attribution is disabled: %s", e)
+        return attributions
+
+    def get_all_power(self, power_objects, timestamp=None):
         """
         Get energy usage from all specified power monitoring instances at a specific sampling period.
 
         Parameters:
         	power_objects (list): List of power monitoring instances, respectivelly for each device in the devices list.
+        	timestamp (float): Time of the readings, now by default (a simulated time when replaying, see HardwareSimulator).
         """
-        energy_usage = {}
+        if timestamp is None:
+            timestamp = time.time()
         for obj in power_objects:
-            energy_usage.update(obj.append_energy_usage())
+            self.record_sample(timestamp, obj.append_energy_usage(), POWER, "ram" if isinstance(obj, PowerRam) else "gpu")
+
+    def get_intel_energy(self, timestamp=None):
+        """
+        Read the Intel RAPL energy counters. The counters may be read from several threads, so that the
+        timestamp is taken under the sample lock to keep the samples ordered.
+
+        Parameters:
+        	timestamp (float): Time of the readings, now by default (a simulated time when replaying).
+        """
+        with self.lock:
+            self.record_sample(time.time() if timestamp is None else timestamp,
+                               self.intel_power.append_energy_usage(), COUNTER, "cpu")
+
+    def record_sample(self, timestamp, values, kind, device):
+        """
+        Store the readings of one device and notify the listeners.
+
+        Parameters:
+            timestamp (float): Time of the readings in seconds since the epoch.
+            values (dict): Dictionary mapping sensor names to readings.
+            kind (str): POWER for readings in Watt, COUNTER for cumulative energy in Watt-hour.
+            device (str): Device type of the sensors (cpu, gpu, ram).
+        """
+        with self.lock:
+            self.sensor_devices.update(dict.fromkeys(values, device))
+            self.samples.append(timestamp, values, kind=kind, device=device)
+            for listener in self.listeners:
+                listener.on_sample(timestamp, values, kind, device)
+
+    def subscribe(self, callback=None, capacity=1024, policy="drop_oldest", batch_size=64, max_latency=0.5, devices=None):
+        """
+        Subscribe to the samples of the sampler, from now on and across its starts and stops, until `unsubscribe`.
+        The sampling thread never waits on a subscriber (see Subscription for the policies of a full queue).
+
+        Parameters:
+        	callback (callable): Function receiving every batch of samples (a list of Sample) on its own thread,
+        	    None to pull the batches with `Subscription.get` or by iterating on the subscription.
+        	capacity (int): Number of samples the queue of the subscriber holds.
+        	policy (str): Policy of a full queue among "drop_oldest", "block" and "coalesce".
+        	batch_size (int): Largest number of samples of a batch.
+        	max_latency (float): Longest time in seconds a batch waits to be filled.
+        	devices (list): Device types (cpu, gpu, ram) to receive, every device by default.
+        Returns:
+        	Subscription.
+        """
+        subscription = Subscription(capacity, policy, batch_size, max_latency, callback, devices)
+        with self.lock:
+            self.listeners.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription, drain=True, timeout=None):
+        """
+        End a subscription. Its queued samples are still delivered, unless `drain` is false.
+
+        Parameters:
+        	subscription (Subscription): Subscription returned by `subscribe`.
+        	drain (bool): Deliver the queued samples before ending the subscription.
+        	timeout (float): Longest time in seconds to wait for the callback of the subscription to end.
+        """
+        with self.lock:
+            if subscription in self.listeners:
+                self.listeners.remove(subscription)
+        subscription.close(drain, timeout)
 
-        self.power_draws.append(energy_usage)
+    def __open_trace(self):
+        """
+        Open the binary trace of this measurement, if a trace file is configured.
+        """
+        if not self.trace_file:
+            return
+        filepath = str(self.trace_file).format(
+            pid=os.getpid(),
+            rank=self.samples.rank,
+            datetime=datetime.datetime.now().strftime("%Y%m%d-%H%M%S"),
+        )
+        self.trace = TraceWriter(filepath, rank=self.samples.rank, **self.trace_options)
+        self.listeners.append(self.trace)
+
+    def __close_trace(self):
+        """
+        Close the binary trace of this measurement with a final checkpoint.
+        """
+        if self.trace is None:
+            return
+        self.listeners.remove(self.trace)
+        self.trace.close()
+        self.trace = None
 
     def get_power_consumption(self, power_objects):
         """
-        Continuously get energy usage from all specified power monitoring instances.
+        Continuously get energy usage from all specified power monitoring instances. Ticks are scheduled on fixed
+        deadlines, every `interval` seconds (or at the interval chosen by `adaptive` after each tick): a tick ending
+        after the deadline of the next one is a missed deadline, and the schedule restarts from it instead of catching
+        up with a burst of readings. The cost of every tick is recorded in `sampler_stats`, unless it is disabled.
 
         Parameters:
         	power_objects (list): List of power monitoring instances, respectivelly for each device in the devices list.
@@ -141,23 +358,52 @@ class PowerWrapper(PowerProfiler):
         if self.amd:
             self.amd_power.start()
 
-        if power_objects and self.intel:
+        spawning = [obj for obj in power_objects if isinstance(obj, SUBPROCESS_BACKENDS)]
+        direct = [obj for obj in power_objects if not isinstance(obj, SUBPROCESS_BACKENDS)]
+        if power_objects:
             self.get_all_power(power_objects)
-            while getattr(self.thread, "do_run", True):
-                self.get_all_power(power_objects)
-                self.intel_record.append(self.intel_power.append_energy_usage())
-                time.sleep(self.interval)
-            self.get_all_power(power_objects)
-        elif power_objects:
-            self.get_all_power(power_objects)
-            while getattr(self.thread, "do_run", True):
-                self.get_all_power(power_objects)
-                time.sleep(self.interval)
+        deadline = time.perf_counter()
+        measured = self.sampler_stats_enabled
+        while getattr(self.thread, "do_run", True):
+            started = time.perf_counter()
+            if measured:
+                timestamp, cpu = time.time(), time.thread_time()
+            if direct:
+                self.get_all_power(direct)
+            subprocess_time = children_cpu = 0.0
+            if spawning:
+                if measured:
+                    spawned, children_cpu = time.perf_counter(), children_cpu_time()
+                self.get_all_power(spawning)
+                if measured:
+                    subprocess_time = time.perf_counter() - spawned
+                    children_cpu = children_cpu_time() - children_cpu
+            if self.intel:
+                self.get_intel_energy()
+            ended = time.perf_counter()
+            interval = self.adaptive.next_interval() if self.adaptive is not None else self.interval
+            deadline += interval
+            missed = ended > deadline
+            if measured:
+                self.sampler_stats.tick(timestamp, ended - started, time.thread_time() - cpu, subprocess_time,
+                                        children_cpu, self.__node_busy_time(), missed, interval)
+            if missed:
+                deadline = ended
+            else:
+                time.sleep(deadline - ended)
+        if power_objects:
             self.get_all_power(power_objects)
-        elif self.intel:
-            while getattr(self.thread, "do_run", True):
-                self.intel_record.append(self.intel_power.append_energy_usage())
-                time.sleep(self.interval)
+
+    def __node_busy_time(self):
+        """
+        Read the busy CPU time of the node for the energy estimate of the sampler, NaN when /proc/stat is not readable.
+        """
+        if self.proc_stat_readable:
+            try:
+                return read_busy_time(self.proc_root)
+            except (OSError, ValueError):
+                self.proc_stat_readable = False
+        return float("nan")
 
     def start(self):
         """
@@ -180,9 +426,15 @@ class PowerWrapper(PowerProfiler):
         """
         LOGGER.info("Starting CPU power monitoring...")
         self.start_time = time.time()
-        self.power_draws = []
-        self.intel_record = []
         self.record = {}
+        self.samples.clear()
+        self.sampler_stats.reset()
+        if self.adaptive is not None:
+            self.adaptive.reset()
+        for attribution in self.attributions:
+            attribution.reset()
+        self.__close_trace()
+        self.__open_trace()
         if self.thread and self.thread.is_alive():
             self.stop_thread()
             self.thread.join()
@@ -190,7 +442,7 @@ class PowerWrapper(PowerProfiler):
         # self.thread.do_run = True
         self.thread.start()
 
-    def stop(self):
+    def stop(self, work=None, work_unit="item"):
         """
         Stop the power monitoring process and collect/aggregate the final power consumption data.
 
@@ -199,38 +451,223 @@ class PowerWrapper(PowerProfiler):
         power profiling subprocesses and releases any associated resources. Additionally, it collects and aggregates
         data from the different devices' profiling, allowing for further analysis or reporting.
 
+        Parameters:
+        	work (float): Units of work done during the measurement (samples, tokens, requests, FLOPs), for the efficiency metrics.
+        	work_unit (str): Name of the unit of work.
+
         Example:
             PowerWrapper wrapper = PowerWrapper()
             wrapper.stop()
 
         """
+        end_time = self.__stop_sampling()
+        self.record = self.__report(self.start_time, end_time, work, work_unit)
+
+    def __stop_sampling(self):
+        """
+        Stop the sampling thread, read the energy counters one last time and close the trace.
+
+        Returns:
+        	end_time (float): Time at which sampling stopped, in seconds since the epoch.
+        """
         if self.thread and self.thread.is_alive():
             # self.stop_thread()
             self.thread.do_run = False
             self.thread.join()
-        
+
         end_time = time.time()
 
-        usages = pd.DataFrame(self.power_draws)
-        cpu_energy = pd.DataFrame()
-        usages = usages.sum().to_frame().T
-        usages = usages * self.interval / 3600          # convert watt to watt-hour for RAM and GPU especially
+        if self.intel:
+            self.get_intel_energy()
+
+        self.__close_trace()
 
         if self.amd:
             self.amd_power.stop()
-            cpu_energy = self.amd_power.parse_log()
-            usages = pd.concat([cpu_energy, usages], axis=1)
+        return end_time
 
-        if self.intel:
-            self.intel_record.append(self.intel_power.append_energy_usage())
+    def __energy_usages(self, start, end):
+        """
+        Get the energy of every sensor over a time window.
+
+        Returns:
+        	DataFrame with one row of energies in Watt-hour, energy counters (RAPL) first, then integrated power readings (GPU, RAM).
+        """
+        energies = self.samples.energies(start, end)
+        return pd.DataFrame(
+            {sensor: energies[sensor] for kind in (COUNTER, POWER) for sensor in energies
+             if self.samples.kind(sensor) == kind},
+            index=[0],
+        )
+
+    def acquire(self):
+        """
+        Register a measured region on the shared sampler, starting the sampler for the first region.
+        The samples are kept until the last region is released, so regions opened concurrently by
+        several threads are measured on the same timeline.
+
+        Returns:
+        	True if the sampler was started by this call, False if it was already running.
+        """
+        with self.users_lock:
+            self.users += 1
+            if self.users > 1:
+                return False
+            self.start()
+            return True
+
+    def release(self, on_stopped=None):
+        """
+        Unregister a measured region, stopping the sampler when no region is left.
+
+        Parameters:
+        	on_stopped (callable): Called without arguments once the sampler is stopped by this call, before another
+        	    region can restart it and clear the samples (e.g. to export the samples of the whole measurement).
+        Returns:
+        	True if the sampler was stopped by this call, False if other regions still use it.
+        """
+        with self.users_lock:
+            if self.users == 0:
+                raise RuntimeError("PowerWrapper.release called more times than acquire")
+            self.users -= 1
+            if self.users > 0:
+                return False
+            self.__stop_sampling()
+            if on_stopped is not None:
+                on_stopped()
+            return True
+
+    def energy_report(self, start, end, work=None, work_unit="item"):
+        """
+        Build the report of a time window of the shared sampler, as recorded for a region.
+        Energy counters are read once more first, so that the window ends on a fresh reading.
+
+        Parameters:
+        	start (float): Start of the window in seconds since the epoch.
+        	end (float): End of the window in seconds since the epoch.
+        	work (float): Units of work done during the window, for the efficiency metrics.
+        	work_unit (str): Name of the unit of work.
+        Returns:
+        	DataFrame with one row of energies in the configured energy unit and the duration of the window.
+        """
+        if self.intel and getattr(self.thread, "do_run", True):
+            self.get_intel_energy()
+        return self.__report(start, end, work, work_unit)
+
+    def __report(self, start, end, work=None, work_unit="item"):
+        """
+        Build the report of a time window, shared by `stop` and `energy_report`: energy of every sensor (the AMD CPU
+        energy being read from the perf log over the window), attribution shares, baseline, efficiency metrics and
+        cost of the sampler.
 
-            cpu_energy = pd.DataFrame(self.intel_record)
-            cpu_energy = cpu_energy.diff().fillna(cpu_energy)
-            cpu_energy = cpu_energy.iloc[1:, :]
-            cpu_energy = cpu_energy.mask(cpu_energy.lt(0)).ffill().fillna(0)
-            cpu_energy = cpu_energy.sum().to_frame().T
+        Returns:
+        	DataFrame with one row of energies in the configured energy unit and the duration of the window.
+        """
+        usages = self.__energy_usages(start, end)
+
+        if self.amd:
+            cpu_energy = self.amd_power.parse_log(start, end)
+            self.sensor_devices.update(dict.fromkeys(cpu_energy.columns, "cpu"))
             usages = pd.concat([cpu_energy, usages], axis=1)
 
+        usages = self.convert_energy(usages)
+
+        for attribution in self.attributions:
+            for column, value in attribution.report(start, end).items():
+                usages[column] = value
+
+        usages[TOTAL_CPU_TIME] = end - start
+        return self.add_sampler_stats(self.efficiency(self.split_baseline(usages.round(5)), work, work_unit), start, end)
+
+    def efficiency(self, usages, work=None, work_unit="item"):
+        """
+        Add the efficiency metrics of every device (energy per unit of work, average power, EDP and ED2P) to a report,
+        when a work count is given or the "efficiency_metrics" configuration entry is set.
+
+        Parameters:
+        	usages (DataFrame): One-row report in the configured energy unit.
+        	work (float): Units of work done during the measurement (samples, tokens, requests, FLOPs).
+        	work_unit (str): Name of the unit of work.
+        Returns:
+        	The report, with the metric columns when enabled.
+        """
+        if work is None and not self.efficiency_metrics:
+            return usages
+        return add_efficiency(usages, self.sensor_devices, self.energy_unit, work, work_unit)
+
+    def add_sampler_stats(self, usages, start, end):
+        """
+        Add the cost of the sampler over a time window to a report, when it is measured (see the "sampler_stats"
+        configuration entry).
+
+        Parameters:
+        	usages (DataFrame): One-row report of the window.
+        	start (float): Start of the window in seconds since the epoch.
+        	end (float): End of the window in seconds since the epoch.
+        Returns:
+        	The report with the "Sampler ..." columns.
+        """
+        if not self.sampler_stats_enabled:
+            return usages
+        return add_sampler_stats(usages, self.sampler_stats, self.sensor_devices, self.energy_unit, start, end)
+
+    def calibrate(self, duration=None, save=True):
+        """
+        Measure the idle power of every sensor over a quiet window, and use it as the baseline of the next reports.
+        Nothing else should run on the host during the calibration.
+
+        Parameters:
+        	duration (float): Length of the quiet window in seconds, the "baseline_duration" configuration entry by default.
+        	save (bool): Store the baseline in the per-host cache.
+        Returns:
+        	Baseline.
+        """
+        self.baseline = calibrate(self, duration or self.baseline_duration, dmi_root=self.dmi_root)
+        if save:
+            self.baseline_cache.put(hardware_inventory(self), self.baseline)
+        return self.baseline
+
+    def load_baseline(self):
+        """
+        Get the cached baseline of the host. A baseline measured before a change of kernel, BIOS or microcode
+        (or older than "baseline_max_age_days") is stale and is not used.
+
+        Returns:
+        	Baseline, None if the host has no up-to-date baseline.
+        """
+        baseline = self.baseline_cache.get(hardware_inventory(self))
+        if baseline is None:
+            LOGGER.warning("No idle baseline cached for this host in %s, run `python -m ea2p.src.calibration` on a quiet node",
+                           self.baseline_cache.filepath)
+            return None
+        reasons = baseline.stale_reasons(firmware_versions(self.dmi_root, self.hardware_root), self.baseline_max_age_days)
+        if reasons:
+            LOGGER.warning("The idle baseline of this host is stale (%s), calibrate it again", "; ".join(reasons))
+            return None
+        return baseline
+
+    def split_baseline(self, usages):
+        """
+        Add the baseline (idle) and dynamic energy of every calibrated sensor to a report, when a baseline is loaded.
+
+        Parameters:
+        	usages (DataFrame): One-row report in the configured energy unit.
+        Returns:
+        	The report, with the "<sensor> (baseline)" and "<sensor> (dynamic)" columns when a baseline is loaded.
+        """
+        if self.baseline is None:
+            return usages
+        return self.baseline.split(usages, self.energy_unit)
+
+    def convert_energy(self, usages):
+        """
+        Convert energies from Watt-hour to the energy unit of the configuration file.
+
+        Parameters:
+        	usages (DataFrame or float): Energies in Watt-hour.
+        Returns:
+        	Energies in the configured energy unit.
+        """
         if self.energy_unit=="j":
             usages = usages * WH_TO_JOULE
         elif self.energy_unit=="wh":
@@ -241,7 +678,32 @@ class PowerWrapper(PowerProfiler):
             LOGGER.info("WARRNING : The specified energy unit is not supported. "
                         "Please try to specify J or WH or KWH in the energy config file. "
                         "Otherwise, the default unit of WH is used")
+        return usages
 
+    def energy_between(self, start, end):
+        """
+        Get the energy of every sensor sampled since the last start over a time window, in O(log n) per sensor.
 
-        usages[TOTAL_CPU_TIME] = end_time - self.start_time
-        self.record = usages.round(5)
+        Parameters:
+        	start (float): Start of the window in seconds since the epoch.
+        	end (float): End of the window in seconds since the epoch.
+        Returns:
+        	DataFrame with one row of energies in the configured energy unit.
+        """
+        usages = pd.DataFrame(self.samples.energies(start, end), index=[0])
+        return self.convert_energy(usages).round(5)
+
+    def energy_windows(self, starts, ends):
+        """
+        Get the energy of every sensor over many time windows at once (e.g. per step or per request).
+
+        Parameters:
+        	starts (array): Start of each window in seconds since the epoch.
+        	ends (array): End of each window in seconds since the epoch.
+        Returns:
+        	DataFrame with one row of energies per window in the configured energy unit.
+        """
+        usages = pd.DataFrame({
+            sensor: self.samples.batch_energy(sensor, starts, ends) for sensor in self.samples.sensors()
+        })
+        return self.convert_energy(usages).round(5)
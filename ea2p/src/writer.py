@@ -0,0 +1,300 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Background writers for the energy reports produced by PowerMeter and PowerMeterMPI.
+"""
+__all__ = ["ResultWriter", "CsvSink", "get_result_writer"]
+
+import atexit
+import csv
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import traceback
+from pathlib import Path
+
+LOGGER = logging.getLogger(__name__)
+
+_WRITERS = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+class CsvSink:
+    """
+    CsvSink
+    ---------
+
+    Append rows to a CSV file while keeping a single, unified column schema.
+    When a row brings a column unknown to the file (e.g. a GPU present on one host only), the file is
+    rewritten once with the widened header so that every line stays aligned with its header.
+
+    Attributes:
+        filepath (Path): Path to the CSV report.
+        columns (list): Ordered list of the columns currently in the file header.
+    """
+
+    def __init__(self, filepath):
+        """
+        Initialize the CsvSink instance.
+
+        Parameters:
+            filepath (str): Path to the CSV report. It is created on the first write if it does not exist.
+        """
+        self.filepath = Path(filepath)
+        self.columns = self.__read_header()
+
+    def __read_header(self):
+        """
+        Read the header of an existing report.
+
+        Returns:
+            List of column names, empty if the file does not exist yet.
+        """
+        if not self.filepath.exists() or self.filepath.stat().st_size == 0:
+            return []
+        with open(self.filepath, "r", newline="") as fp:
+            return next(csv.reader(fp), [])
+
+    def __widen(self, columns):
+        """
+        Rewrite the report with a widened header. Existing lines get empty values for the new columns.
+
+        Parameters:
+            columns (list): The complete list of columns of the new header.
+        """
+        tmp_filepath = self.filepath.with_name(self.filepath.name + ".tmp")
+        with open(self.filepath, "r", newline="") as src, open(tmp_filepath, "w", newline="") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            next(reader, None)
+            writer.writerow(columns)
+            padding = [""] * (len(columns) - len(self.columns))
+            for line in reader:
+                writer.writerow(line + padding)
+        os.replace(tmp_filepath, self.filepath)
+        LOGGER.info("Report %s widened with columns %s", self.filepath, columns[len(self.columns):])
+
+    @staticmethod
+    def __format(value):
+        """
+        Format a value the way pandas would write it in a CSV file (missing values are left empty).
+        """
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ""
+        return value
+
+    def write(self, rows):
+        """
+        Append rows to the report, widening the header first if some rows carry new columns.
+
+        Parameters:
+            rows (list): List of dictionaries mapping column names to values.
+        """
+        columns = list(self.columns)
+        for row in rows:
+            columns.extend(key for key in row if key not in columns)
+
+        if not self.columns:
+            mode = "w"
+        elif len(columns) > len(self.columns):
+            self.__widen(columns)
+            mode = "a"
+        else:
+            mode = "a"
+
+        with open(self.filepath, mode, newline="") as fp:
+            writer = csv.writer(fp)
+            if mode == "w":
+                writer.writerow(columns)
+            for row in rows:
+                writer.writerow([self.__format(row.get(column)) for column in columns])
+        self.columns = columns
+
+    def close(self):
+        """
+        Nothing to release, the file is opened for every batch.
+        """
+
+
+class ResultWriter:
+    """
+    ResultWriter
+    ---------
+
+    Write energy reports from a background thread so that measurements never wait on the disk.
+
+    Rows are pushed in a bounded queue and written to the sink in batches. A batch is flushed as soon as
+    `batch_size` rows are pending, when `flush_interval` seconds elapsed since the last write, on an explicit
+    `flush()` call and at interpreter exit. Reports to show in the terminal (see `echo`) are formatted and printed
+    by the same thread, in the order they were queued.
+
+    Attributes:
+        sink: Object exposing `write(rows)` and `close()` methods (e.g. CsvSink).
+        batch_size (int): Number of pending rows triggering a write.
+        flush_interval (float): Maximum time in seconds a row waits in the queue.
+    """
+
+    _FLUSH = object()
+    _CLOSE = object()
+    _PRINT = object()
+
+    def __init__(self, sink, max_queue=1024, batch_size=64, flush_interval=1.0):
+        """
+        Initialize the ResultWriter instance and start its background thread.
+
+        Parameters:
+            sink: Object exposing `write(rows)` and `close()` methods.
+            max_queue (int): Maximum number of reports waiting in the queue. `submit` blocks when it is full.
+            batch_size (int): Number of pending rows triggering a write.
+            flush_interval (float): Maximum time in seconds a row waits before being written.
+        """
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        self.thread = threading.Thread(target=self.__run, name="ea2p-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, data):
+        """
+        Queue a report to be written.
+
+        Parameters:
+            data (DataFrame or list): Report rows as a DataFrame or as a list of dictionaries.
+        Returns:
+            True if the report was queued, False if the writer is closed.
+        """
+        if self.closed:
+            return False
+        rows = data.to_dict("records") if hasattr(data, "to_dict") else list(data)
+        self.queue.put(rows)
+        return True
+
+    def echo(self, title, data):
+        """
+        Queue a report to be printed in the terminal, so that formatting it does not delay the caller.
+        It is printed right away when the writer is closed.
+
+        Parameters:
+            title (str): Line printed before the report.
+            data: Report to print, usually a DataFrame. It should not be modified once queued.
+        """
+        if self.closed:
+            self.__print(title, data)
+            return
+        self.queue.put((self._PRINT, (title, data)))
+
+    @staticmethod
+    def __print(title, data):
+        try:
+            print(title)
+            print(data)
+        except Exception as e:
+            LOGGER.error("Error while printing a report: %s", str(e))
+
+    def flush(self, timeout=None):
+        """
+        Block until every report submitted so far is written.
+
+        Parameters:
+            timeout (float): Maximum time in seconds to wait, None to wait forever.
+        Returns:
+            True if the queue was flushed in time, False otherwise.
+        """
+        if self.closed:
+            return True
+        done = threading.Event()
+        self.queue.put((self._FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        """
+        Flush the pending reports and stop the background thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put((self._CLOSE, None))
+        self.thread.join()
+        self.sink.close()
+
+    def __write(self, batch):
+        """
+        Write a batch to the sink, logging errors instead of raising them in the background thread.
+        """
+        if not batch:
+            return
+        try:
+            self.sink.write(batch)
+        except Exception as e:
+            LOGGER.error("Error during the report writing process: %s", str(e))
+            LOGGER.error(traceback.format_exc())
+        batch.clear()
+
+    def __run(self):
+        """
+        Background loop gathering queued rows in batches and writing them to the sink.
+        """
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.__write(batch)
+                deadline = None
+                continue
+
+            if isinstance(item, tuple) and item[0] is self._FLUSH:
+                self.__write(batch)
+                deadline = None
+                item[1].set()
+            elif isinstance(item, tuple) and item[0] is self._PRINT:
+                self.__print(*item[1])
+            elif isinstance(item, tuple) and item[0] is self._CLOSE:
+                self.__write(batch)
+                return
+            else:
+                batch.extend(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) >= self.batch_size:
+                    self.__write(batch)
+                    deadline = None
+
+
+def get_result_writer(output_filepath, output_format="csv"):
+    """
+    Get the writer attached to a report file, creating it on first use.
+    Instances measuring into the same file share one writer so that their rows never interleave.
+
+    Parameters:
+        output_filepath (str): Path to the report file.
+        output_format (str): Format of the report, "csv" or "sqlite". Other formats fall back to csv.
+    Returns:
+        ResultWriter instance for this file.
+    """
+    output_format = output_format.lower()
+    if output_format not in ("csv", "sqlite"):
+        LOGGER.warning("Unsupported output format %s, the report is written in csv (supported formats: csv, sqlite)",
+                       output_format)
+        output_format = "csv"
+
+    key = Path(output_filepath).resolve()
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(key)
+        if writer is None or writer.closed:
+            if output_format == "sqlite":
+                from .sqlite_store import SQLiteResultStore
+                sink = SQLiteResultStore(key)
+            else:
+                sink = CsvSink(key)
+            writer = ResultWriter(sink)
+            _WRITERS[key] = writer
+    return writer
@@ -11,7 +11,7 @@ from tensorflow.keras.applications import VGG16
 #tf.config.threading.set_inter_op_parallelism_threads(16)
 print("Num GPUs Available: ", len(tf.config.list_physical_devices('GPU')))
 
-from ea2p import PowerMeter #Our package
+from ea2p import PowerMeter, keras_callback #Our package
 power_meter = PowerMeter(project_name="test")
 
 IMG_SIZE = 32
@@ -68,13 +68,18 @@ def build_model(num_classes):
 
 model = build_model(num_classes=NUM_CLASSES)
 
-@power_meter.measure_power(
-    package="tensorflow",
-    algorithm="VGG16",
-    algorithm_params="batch_size=" + str(batch_size) + "epochs=" + str(epochs) + "IMG_SIZE=" + str(IMG_SIZE)
-)
 def train_model():
-    model.fit(ds_train, epochs=epochs, batch_size=batch_size, validation_data=ds_test)
+    # one continuous measurement of fit(), with the energy of every epoch and of every 100 batches
+    energy = keras_callback(
+        power_meter,
+        package="tensorflow",
+        algorithm="VGG16",
+        algorithm_description="batch_size=" + str(batch_size) + "epochs=" + str(epochs) + "IMG_SIZE=" + str(IMG_SIZE),
+        every_n_batches=100,
+        batch_size=batch_size,
+    )
+    model.fit(ds_train, epochs=epochs, batch_size=batch_size, validation_data=ds_test, callbacks=[energy])
+    print(energy.tracker.report("epoch"))
 
 if __name__ == '__main__':
     train_model()
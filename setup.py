@@ -4,6 +4,9 @@ setup(
     name='EA2P',
     version='1.0.1',
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['ea2p=ea2p.src.cli:main'],
+    },
     install_requires=[
         'numpy',
         'pandas',